@@ -0,0 +1,94 @@
+"""
+Compares the cost of serving requests with and without the connection pool.
+
+Every simulated request opens a database connection, runs a query and closes
+the connection, the same way Django handles a request with CONN_MAX_AGE = 0.
+
+Usage (in the folder of manage.py):
+    python -m benchmarks.connection_pool [--requests 500] [--threads 8]
+"""
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "registrationapp.settings")
+django.setup()
+
+from django.db import connections  # noqa: E402
+from registrationapp.pooled_postgresql.base import (  # noqa: E402
+    DatabaseWrapper,
+    get_pool_stats,
+)
+
+
+def simulate_request(settings_dict, alias):
+    """Opens a connection, runs one query and closes it like a request would."""
+    connection = DatabaseWrapper(settings_dict, alias=alias)
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    finally:
+        connection.close()
+    return time.perf_counter() - start
+
+
+def run(name, settings_dict, alias, requests, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        start = time.perf_counter()
+        durations = list(
+            executor.map(
+                lambda _: simulate_request(settings_dict, alias), range(requests)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    durations.sort()
+    print(
+        f"{name:>10}: {requests / elapsed:8.1f} req/s, "
+        f"mean {statistics.mean(durations) * 1000:7.2f} ms, "
+        f"p50 {durations[len(durations) // 2] * 1000:7.2f} ms, "
+        f"p99 {durations[int(len(durations) * 0.99)] * 1000:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    base_settings = connections.settings["default"]
+    pool_options = base_settings["OPTIONS"].get("pool") or {}
+    if pool_options is True:
+        pool_options = {}
+    pooled_settings = {
+        **base_settings,
+        "OPTIONS": {
+            **base_settings["OPTIONS"],
+            "pool": {"max_size": args.threads, **pool_options},
+        },
+    }
+    unpooled_settings = {
+        **base_settings,
+        "OPTIONS": {**base_settings["OPTIONS"], "pool": False},
+    }
+
+    print(f"{args.requests} requests with {args.threads} threads")
+    run("no pool", unpooled_settings, "benchmark_no_pool", args.requests, args.threads)
+    run("pool", pooled_settings, "benchmark_pool", args.requests, args.threads)
+    stats = get_pool_stats()["benchmark_pool"]
+    print(
+        f"pool: {stats['connections_num']} connections opened, "
+        f"{stats.get('requests_queued', 0)} checkouts waited, "
+        f"{stats['requests_wait_ms_avg']:.2f} ms average wait"
+    )
+
+
+if __name__ == "__main__":
+    main()
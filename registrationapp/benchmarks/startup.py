@@ -0,0 +1,109 @@
+"""
+Measures the startup time of a worker process and the latency of the first
+requests, with and without the warm-up of main_site/warmup.py.
+
+Every run starts a fresh Python process, which imports the WSGI application
+like a server worker does, runs the warm-up like the post_worker_init hook
+of gunicorn.conf.py does, and then serves the first GET request of every
+page once. The time to the first response is measured from the start of
+the import.
+
+Usage (in the folder of manage.py):
+    python -m benchmarks.startup [--runs 5]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from wsgiref.util import setup_testing_defaults
+
+PATHS = ["/", "/login/", "/register-visitor/", "/register-client/"]
+
+
+def measure(with_warm_up):
+    """Runs in the child process. Prints the timings in milliseconds as JSON."""
+    start = time.perf_counter()
+    from registrationapp.wsgi import application
+
+    if with_warm_up:
+        from main_site.warmup import warm_up
+
+        warm_up()
+    imported = time.perf_counter()
+    from django.test.utils import setup_test_environment
+
+    # allows the "testserver" host
+    setup_test_environment()
+    first_responses = {}
+    for path in PATHS:
+        environ = {"PATH_INFO": path, "HTTP_HOST": "testserver"}
+        setup_testing_defaults(environ)
+        request_start = time.perf_counter()
+        response = application(environ, lambda status, headers: None)
+        b"".join(response)
+        response.close()
+        first_responses[path] = (time.perf_counter() - request_start) * 1000
+    print(
+        json.dumps(
+            {
+                "import": (imported - start) * 1000,
+                "first_responses": first_responses,
+                "time_to_first_response": (imported - start) * 1000
+                + first_responses[PATHS[0]],
+                "time_to_all_pages": (time.perf_counter() - start) * 1000,
+            }
+        )
+    )
+
+
+def run(name, warm_up, runs):
+    args = [sys.executable, "-m", "benchmarks.startup", "--measure"]
+    if warm_up:
+        args.append("--warm-up")
+    results = [
+        json.loads(
+            subprocess.run(
+                args,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        )
+        for _ in range(runs)
+    ]
+
+    def mean(key, path=None):
+        values = [
+            result[key][path] if path else result[key] for result in results
+        ]
+        return statistics.mean(values)
+
+    print(
+        f"{name:>12}: import {mean('import'):7.1f} ms, "
+        f"time to first response {mean('time_to_first_response'):7.1f} ms, "
+        f"time to all pages {mean('time_to_all_pages'):7.1f} ms"
+    )
+    for path in PATHS:
+        print(f"{'':>14}first {path:<20} {mean('first_responses', path):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warm-up", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.warm_up)
+        return
+
+    print(f"mean of {args.runs} worker starts")
+    run("no warm-up", False, args.runs)
+    run("warm-up", True, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration, read from the folder of manage.py by default.
+"""
+
+
+def post_worker_init(worker):
+    """
+    Warms up every worker after it has loaded the application and before it
+    accepts requests. It runs after the fork, so the database connections
+    belong to the worker even if the application is preloaded.
+    """
+    from main_site.warmup import warm_up
+
+    warm_up()
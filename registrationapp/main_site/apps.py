@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MainSiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_site'
+
+    def ready(self):
+        # connects the signal receivers
+        from . import backends  # noqa: F401
@@ -0,0 +1,146 @@
+import time
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import ReviewNotes, User, UserData
+
+
+def get_user_version_key(user_id):
+    return f"auth_user_version:{user_id}"
+
+
+def get_user_cache_key(user_id):
+    """
+    Returns the cache key of the current version of the user. Forgetting the
+    user increases the version, so a request which loaded the user before
+    the change was committed caches it under the old, unused key.
+    """
+    version_key = get_user_version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        # a new version, if the key was evicted, never used before
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    return f"auth_user:{user_id}:{version}"
+
+
+def forget_cached_users(user_ids):
+    """Invalidates the cached versions of the users when the transaction commits."""
+    if settings.AUTH_USER_CACHE_SECONDS:
+        transaction.on_commit(lambda: _increase_versions(user_ids))
+
+
+def _increase_versions(user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(get_user_version_key(user_id))
+        except ValueError:
+            # without a version, the next request creates a new one
+            pass
+
+
+# the relations loaded with the user, and cached with it
+USER_RELATIONS = {
+    "userdata": {"country_of_origin": {}},
+    "archiveduserdata": {"country_of_origin": {}},
+    "review_notes": {},
+}
+# the fields not stored in the cache
+SECRET_FIELDS = {"password"}
+
+
+def user_to_cache(instance, relations=USER_RELATIONS):
+    """
+    Returns the field values of the user and its loaded relations for the
+    cache, without the password hash. The session auth hash derived from it
+    is stored instead, so the session of the user can be verified.
+    """
+    values = {
+        "fields": {
+            field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields
+            if field.attname not in SECRET_FIELDS
+        },
+        "related": {},
+    }
+    for name, nested in relations.items():
+        field = instance._meta.get_field(name)
+        if field.is_cached(instance):
+            related = field.get_cached_value(instance)
+            values["related"][name] = (
+                None if related is None else user_to_cache(related, nested)
+            )
+    if isinstance(instance, User):
+        values["db"] = instance._state.db
+        values["session_auth_hash"] = instance.get_session_auth_hash()
+    return values
+
+
+def user_from_cache(values, model=User, db=None):
+    """
+    Creates the user and its relations from the values of user_to_cache().
+    The password is a deferred field, which is loaded when it is accessed,
+    and it is not overwritten when the user is saved.
+    """
+    db = values.get("db", db)
+    fields = values["fields"]
+    instance = model.from_db(db, list(fields), list(fields.values()))
+    for name, related_values in values["related"].items():
+        field = model._meta.get_field(name)
+        related = None
+        if related_values is not None:
+            related = user_from_cache(related_values, field.related_model, db)
+            if field.auto_created:
+                # the reverse side of a one-to-one relation
+                field.field.set_cached_value(related, instance)
+        field.set_cached_value(instance, related)
+    if "session_auth_hash" in values:
+        instance.cached_session_auth_hash = values["session_auth_hash"]
+    return instance
+
+
+class UserBackend(ModelBackend):
+    """
+    Loads the logged in user together with its registration data and review
+    notes in one joined query, so request.user.userdata and
+    get_user_data() do not query the database again during the request.
+    With AUTH_USER_CACHE_SECONDS, the user is also cached between requests,
+    without its password hash.
+    """
+
+    def get_user(self, user_id):
+        user = None
+        if settings.AUTH_USER_CACHE_SECONDS:
+            # the version is read before the user is loaded
+            cache_key = get_user_cache_key(user_id)
+            values = cache.get(cache_key)
+            if values is not None:
+                user = user_from_cache(values)
+        if user is None:
+            try:
+                user = User._default_manager.select_related(
+                    "userdata__country_of_origin",
+                    "archiveduserdata__country_of_origin",
+                    "review_notes",
+                ).get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            if settings.AUTH_USER_CACHE_SECONDS:
+                cache.set(
+                    cache_key, user_to_cache(user), settings.AUTH_USER_CACHE_SECONDS
+                )
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserData)
+@receiver(post_save, sender=ReviewNotes)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=UserData)
+@receiver(post_delete, sender=ReviewNotes)
+def forget_changed_user(sender, instance, **kwargs):
+    # all three are keyed by the user id
+    forget_cached_users([instance.pk])
@@ -0,0 +1,52 @@
+from asgiref.local import Local
+from django.conf import settings
+
+# Routing state of the request handled by the current thread or coroutine.
+# It is set by main_site.middleware.ReplicaRoutingMiddleware.
+_state = Local()
+
+# Sessions are always read from and written to the primary database,
+# so they do not count as a write that requires pinning.
+PRIMARY_ONLY_APPS = {"sessions"}
+
+
+def reset_request_state():
+    _state.use_replica = False
+    _state.wrote_primary = False
+
+
+def use_replica_for_reads():
+    """Sends the reads of the current request to the replica database."""
+    _state.use_replica = True
+
+
+def has_written_primary():
+    """Returns whether the current request has written to the primary database."""
+    return getattr(_state, "wrote_primary", False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends all writes to the primary database. Reads go to the replica
+    database only in requests that enabled it with use_replica_for_reads(),
+    and only until the request writes something.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            getattr(_state, "use_replica", False)
+            and not getattr(_state, "wrote_primary", False)
+            and model._meta.app_label not in PRIMARY_ONLY_APPS
+            and settings.REPLICA_DATABASE_ALIAS in settings.DATABASES
+        ):
+            return settings.REPLICA_DATABASE_ALIAS
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in PRIMARY_ONLY_APPS:
+            _state.wrote_primary = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same data as the primary
+        return True
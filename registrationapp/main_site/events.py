@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+import json
+import logging
+import psycopg
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from .models import UserData
+
+logger = logging.getLogger()
+
+# the PostgreSQL NOTIFY channel of the registration events
+CHANNEL = "main_site_registration_events"
+# notified by the change sequence triggers when changes are committed
+CHANGES_CHANNEL = "main_site_registration_changes"
+CHANNELS = (CHANNEL, CHANGES_CHANNEL)
+
+
+def publish_registration_change(user_data: UserData):
+    """
+    Notifies the event listeners of all workers about a new or changed
+    registration. PostgreSQL delivers the notification when the current
+    transaction commits.
+    """
+    payload = {
+        "user_id": user_data.pk,
+        "registration_type": user_data.registration_type,
+        "registration_state": user_data.registration_state,
+        "registration_state_label": user_data.registration_state_as_enum.label,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(payload)])
+
+
+def get_listener_connection_params():
+    params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+    # the cursor classes and adapters of Django are for synchronous connections
+    params.pop("cursor_factory", None)
+    params.pop("context", None)
+    return params
+
+
+class Broadcaster:
+    """
+    Fans the notifications of CHANNELS out to the subscribed clients of this
+    process. They are received on one LISTEN connection per process, no
+    matter how many clients are subscribed.
+    """
+
+    QUEUE_SIZE = 100
+    CONNECT_TIMEOUT = 5
+    RECONNECT_SECONDS = 5
+
+    def __init__(self):
+        self.subscribers: dict[str, set[asyncio.Queue]] = {
+            channel: set() for channel in CHANNELS
+        }
+        self.listener: asyncio.Task | None = None
+        self.listening: asyncio.Event | None = None
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channel: str = CHANNEL):
+        """Yields a queue which receives the events while subscribed."""
+        if (
+            self.listener is None
+            or self.listener.done()
+            # e.g. the event loop of a previous test
+            or self.listener.get_loop() is not asyncio.get_running_loop()
+        ):
+            self.listening = asyncio.Event()
+            self.listener = asyncio.create_task(self.listen(self.listening))
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.subscribers[channel].add(queue)
+        try:
+            # so the events right after subscribing are not missed
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.listening.wait(), self.CONNECT_TIMEOUT)
+            yield queue
+        finally:
+            self.subscribers[channel].discard(queue)
+
+    def publish(self, channel: str, event: dict):
+        for queue in self.subscribers[channel]:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # a client not reading its events misses the new ones
+                pass
+
+    async def listen(self, listening: asyncio.Event):
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    **get_listener_connection_params(), autocommit=True
+                ) as listener_connection:
+                    for channel in CHANNELS:
+                        await listener_connection.execute(f"LISTEN {channel}")
+                    listening.set()
+                    async for notify in listener_connection.notifies():
+                        self.publish(notify.channel, json.loads(notify.payload))
+            except psycopg.Error as e:
+                listening.clear()
+                logger.error(f"Error in the registration event listener: {e}")
+                await asyncio.sleep(self.RECONNECT_SECONDS)
+
+
+broadcaster = Broadcaster()
@@ -1,8 +1,23 @@
 from django import forms
-from .models import UserData, RegistrationType, UserType
+from django.contrib.auth import password_validation
+from django.core.exceptions import ValidationError
+from .models import (
+    UNKNOWN_COUNTRY_CODE,
+    Country,
+    RegistrationType,
+    ReviewNotes,
+    User,
+    UserData,
+    UserType,
+)
 from django.contrib.auth.forms import UserCreationForm
 
 
+def get_selectable_countries():
+    """The countries in the choice fields, ordered by the name index."""
+    return Country.objects.exclude(code=UNKNOWN_COUNTRY_CODE)
+
+
 class VisitorRegistrationForm(UserCreationForm, forms.ModelForm):
     class Meta:
         model = UserData
@@ -22,6 +37,7 @@ class ClientRegistrationForm(UserCreationForm, forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields["company"].required = True
         self.fields["country_of_origin"].required = True
+        self.fields["country_of_origin"].queryset = get_selectable_countries()
 
     class Meta:
         model = UserData
@@ -57,6 +73,7 @@ class ClientProfileEditForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields["company"].required = True
         self.fields["country_of_origin"].required = True
+        self.fields["country_of_origin"].queryset = get_selectable_countries()
 
     class Meta:
         model = UserData
@@ -73,7 +90,7 @@ class VisitorEditForm(forms.ModelForm):
     """This is the form for admins."""
 
     class Meta:
-        model = UserData
+        model = ReviewNotes
         fields = [
             "orcid_id_comment",
             "name_comment",
@@ -92,7 +109,7 @@ class ClientEditForm(forms.ModelForm):
     """This is the form for admins."""
 
     class Meta:
-        model = UserData
+        model = ReviewNotes
         fields = [
             "name_comment",
             "email_comment",
@@ -107,3 +124,43 @@ class ClientEditForm(forms.ModelForm):
             "company_comment": forms.Textarea(attrs={"rows": 2}),
             "country_of_origin_comment": forms.Textarea(attrs={"rows": 2}),
         }
+
+
+def validate_registration_field(form_class, field_name: str, data):
+    """
+    Validates a single field of a registration form, without running the
+    validation of the whole form. Returns the list of error messages.
+    Registered emails are found on the unique email index; the endpoint is
+    rate limited, which limits the enumeration of the registered emails.
+    """
+    form = form_class(data)
+    if field_name not in form.fields:
+        raise KeyError(field_name)
+    field = form.fields[field_name]
+    value = field.widget.value_from_datadict(
+        form.data, form.files, form.add_prefix(field_name)
+    )
+    try:
+        value = field.clean(value)
+        if (
+            field_name == "email"
+            and User.objects.filter(
+                email=User.objects.normalize_email(value)
+            ).exists()
+        ):
+            raise ValidationError(
+                User._meta.get_field("email").error_messages["unique"]
+            )
+        if field_name == "password1":
+            # the similarity validator compares the password to these fields
+            user = UserData(
+                email=data.get("email", ""),
+                name=data.get("name", ""),
+                phone_number=data.get("phone_number", ""),
+            )
+            password_validation.validate_password(value, user)
+        if field_name == "password2" and value != data.get("password1"):
+            raise ValidationError(form.error_messages["password_mismatch"])
+    except ValidationError as e:
+        return e.messages
+    return []
@@ -1,7 +1,13 @@
-from django.core.mail import send_mail
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.template.loader import render_to_string
+from django.utils import timezone
 import logging
-from .models import UserData
+from .metrics import EMAILS_COALESCED, EMAILS_FAILED, EMAILS_SENT
+from .models import NotificationType, PendingNotification, User, UserData
 
 logger = logging.getLogger()
 
@@ -15,12 +21,15 @@ def send_noncritical_mail(*args, **kwargs):
     try:
         send_mail(*args, **kwargs)
     except OSError as e:
+        EMAILS_FAILED.inc()
         logger.error(f"Error during sending email: {e}")
+    else:
+        EMAILS_SENT.inc()
 
 
-def send_registration_state_change_email(user: UserData):
-    context = {"user_data": user}
-    send_noncritical_mail(
+def registration_state_change_email(user: UserData) -> EmailMessage:
+    context = {"user_data": user, "review_notes": user.get_review_notes()}
+    return EmailMessage(
         render_to_string(
             "main_site/email/user_registration_state_changed.subject.txt",
             context,
@@ -29,13 +38,56 @@ def send_registration_state_change_email(user: UserData):
             "main_site/email/user_registration_state_changed.txt",
             context,
         ),
-        from_email=None,
-        recipient_list=[user.email],
+        to=[user.email],
     )
 
 
+def send_registration_state_change_email(user: UserData):
+    message = registration_state_change_email(user)
+    send_noncritical_mail(
+        message.subject, message.body, from_email=None, recipient_list=message.to
+    )
+
+
+# The emails of the pending notifications by type, sent by the
+# send_pending_notifications command
+NOTIFICATION_EMAILS = {
+    NotificationType.REGISTRATION_STATE_CHANGED: registration_state_change_email,
+}
+
+
+def queue_registration_state_change_email(user: UserData):
+    """
+    Sends the state change email at the end of the coalescing window, so
+    successive changes (e.g. two edits in a minute) result in one email
+    with the final state.
+    """
+    if settings.NOTIFICATION_COALESCE_SECONDS == 0:
+        send_registration_state_change_email(user)
+        return
+    pending = PendingNotification.objects.filter(
+        user_id=user.pk,
+        notification_type=NotificationType.REGISTRATION_STATE_CHANGED,
+    )
+    # the window starts at the first change, later changes do not extend it
+    if not pending.update(version=F("version") + 1):
+        try:
+            with transaction.atomic():
+                PendingNotification.objects.create(
+                    user_id=user.pk,
+                    notification_type=NotificationType.REGISTRATION_STATE_CHANGED,
+                    due_at=timezone.now()
+                    + timedelta(seconds=settings.NOTIFICATION_COALESCE_SECONDS),
+                )
+            return
+        except IntegrityError:
+            # queued concurrently
+            pending.update(version=F("version") + 1)
+    EMAILS_COALESCED.inc()
+
+
 def send_registration_initiated_email(user: UserData):
-    context = {"user_data": user}
+    context = {"user_data": user, "review_notes": user.get_review_notes()}
     send_noncritical_mail(
         render_to_string(
             "main_site/email/user_registration_initiated.subject.txt",
@@ -48,3 +100,35 @@ def send_registration_initiated_email(user: UserData):
         from_email=None,
         recipient_list=[user.email],
     )
+
+
+def send_admin_digest_emails(admins: list[User], registrations: list[UserData]):
+    """
+    Sends a summary of the given pending registrations to every admin.
+    All emails are sent over one SMTP connection. Errors are raised,
+    so the caller can retry the whole digest.
+    """
+    messages = []
+    for admin in admins:
+        context = {
+            "admin": admin,
+            "registrations": registrations,
+            "site_url": settings.SITE_URL,
+        }
+        messages.append(
+            EmailMessage(
+                render_to_string(
+                    "main_site/email/admin_pending_digest.subject.txt", context
+                ),
+                render_to_string("main_site/email/admin_pending_digest.txt", context),
+                to=[admin.email],
+            )
+        )
+    try:
+        with get_connection() as connection:
+            sent = connection.send_messages(messages)
+    except OSError:
+        EMAILS_FAILED.inc(len(messages))
+        raise
+    EMAILS_SENT.inc(sent or 0)
+    return sent
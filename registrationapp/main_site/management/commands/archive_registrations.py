@@ -0,0 +1,104 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from main_site.backends import forget_cached_users
+from main_site.models import ArchivedUserData, RegistrationState, UserData
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the registrations that were approved or rejected long ago "
+        "from UserData into ArchivedUserData. The rows are moved in small "
+        "batches, each in its own short transaction, so the command can be "
+        "stopped and restarted any time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.ARCHIVE_REGISTRATIONS_AFTER_DAYS,
+            help="Archive registrations finished at least this many days ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of registrations moved in one transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to wait between batches.",
+        )
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=2000,
+            help="Milliseconds to wait for a lock before the batch is aborted.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+        total = 0
+        while True:
+            moved = self.archive_batch(
+                cutoff, options["batch_size"], options["lock_timeout"]
+            )
+            if moved == 0:
+                break
+            total += moved
+            self.stdout.write(f"Archived {total} registrations...")
+            time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} registrations."))
+
+    def archive_batch(self, cutoff, batch_size: int, lock_timeout: int):
+        """Moves a batch of registrations. Returns the number of moved rows."""
+        field_names = [
+            field.attname
+            for field in ArchivedUserData._meta.concrete_fields
+            if field.name != "archived_at"
+        ]
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT set_config('lock_timeout', %s, true)",
+                        [f"{lock_timeout}ms"],
+                    )
+            # rows locked by a running request are archived in a later run
+            rows = list(
+                UserData.objects.filter(
+                    registration_state__in=[
+                        RegistrationState.APPROVED,
+                        RegistrationState.REJECTED,
+                    ],
+                    finished_at__lt=cutoff,
+                )
+                .order_by("finished_at")
+                .select_for_update(skip_locked=True, of=("self",))
+                .values(*field_names)[:batch_size]
+            )
+            if not rows:
+                return 0
+            ArchivedUserData.objects.bulk_create(
+                [ArchivedUserData(**row) for row in rows]
+            )
+            user_ids = [row["user_id"] for row in rows]
+            # QuerySet.delete() would delete the parent User rows too,
+            # but archived users can still log in.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM {} WHERE {} IN ({})".format(
+                        connection.ops.quote_name(UserData._meta.db_table),
+                        connection.ops.quote_name(UserData._meta.pk.column),
+                        ", ".join(["%s"] * len(user_ids)),
+                    ),
+                    user_ids,
+                )
+            forget_cached_users(user_ids)
+        return len(rows)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main_site import profiling
+from main_site.middleware import ProfilingMiddleware
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints a signed token which turns on the profiling of the requests "
+        f"sending it in the {ProfilingMiddleware.PROFILING_HEADER} header. "
+        "The token is valid for PROFILING_TOKEN_MAX_AGE seconds."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiling.create_token())
+        self.stderr.write(
+            f"Valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds. Profiles "
+            f"are written to {settings.PROFILING_DIR}."
+        )
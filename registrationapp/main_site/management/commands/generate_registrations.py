@@ -0,0 +1,201 @@
+import random
+from datetime import timedelta
+from itertools import cycle
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from main_site.matching import email_match_key, name_match_key, phone_match_key
+from main_site.models import (
+    UNKNOWN_COUNTRY_CODE,
+    Country,
+    RegistrationState,
+    RegistrationType,
+    User,
+    UserData,
+    UserType,
+)
+
+FIRST_NAMES = (
+    "Anna Bence Csilla Dávid Emma Ferenc Gábor Hanna István Júlia Katalin "
+    "László Máté Nóra Olivér Péter Réka Sándor Tamás Zsófia Alice Bob Chen "
+    "Diego Elif Fatima Giulia Hiro Ivan Jana Kofi Lucas"
+).split()
+LAST_NAMES = (
+    "Kovács Szabó Tóth Nagy Horváth Varga Kiss Molnár Németh Farkas Smith "
+    "Müller Rossi García Novák Wang Kim Silva Dubois Jansen Ivanova Yilmaz "
+    "Okafor Sato"
+).split()
+COMPANIES = [
+    "Laser Optics Ltd.",
+    "Photonics GmbH",
+    "Attosecond Systems",
+    "Beamline Inc.",
+    "Ultrafast Solutions",
+]
+
+USER_COLUMNS = [
+    "id",
+    "password",
+    "is_superuser",
+    "email",
+    "is_admin",
+    "is_active",
+    "user_type",
+]
+# the other columns are left NULL
+USER_DATA_COLUMNS = [
+    "user_id",
+    "registration_type",
+    "registration_state",
+    "orcid_id",
+    "name",
+    "phone_number",
+    "company",
+    "country_of_origin_id",
+    "state_changed_at",
+    "finished_at",
+    "orcid_etag",
+    "phone_match_key",
+    "name_match_key",
+    "email_match_key",
+    "created_at",
+    "updated_at",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic visitor and client registrations in every "
+        "registration state, for measuring the performance locally. The rows "
+        "are loaded with COPY in batches, without transitions, review notes "
+        "or emails."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, required=True)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of registrations loaded in one transaction.",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=730,
+            help="The registrations are created within this many days.",
+        )
+        parser.add_argument(
+            "--password",
+            help="Password of the generated users. By default, they can not log in.",
+        )
+        parser.add_argument("--seed", type=int, help="Seed of the random data.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The registrations are loaded with PostgreSQL COPY.")
+        self.random = random.Random(options["seed"])
+        self.now = timezone.now()
+        self.days = options["days"]
+        # hashing is slow, so all users share the hash
+        self.password = make_password(options["password"])
+        self.countries = list(
+            Country.objects.exclude(code=UNKNOWN_COUNTRY_CODE).values_list(
+                "code", flat=True
+            )
+        )
+        # every type in every state
+        self.kinds = cycle(
+            [
+                (registration_type, state)
+                for registration_type in RegistrationType.values
+                for state in RegistrationState.values
+            ]
+        )
+        total = 0
+        while total < options["count"]:
+            size = min(options["batch_size"], options["count"] - total)
+            self.load_batch(size)
+            total += size
+            self.stdout.write(f"Generated {total} registrations...")
+        self.stdout.write(self.style.SUCCESS(f"Generated {total} registrations."))
+
+    def load_batch(self, size: int):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                "FROM generate_series(1, %s)",
+                [User._meta.db_table, size],
+            )
+            user_ids = [row[0] for row in cursor.fetchall()]
+            rows = [self.generate_row(user_id) for user_id in user_ids]
+            with cursor.copy(
+                "COPY {} ({}) FROM STDIN".format(
+                    User._meta.db_table, ", ".join(USER_COLUMNS)
+                )
+            ) as copy:
+                for user_row, _ in rows:
+                    copy.write_row(user_row)
+            with cursor.copy(
+                "COPY {} ({}) FROM STDIN".format(
+                    UserData._meta.db_table, ", ".join(USER_DATA_COLUMNS)
+                )
+            ) as copy:
+                for _, user_data_row in rows:
+                    copy.write_row(user_data_row)
+
+    def generate_row(self, user_id: int):
+        """Returns the User and UserData rows of a registration."""
+        registration_type, state = next(self.kinds)
+        name = f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+        email = f"generated-{user_id}@example.com"
+        phone_number = (
+            f"+36 {self.random.choice([20, 30, 70])} "
+            f"{self.random.randrange(1000000, 10000000)}"
+        )
+        orcid_id = company = ""
+        country = None
+        if registration_type == RegistrationType.CLIENT:
+            company = self.random.choice(COMPANIES)
+            country = self.random.choice(self.countries)
+        elif self.random.random() < 0.5:
+            # unique, and not a real ORCID iD
+            digits = f"{user_id:012d}"
+            orcid_id = f"9999-{digits[:4]}-{digits[4:8]}-{digits[8:]}"
+        age = timedelta(seconds=self.random.uniform(0, self.days * 86400))
+        created_at = self.now - age
+        state_changed_at = created_at + age * self.random.random()
+        finished = state in (RegistrationState.APPROVED, RegistrationState.REJECTED)
+        user_row = (
+            user_id,
+            self.password,
+            False,
+            email,
+            False,
+            True,
+            (
+                UserType.VISITOR
+                if registration_type == RegistrationType.VISITOR
+                else UserType.CLIENT
+            ),
+        )
+        user_data_row = (
+            user_id,
+            registration_type,
+            state,
+            orcid_id,
+            name,
+            phone_number,
+            company,
+            country,
+            state_changed_at,
+            state_changed_at if finished else None,
+            "",
+            phone_match_key(phone_number),
+            name_match_key(name),
+            email_match_key(email),
+            created_at,
+            state_changed_at,
+        )
+        return user_row, user_data_row
@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from main_site import orcid
+from main_site.models import JobCheckpoint, User, UserData
+
+logger = logging.getLogger()
+
+CHECKPOINT_NAME = "orcid_refresh"
+# attempts of a request answered with 429 Too Many Requests or 503
+MAX_ATTEMPTS = 3
+
+
+class RateLimiter:
+    """Spaces the requests of all threads evenly to the given rate."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            at = max(now, self.next_at)
+            self.next_at = at + self.interval
+        time.sleep(at - now)
+
+
+def get_retry_after(response: requests.Response):
+    try:
+        return float(response.headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Refreshes the names and emails of the ORCID-linked registrations "
+        "from the public ORCID API. The records are requested in parallel, "
+        "at a limited rate, and only if they changed since the last refresh. "
+        "An interrupted run continues where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.ORCID_REFRESH_RATE,
+            help="Maximum number of ORCID requests per second.",
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Starts from the first registration instead of continuing.",
+        )
+
+    def handle(self, *args, **options):
+        if options["restart"]:
+            JobCheckpoint.objects.filter(name=CHECKPOINT_NAME).delete()
+        checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+        self.rate_limiter = RateLimiter(options["rate"])
+        self.local = threading.local()
+        counts = Counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+            while True:
+                registrations = list(
+                    UserData.objects.exclude(orcid_id="")
+                    .filter(user_id__gt=checkpoint.value.get("last_id", 0))
+                    .order_by("user_id")
+                    .only(
+                        "user_id",
+                        "email",
+                        "name",
+                        "orcid_id",
+                        "orcid_etag",
+                        "updated_at",
+                    )[: options["batch_size"]]
+                )
+                if not registrations:
+                    break
+                results = list(executor.map(self.request_record, registrations))
+                with transaction.atomic():
+                    self.write_back(registrations, results, counts)
+                    checkpoint.value = {"last_id": registrations[-1].user_id}
+                    checkpoint.save()
+        # the next run starts from the first registration
+        checkpoint.delete()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Refreshed the ORCID data: {counts['changed']} changed, "
+                f"{counts['unchanged']} unchanged, {counts['failed']} failed, "
+                f"{counts['skipped']} skipped."
+            )
+        )
+
+    def get_session(self):
+        """Returns the HTTP session of the thread, which keeps its connection."""
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def request_record(self, user_data: UserData):
+        """
+        Returns the changed ORCID data (or None if unchanged) and the ETag
+        of the record, or None if the request failed.
+        """
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.rate_limiter.wait()
+            try:
+                return orcid.request_changed_public_orcid_data(
+                    self.get_session(), user_data.orcid_id, user_data.orcid_etag
+                )
+            except requests.HTTPError as e:
+                if e.response.status_code in (429, 503) and attempt < MAX_ATTEMPTS:
+                    time.sleep(get_retry_after(e.response))
+                    continue
+                error = e
+            except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+                error = e
+            logger.warning(f"Refreshing ORCID record {user_data.orcid_id} failed: {error}")
+            return None
+
+    def write_back(self, registrations: list[UserData], results, counts: Counter):
+        """
+        Saves the ETags of the requested records and the changed fields.
+        The rows are locked and read again, and the ones changed since they
+        were requested are skipped, so no concurrent edit is overwritten.
+        They are refreshed by the next run.
+        """
+        now = timezone.now()
+        current = {
+            user_data.pk: user_data
+            for user_data in UserData.objects.select_for_update()
+            .filter(pk__in=[user_data.pk for user_data in registrations])
+            .order_by("pk")
+            .only("user_id", "updated_at", "orcid_id")
+        }
+        refreshed = []
+        for user_data, result in zip(registrations, results):
+            if result is None:
+                counts["failed"] += 1
+                continue
+            row = current.get(user_data.pk)
+            if (
+                row is None
+                or row.updated_at != user_data.updated_at
+                or row.orcid_id != user_data.orcid_id
+            ):
+                counts["skipped"] += 1
+                continue
+            data, user_data.orcid_etag = result
+            user_data.orcid_refreshed_at = now
+            if data is None:
+                counts["unchanged"] += 1
+                refreshed.append(user_data)
+                continue
+            email = User.objects.normalize_email(data.email or user_data.email)
+            if data.name == user_data.name and email == user_data.email:
+                counts["unchanged"] += 1
+                refreshed.append(user_data)
+                continue
+            user_data.name = data.name
+            self.save_changed(user_data, email)
+            counts["changed"] += 1
+        UserData.objects.bulk_update(refreshed, ["orcid_etag", "orcid_refreshed_at"])
+
+    def save_changed(self, user_data: UserData, email: str):
+        """Saves a changed registration, without the email if it is taken."""
+        update_fields = ["name", "orcid_etag", "orcid_refreshed_at", "updated_at"]
+        if email != user_data.email:
+            old_email = user_data.email
+            user_data.email = email
+            try:
+                with transaction.atomic():
+                    user_data.save(update_fields=[*update_fields, "email"])
+                return
+            except IntegrityError:
+                logger.warning(
+                    f"The ORCID email of user {user_data.pk} is used by another user"
+                )
+                user_data.email = old_email
+        user_data.save(update_fields=update_fields)
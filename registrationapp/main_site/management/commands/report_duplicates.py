@@ -0,0 +1,54 @@
+import csv
+from collections import defaultdict
+from itertools import combinations
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from main_site.models import UserData
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the pairs of registrations sharing a match key (normalized "
+        "phone number, name or email local part) as CSV. The registrations "
+        "are only compared within their blocks of equal keys, which are "
+        "grouped on the match key indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-block-size",
+            type=int,
+            default=50,
+            help=(
+                "Blocks with more registrations (e.g. a common name) are "
+                "skipped, they would give too many pairs to review."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        matches = defaultdict(list)
+        for key, label in UserData.MATCH_KEYS.items():
+            blocks = (
+                UserData.objects.exclude(**{key: ""})
+                .values(key)
+                .annotate(size=Count("pk"), user_ids=ArrayAgg("pk"))
+                .filter(size__gt=1)
+                .order_by()
+            )
+            for block in blocks.iterator():
+                if block["size"] > options["max_block_size"]:
+                    self.stderr.write(
+                        f"Skipped the {block['size']} registrations with the "
+                        f"{label.lower()} key {block[key]!r}."
+                    )
+                    continue
+                for pair in combinations(sorted(block["user_ids"]), 2):
+                    matches[pair].append(label)
+        writer = csv.writer(self.stdout)
+        writer.writerow(["user_id", "other_user_id", "matching"])
+        for (user_id, other_user_id), labels in sorted(matches.items()):
+            writer.writerow([user_id, other_user_id, ", ".join(labels)])
+        self.stderr.write(
+            self.style.SUCCESS(f"Found {len(matches)} possible duplicates.")
+        )
@@ -0,0 +1,111 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Aggregate, Count, DurationField, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from main_site.models import (
+    JobCheckpoint,
+    RegistrationState,
+    RegistrationStateDailyStats,
+    RegistrationTransition,
+)
+
+CHECKPOINT_NAME = "registration_transition_rollup"
+
+
+class Percentile(Aggregate):
+    """The continuous percentile of the values (PostgreSQL only)."""
+
+    function = "percentile_cont"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, percentile: float, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the daily registration state statistics with the state "
+        "transitions logged since the last run. Only the days with new "
+        "transitions are recomputed. Run it periodically, e.g. hourly."
+    )
+
+    def handle(self, *args, **options):
+        until = timezone.now()
+        with transaction.atomic():
+            # the lock prevents parallel runs
+            checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(
+                name=CHECKPOINT_NAME
+            )
+            new_transitions = RegistrationTransition.objects.filter(at__lte=until)
+            # The transitions are logged with the time of the change, before
+            # their transaction commits, so the ones logged shortly before
+            # the previous run are checked again. Without a previous run,
+            # all days are rolled up.
+            if "until" in checkpoint.value:
+                new_transitions = new_transitions.filter(
+                    at__gt=parse_datetime(checkpoint.value["until"])
+                    - timedelta(seconds=settings.TRANSITION_ROLLUP_RECHECK_SECONDS)
+                )
+            days = sorted(
+                new_transitions.annotate(day=TruncDate("at"))
+                .values_list("day", flat=True)
+                .distinct()
+            )
+            for day in days:
+                self.rollup_day(day)
+            checkpoint.value = {"until": until.isoformat()}
+            checkpoint.save()
+        if not days:
+            self.stdout.write(self.style.SUCCESS("No new transitions."))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated the statistics of {len(days)} days.")
+        )
+
+    def rollup_day(self, day):
+        """Recomputes the statistics of the day from the transition log."""
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        transitions = RegistrationTransition.objects.filter(
+            # the state filter allows using the (to_state, at) index
+            to_state__in=RegistrationState.values,
+            at__gte=start,
+            at__lt=start + timedelta(days=1),
+        ).order_by()
+        stats = {}
+
+        def get_stats(registration_type, registration_state):
+            key = (registration_type, registration_state)
+            if key not in stats:
+                stats[key] = RegistrationStateDailyStats(
+                    day=day,
+                    registration_type=registration_type,
+                    registration_state=registration_state,
+                )
+            return stats[key]
+
+        entered = transitions.values("registration_type", "to_state").annotate(
+            count=Count("id")
+        )
+        for row in entered:
+            get_stats(row["registration_type"], row["to_state"]).entered = row["count"]
+        time_in_state = F("at") - F("from_state_since")
+        left = (
+            transitions.exclude(from_state="")
+            .values("registration_type", "from_state")
+            .annotate(
+                count=Count("id"),
+                p50=Percentile(time_in_state, 0.5, output_field=DurationField()),
+                p90=Percentile(time_in_state, 0.9, output_field=DurationField()),
+            )
+        )
+        for row in left:
+            day_stats = get_stats(row["registration_type"], row["from_state"])
+            day_stats.left = row["count"]
+            day_stats.time_in_state_p50 = row["p50"]
+            day_stats.time_in_state_p90 = row["p90"]
+        RegistrationStateDailyStats.objects.filter(day=day).delete()
+        RegistrationStateDailyStats.objects.bulk_create(stats.values())
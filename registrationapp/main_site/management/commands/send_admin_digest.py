@@ -0,0 +1,60 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from main_site.mail import send_admin_digest_emails
+from main_site.models import JobCheckpoint, RegistrationState, User, UserData
+
+CHECKPOINT_NAME = "admin_digest"
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends a summary email to the admins about the registrations that "
+        "became pending since the last run. Run it periodically, e.g. hourly."
+    )
+
+    def handle(self, *args, **options):
+        until = timezone.now() - timedelta(seconds=settings.ADMIN_DIGEST_DELAY_SECONDS)
+        with transaction.atomic():
+            # the lock prevents parallel runs from sending the same digest
+            checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(
+                name=CHECKPOINT_NAME
+            )
+            since = checkpoint.value.get("high_water_mark")
+            registrations = UserData.objects.filter(
+                registration_state__in=[
+                    RegistrationState.INITIAL,
+                    RegistrationState.WAITING_FOR_APPROVAL,
+                ],
+                state_changed_at__lte=until,
+            ).order_by("state_changed_at")
+            if since is not None:
+                registrations = registrations.filter(
+                    state_changed_at__gt=parse_datetime(since)
+                )
+            registrations = list(
+                registrations.only(
+                    "user_id",
+                    "name",
+                    "registration_type",
+                    "registration_state",
+                    "state_changed_at",
+                )
+            )
+            admins = list(
+                User.objects.filter(is_admin=True, is_active=True).only("email")
+            )
+            sent = 0
+            if registrations and admins:
+                sent = send_admin_digest_emails(admins, registrations)
+            # the mark is only saved if the emails were sent
+            checkpoint.value = {"high_water_mark": until.isoformat()}
+            checkpoint.save()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {sent} digest emails about {len(registrations)} registrations."
+            )
+        )
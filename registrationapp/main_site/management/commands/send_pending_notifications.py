@@ -0,0 +1,111 @@
+import logging
+from datetime import timedelta
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from main_site.mail import NOTIFICATION_EMAILS
+from main_site.metrics import EMAILS_FAILED, EMAILS_SENT
+from main_site.models import PendingNotification, UserData
+
+logger = logging.getLogger()
+
+# the claimed notifications are sent again after this if the run stops
+CLAIM_SECONDS = 600
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the notification emails whose coalescing window has ended, "
+        "one email per user and notification type, with the current data "
+        "of the registration. Run it every minute."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of emails sent over one SMTP connection.",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            sent = self.send_batch(now, options["batch_size"])
+            if sent == 0:
+                break
+            total += sent
+        self.stdout.write(self.style.SUCCESS(f"Sent {total} notifications."))
+
+    def send_batch(self, now, batch_size: int):
+        """
+        Sends a batch of due notifications. Returns their number.
+
+        The notifications are claimed first, by moving them out of the due
+        ones for CLAIM_SECONDS, so parallel runs send different ones without
+        holding locks while sending. A sent notification is deleted only if
+        its version is the claimed one, and the notifications queued again
+        while sending stay due for the next run. The notifications whose
+        email failed are due again at once, and the claimed ones after
+        CLAIM_SECONDS if the run stops.
+        """
+        with transaction.atomic():
+            claimed = list(
+                PendingNotification.objects.filter(due_at__lte=now)
+                .order_by("due_at")
+                .select_for_update(skip_locked=True)
+                .values_list("pk", "version")[:batch_size]
+            )
+            if not claimed:
+                return 0
+            claimed_pks = [pk for pk, _ in claimed]
+            PendingNotification.objects.filter(pk__in=claimed_pks).update(
+                due_at=timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+            )
+        notifications = PendingNotification.objects.filter(pk__in=claimed_pks)
+        sent_pks = []
+        try:
+            self.send(notifications, sent_pks)
+        finally:
+            versions = dict(claimed)
+            sent = Q(pk__in=[])
+            for pk in sent_pks:
+                sent |= Q(pk=pk, version=versions[pk])
+            PendingNotification.objects.filter(sent).delete()
+            notifications.update(due_at=timezone.now())
+        return len(sent_pks)
+
+    def send(self, notifications, sent_pks: list):
+        """
+        Sends the notifications over one SMTP connection, and appends the pks
+        of the sent ones to sent_pks. The error of a failed email is raised
+        after trying the other ones.
+        """
+        notifications = list(notifications)
+        registrations = UserData.objects.select_related(
+            "user__review_notes", "country_of_origin"
+        ).in_bulk([notification.user_id for notification in notifications])
+        error = None
+        with get_connection() as connection:
+            for notification in notifications:
+                # archived registrations are not notified
+                user_data = registrations.get(notification.user_id)
+                if user_data is not None:
+                    message = NOTIFICATION_EMAILS[notification.notification_type](
+                        user_data
+                    )
+                    message.connection = connection
+                    try:
+                        message.send()
+                    except OSError as e:
+                        EMAILS_FAILED.inc()
+                        logger.error(f"Error during sending email: {e}")
+                        error = e
+                        continue
+                    EMAILS_SENT.inc()
+                sent_pks.append(notification.pk)
+        if error is not None:
+            raise error
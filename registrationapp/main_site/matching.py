@@ -0,0 +1,44 @@
+"""
+Normalized match keys of the registrations, for finding the registrations
+of the same person. An empty key never matches.
+"""
+
+import re
+import unicodedata
+from django.conf import settings
+
+# the minimum number of digits of a phone number key
+MIN_PHONE_DIGITS = 6
+
+
+def phone_match_key(phone_number: str):
+    """
+    Returns the phone number in the E.164 format ("+" and digits) if it has
+    an international prefix or PHONE_DEFAULT_CALLING_CODE is set, or else
+    its digits.
+    """
+    number = phone_number.strip()
+    digits = re.sub(r"\D", "", number)
+    if number.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif settings.PHONE_DEFAULT_CALLING_CODE:
+        # national numbers, without the trunk prefix
+        digits = settings.PHONE_DEFAULT_CALLING_CODE + digits.removeprefix("0")
+    else:
+        return digits if len(digits) >= MIN_PHONE_DIGITS else ""
+    return f"+{digits}" if len(digits) >= MIN_PHONE_DIGITS else ""
+
+
+def name_match_key(name: str):
+    """Returns the casefolded name, without accents and extra whitespace."""
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    letters = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(letters.split())
+
+
+def email_match_key(email: str):
+    """Returns the casefolded local part of the email, without a +tag."""
+    local_part = email.rpartition("@")[0] or email
+    return local_part.split("+", 1)[0].casefold()
@@ -0,0 +1,371 @@
+"""
+A small, dependency-free metrics registry with Prometheus text exposition.
+
+Every worker process collects its samples in memory and periodically writes
+them to its own file in settings.METRICS_DIR, named by its pid and start time.
+Since all samples (counter values and histogram buckets, sums and counts) are
+additive, the exposition endpoint sums the files of all worker processes. The
+files of exited workers are merged into an archive file and removed, so the
+totals of recycled workers are kept without the directory growing forever.
+Samples recorded after the last write of a process (e.g. when it is killed)
+are lost.
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+
+logger = logging.getLogger()
+
+# minimum number of seconds between two writes of the process' metrics file
+FLUSH_INTERVAL = 1.0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the merged samples of the exited processes
+ARCHIVE_FILE_NAME = "archive.json"
+LOCK_FILE_NAME = ".lock"
+
+
+def _process_start_time(pid):
+    """
+    Returns the start time of a running process in clock ticks since the boot,
+    or None if no process runs with the pid or it can not be read.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            stat = file.read()
+    except OSError:
+        return None
+    # the command name in parentheses may contain spaces, and the start time
+    # is the 22nd field
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def _add_samples(result, data):
+    for sample_name, labels, value in data:
+        key = (sample_name, tuple(tuple(label) for label in labels))
+        result[key] = result.get(key, 0.0) + value
+
+
+def _write_json(path, data):
+    # atomic replace, so readers never see a partially written file
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _sample_sort_key(item):
+    # orders histogram buckets by their numeric upper bound
+    (sample_name, labels), _ = item
+    le = float("inf")
+    other_labels = []
+    for name, value in labels:
+        if name == "le":
+            le = float(value.replace("+Inf", "inf"))
+        else:
+            other_labels.append((name, value))
+    return (sample_name, other_labels, le)
+
+
+def format_metric(name, metric_type, documentation, samples):
+    """
+    Returns a metric in the Prometheus text format.
+    samples is an iterable of (sample name, labels, value) tuples,
+    where labels is a tuple of (label name, label value) pairs.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for sample_name, labels, value in samples:
+        lines.append(
+            f"{sample_name}{_format_labels(labels)} {_format_value(value)}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """
+    Stores the samples of the metrics of the current process.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        # serializes the writes, so an older snapshot never replaces a newer one
+        self._write_lock = threading.Lock()
+        self._set_process()
+        self._last_flush = 0.0
+        atexit.register(self.flush)
+
+    def _set_process(self):
+        self._pid = os.getpid()
+        # a reused pid gets a new file
+        self._file_name = f"{self._pid}-{_process_start_time(self._pid)}.json"
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, sample_name, labels, amount):
+        with self._lock:
+            if self._pid != os.getpid():
+                # This is a forked child. The samples collected before the fork
+                # are in the file of the parent process.
+                self._set_process()
+                self._values = {}
+            key = (sample_name, labels)
+            self._values[key] = self._values.get(key, 0.0) + amount
+            flush = time.monotonic() - self._last_flush > FLUSH_INTERVAL
+        if flush:
+            self.flush()
+
+    def _directory(self):
+        return Path(settings.METRICS_DIR)
+
+    def flush(self):
+        """Writes the samples of this process into its metrics file."""
+        with self._write_lock:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                data = [
+                    [sample_name, list(labels), value]
+                    for (sample_name, labels), value in self._values.items()
+                ]
+                file_name = self._file_name
+            try:
+                directory = self._directory()
+                directory.mkdir(parents=True, exist_ok=True)
+                _write_json(directory / file_name, data)
+            except OSError as e:
+                logger.error(f"Error during writing metrics: {e}")
+
+    def _archive_exited_processes(self, directory):
+        """
+        Merges the files of the exited processes into the archive file and
+        removes them. Must be called while holding the lock file.
+        """
+        if _process_start_time(os.getpid()) is None:
+            # without /proc, running processes can not be told apart
+            return
+        exited = []
+        for path in directory.glob("*-*.json"):
+            pid, _, start_time = path.stem.partition("-")
+            if pid.isdigit() and _process_start_time(int(pid)) != start_time:
+                exited.append(path)
+        if not exited:
+            return
+        archive_path = directory / ARCHIVE_FILE_NAME
+        try:
+            with open(archive_path) as file:
+                archive = json.load(file)
+        except FileNotFoundError:
+            archive = {"samples": [], "merged": []}
+        samples = {}
+        _add_samples(samples, archive["samples"])
+        # The merged files are recorded, so they are not merged again if the
+        # process stops before removing them.
+        merged = [name for name in archive["merged"] if (directory / name).exists()]
+        for path in exited:
+            if path.name in merged:
+                continue
+            with open(path) as file:
+                _add_samples(samples, json.load(file))
+            merged.append(path.name)
+        _write_json(
+            archive_path,
+            {
+                "samples": [
+                    [sample_name, list(labels), value]
+                    for (sample_name, labels), value in samples.items()
+                ],
+                "merged": merged,
+            },
+        )
+        for path in exited:
+            path.unlink(missing_ok=True)
+
+    def collect(self):
+        """
+        Returns the samples summed over the files of all processes and the
+        archive, as a dict of (sample name, labels) -> value.
+        """
+        self.flush()
+        directory = self._directory()
+        result = {}
+        try:
+            lock_file = open(directory / LOCK_FILE_NAME, "a")
+        except OSError as e:
+            logger.error(f"Error during reading metrics: {e}")
+            return result
+        with lock_file:
+            # readers wait for the archiving, so no file is counted twice
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._archive_exited_processes(directory)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error during archiving metrics: {e}")
+            merged = set()
+            archive_path = directory / ARCHIVE_FILE_NAME
+            try:
+                with open(archive_path) as file:
+                    archive = json.load(file)
+                _add_samples(result, archive["samples"])
+                merged.update(archive["merged"])
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error during reading metrics file {archive_path}: {e}")
+            for path in directory.glob("*-*.json"):
+                if path.name in merged:
+                    continue
+                try:
+                    with open(path) as file:
+                        _add_samples(result, json.load(file))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Error during reading metrics file {path}: {e}")
+        return result
+
+    def render(self):
+        """Returns all registered metrics in the Prometheus text format."""
+        values = self.collect()
+        output = []
+        for metric in self.metrics.values():
+            samples = [
+                (sample_name, labels, value)
+                for (sample_name, labels), value in sorted(
+                    values.items(), key=_sample_sort_key
+                )
+                if metric.owns_sample(sample_name)
+            ]
+            output.append(
+                format_metric(
+                    metric.name, metric.metric_type, metric.documentation, samples
+                )
+            )
+        return "".join(output)
+
+
+registry = Registry()
+
+
+class Counter:
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry
+        registry.register(self)
+
+    def owns_sample(self, sample_name):
+        return sample_name == self.name
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self.name, tuple(sorted(labels.items())), amount)
+
+
+class Histogram:
+    metric_type = "histogram"
+
+    def __init__(
+        self, name, documentation, buckets=DEFAULT_BUCKETS, registry=registry
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.registry = registry
+        registry.register(self)
+
+    def owns_sample(self, sample_name):
+        return sample_name in (
+            f"{self.name}_bucket",
+            f"{self.name}_sum",
+            f"{self.name}_count",
+        )
+
+    def observe(self, value, **labels):
+        labels = tuple(sorted(labels.items()))
+        # buckets are cumulative, and all of them are exposed
+        for bucket in self.buckets:
+            self.registry.add(
+                f"{self.name}_bucket",
+                labels + (("le", _format_value(bucket)),),
+                1 if value <= bucket else 0,
+            )
+        self.registry.add(f"{self.name}_sum", labels, value)
+        self.registry.add(f"{self.name}_count", labels, 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+# ------------------------- METRICS -------------------------
+
+REGISTRATIONS = Counter(
+    "main_site_registrations_total",
+    "Number of successful registrations.",
+)
+REGISTRATION_FORM_ERRORS = Counter(
+    "main_site_registration_form_errors_total",
+    "Number of registration form submissions with invalid data.",
+)
+RATE_LIMITED_REQUESTS = Counter(
+    "main_site_rate_limited_requests_total",
+    "Number of requests rejected by the rate limits.",
+)
+STATE_TRANSITIONS = Counter(
+    "main_site_registration_state_transitions_total",
+    "Number of registration state changes by the new state.",
+)
+EMAILS_SENT = Counter(
+    "main_site_emails_sent_total",
+    "Number of successfully sent emails.",
+)
+EMAILS_FAILED = Counter(
+    "main_site_emails_failed_total",
+    "Number of emails that could not be sent.",
+)
+EMAILS_COALESCED = Counter(
+    "main_site_emails_coalesced_total",
+    "Number of notification emails merged into a pending one.",
+)
+ORCID_REQUEST_SECONDS = Histogram(
+    "main_site_orcid_request_duration_seconds",
+    "Duration of the requests to the ORCID API.",
+)
+ORCID_REQUEST_ERRORS = Counter(
+    "main_site_orcid_request_errors_total",
+    "Number of failed requests to the ORCID API.",
+)
@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest
+from . import db_routers, profiling
+
+PRIMARY_PINNED_UNTIL_SESSION_KEY = "primary_pinned_until"
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Reads of views with a true read_from_replica attribute are sent to the
+    replica database. After a request writes to the primary database, the
+    session is pinned to the primary for PRIMARY_PIN_SECONDS, so the user
+    does not see the stale state of a lagging replica.
+
+    It is async-capable, so under ASGI a waiting async view (e.g. the long
+    polling change feed) does not hold a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def pin_to_primary(self, request: HttpRequest):
+        request.session[PRIMARY_PINNED_UNTIL_SESSION_KEY] = (
+            time.time() + settings.PRIMARY_PIN_SECONDS
+        )
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        db_routers.reset_request_state()
+        try:
+            response = self.get_response(request)
+            if db_routers.has_written_primary():
+                self.pin_to_primary(request)
+        finally:
+            db_routers.reset_request_state()
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        db_routers.reset_request_state()
+        try:
+            response = await self.get_response(request)
+            if db_routers.has_written_primary():
+                # the session may be loaded from the database
+                await sync_to_async(self.pin_to_primary)(request)
+        finally:
+            db_routers.reset_request_state()
+        return response
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        if (
+            request.method in ("GET", "HEAD")
+            and getattr(view_class, "read_from_replica", False)
+            and request.session.get(PRIMARY_PINNED_UNTIL_SESSION_KEY, 0) < time.time()
+        ):
+            db_routers.use_replica_for_reads()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests with the sampling profiler of profiling.py.
+    A request is profiled if it has a valid signed PROFILING_HEADER, if an
+    admin adds the "profile" query parameter, or if it is randomly sampled
+    with the probability of PROFILING_SAMPLE_RATE.
+
+    With an empty PROFILING_DIR the middleware is removed at startup.
+
+    Under ASGI, the thread of the event loop is sampled, where the async
+    views run. The sync views and database queries run in other threads,
+    and show up as waiting for them.
+    """
+
+    PROFILING_HEADER = "X-Profile-Token"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_profile(self, request: HttpRequest):
+        token = request.headers.get(self.PROFILING_HEADER)
+        if token is not None and profiling.is_valid_token(token):
+            return True
+        if "profile" in request.GET and request.user.is_authenticated:
+            return request.user.is_admin
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def start_sampler(self):
+        sampler = profiling.StackSampler(
+            threading.get_ident(), settings.PROFILING_INTERVAL_SECONDS
+        )
+        sampler.start()
+        return sampler
+
+    def write_profile(self, request: HttpRequest, sampler: profiling.StackSampler):
+        sampler.stop()
+        resolver_match = getattr(request, "resolver_match", None)
+        profiling.write_profile(
+            sampler, resolver_match.url_name if resolver_match else None
+        )
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+        sampler = self.start_sampler()
+        try:
+            return self.get_response(request)
+        finally:
+            self.write_profile(request, sampler)
+
+    async def __acall__(self, request: HttpRequest):
+        if "profile" in request.GET:
+            # request.user is loaded from the database
+            profile = await sync_to_async(self.should_profile)(request)
+        else:
+            profile = self.should_profile(request)
+        if not profile:
+            return await self.get_response(request)
+        sampler = self.start_sampler()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.write_profile(request, sampler)
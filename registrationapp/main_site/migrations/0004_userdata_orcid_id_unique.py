@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:17
+
+from django.db import migrations, models
+
+
+def check_duplicate_orcid_ids(apps, schema_editor):
+    """
+    The constraint can not be added while an ORCID iD is registered more than
+    once. The duplicates are listed, so they can be merged or cleared by hand
+    before migrating again.
+    """
+    UserData = apps.get_model("main_site", "UserData")
+    duplicates = (
+        UserData.objects.using(schema_editor.connection.alias)
+        .exclude(orcid_id="")
+        .values("orcid_id")
+        .annotate(count=models.Count("pk"))
+        .filter(count__gt=1)
+        .values_list("orcid_id", flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(
+            "These ORCID iDs are registered more than once, clear orcid_id of "
+            "the duplicate registrations first: " + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0003_alter_userdata_registration_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_orcid_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userdata',
+            constraint=models.UniqueConstraint(condition=models.Q(('orcid_id', ''), _negated=True), fields=('orcid_id',), name='orcid_id_unique', violation_error_message='This ORCID iD is already registered.'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def set_finished_at(apps, schema_editor):
+    # The finishing time of existing registrations is unknown,
+    # so they are considered finished at the time of the migration.
+    UserData = apps.get_model("main_site", "UserData")
+    db_alias = schema_editor.connection.alias
+    UserData.objects.using(db_alias).filter(
+        registration_state__in=["approved", "rejected"]
+    ).update(finished_at=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0004_userdata_orcid_id_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedUserData',
+            fields=[
+                ('registration_type', models.CharField(choices=[('visitor', 'Visitor'), ('client', 'Client')], max_length=255)),
+                ('registration_state', models.CharField(choices=[('initial', 'Initial registration'), ('admin_requested_modify', 'Admin requested modifications'), ('waiting_for_approval', 'Waiting for approval'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='initial', max_length=255)),
+                ('orcid_id', models.CharField(blank=True, default='', max_length=255)),
+                ('orcid_id_comment', models.TextField(blank=True, default='')),
+                ('name', models.CharField(max_length=255)),
+                ('name_comment', models.TextField(blank=True, default='')),
+                ('email_comment', models.TextField(blank=True, default='')),
+                ('phone_number', models.CharField(max_length=255)),
+                ('phone_number_comment', models.TextField(blank=True, default='')),
+                ('company', models.CharField(blank=True, default='', max_length=255)),
+                ('company_comment', models.TextField(blank=True, default='')),
+                ('country_of_origin', models.CharField(blank=True, default='', max_length=255)),
+                ('country_of_origin_comment', models.TextField(blank=True, default='')),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('finished_at__isnull', False)), fields=['finished_at'], name='userdata_finished_at_idx'),
+        ),
+        migrations.RunPython(set_finished_at, migrations.RunPython.noop),
+    ]
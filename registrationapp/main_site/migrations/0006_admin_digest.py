@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0005_registration_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('value', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archiveduserdata',
+            name='state_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='state_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('registration_state__in', ['initial', 'waiting_for_approval'])), fields=['state_changed_at'], name='userdata_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,162 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:25
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+COMMENT_FIELDS = [
+    "orcid_id_comment",
+    "name_comment",
+    "email_comment",
+    "phone_number_comment",
+    "company_comment",
+    "country_of_origin_comment",
+]
+
+
+BATCH_SIZE = 1000
+
+
+def copy_comments_to_review_notes(apps, schema_editor):
+    # Only registrations with comments get a review notes row. The batches are
+    # committed one by one, so no trigger events are pending when the tables
+    # are altered afterwards.
+    ReviewNotes = apps.get_model("main_site", "ReviewNotes")
+    db_alias = schema_editor.connection.alias
+    has_comment = models.Q()
+    for field in COMMENT_FIELDS:
+        has_comment |= ~models.Q(**{field: ""})
+    for model_name in ["UserData", "ArchivedUserData"]:
+        model = apps.get_model("main_site", model_name)
+        last_id = 0
+        while True:
+            with transaction.atomic(using=db_alias):
+                rows = list(
+                    model.objects.using(db_alias)
+                    .filter(has_comment, user_id__gt=last_id)
+                    .order_by("user_id")
+                    .values("user_id", "registration_type", *COMMENT_FIELDS)[
+                        :BATCH_SIZE
+                    ]
+                )
+                if not rows:
+                    break
+                ReviewNotes.objects.using(db_alias).bulk_create(
+                    [ReviewNotes(**row) for row in rows]
+                )
+            last_id = rows[-1]["user_id"]
+
+
+def copy_comments_from_review_notes(apps, schema_editor):
+    ReviewNotes = apps.get_model("main_site", "ReviewNotes")
+    db_alias = schema_editor.connection.alias
+    for model_name in ["UserData", "ArchivedUserData"]:
+        model = apps.get_model("main_site", model_name)
+        for notes in ReviewNotes.objects.using(db_alias).iterator(chunk_size=1000):
+            model.objects.using(db_alias).filter(user_id=notes.user_id).update(
+                **{field: getattr(notes, field) for field in COMMENT_FIELDS}
+            )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main_site', '0006_admin_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewNotes',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_notes', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('registration_type', models.CharField(choices=[('visitor', 'Visitor'), ('client', 'Client')], max_length=255)),
+                ('orcid_id_comment', models.TextField(blank=True, default='')),
+                ('name_comment', models.TextField(blank=True, default='')),
+                ('email_comment', models.TextField(blank=True, default='')),
+                ('phone_number_comment', models.TextField(blank=True, default='')),
+                ('company_comment', models.TextField(blank=True, default='')),
+                ('country_of_origin_comment', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.RunPython(
+            copy_comments_to_review_notes, copy_comments_from_review_notes
+        ),
+        migrations.RemoveConstraint(
+            model_name='userdata',
+            name='visitor_allowed_fields_check',
+        ),
+        migrations.RemoveConstraint(
+            model_name='userdata',
+            name='client_allowed_fields_check',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='company_comment',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='country_of_origin_comment',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='email_comment',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='name_comment',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='orcid_id_comment',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='phone_number_comment',
+        ),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='company_comment',
+        ),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='country_of_origin_comment',
+        ),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='email_comment',
+        ),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='name_comment',
+        ),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='orcid_id_comment',
+        ),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='phone_number_comment',
+        ),
+        migrations.AddConstraint(
+            model_name='userdata',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('registration_type', 'visitor'), _negated=True), models.Q(('company', ''), ('country_of_origin', '')), _connector='OR'), name='visitor_allowed_fields_check'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdata',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('registration_type', 'client'), _negated=True), models.Q(models.Q(('company', ''), _negated=True), models.Q(('country_of_origin', ''), _negated=True), ('orcid_id', '')), _connector='OR'), name='client_allowed_fields_check'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewnotes',
+            constraint=models.CheckConstraint(check=models.Q(('registration_type__in', ['visitor', 'client'])), name='review_notes_registration_type_check'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewnotes',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('registration_type', 'visitor'), _negated=True), models.Q(('company_comment', ''), ('country_of_origin_comment', '')), _connector='OR'), name='visitor_allowed_comments_check'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewnotes',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('registration_type', 'client'), _negated=True), ('orcid_id_comment', ''), _connector='OR'), name='client_allowed_comments_check'),
+        ),
+    ]
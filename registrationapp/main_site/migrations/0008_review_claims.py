@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0007_review_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_registrations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def log_current_states(apps, schema_editor):
+    # The earlier transitions are unknown, so the registrations are logged
+    # as created in their current state.
+    RegistrationTransition = apps.get_model("main_site", "RegistrationTransition")
+    db_alias = schema_editor.connection.alias
+    for model_name in ["UserData", "ArchivedUserData"]:
+        model = apps.get_model("main_site", model_name)
+        rows = model.objects.using(db_alias).values_list(
+            "user_id", "registration_type", "registration_state", "state_changed_at"
+        ).iterator(chunk_size=1000)
+        batch = []
+        for user_id, registration_type, registration_state, state_changed_at in rows:
+            batch.append(
+                RegistrationTransition(
+                    user_id=user_id,
+                    registration_type=registration_type,
+                    to_state=registration_state,
+                    at=state_changed_at,
+                )
+            )
+            if len(batch) == 1000:
+                RegistrationTransition.objects.using(db_alias).bulk_create(batch)
+                batch = []
+        RegistrationTransition.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0008_review_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationStateDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('registration_type', models.CharField(choices=[('visitor', 'Visitor'), ('client', 'Client')], max_length=255)),
+                ('registration_state', models.CharField(choices=[('initial', 'Initial registration'), ('admin_requested_modify', 'Admin requested modifications'), ('waiting_for_approval', 'Waiting for approval'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=255)),
+                ('entered', models.IntegerField(default=0)),
+                ('left', models.IntegerField(default=0)),
+                ('time_in_state_p50', models.DurationField(blank=True, null=True)),
+                ('time_in_state_p90', models.DurationField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RegistrationTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registration_type', models.CharField(choices=[('visitor', 'Visitor'), ('client', 'Client')], max_length=255)),
+                ('from_state', models.CharField(blank=True, choices=[('initial', 'Initial registration'), ('admin_requested_modify', 'Admin requested modifications'), ('waiting_for_approval', 'Waiting for approval'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=255)),
+                ('from_state_since', models.DateTimeField(blank=True, null=True)),
+                ('to_state', models.CharField(choices=[('initial', 'Initial registration'), ('admin_requested_modify', 'Admin requested modifications'), ('waiting_for_approval', 'Waiting for approval'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=255)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='registration_transitions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='registrationstatedailystats',
+            constraint=models.UniqueConstraint(fields=('day', 'registration_type', 'registration_state'), name='registration_state_daily_stats_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='registrationtransition',
+            index=models.Index(fields=['user', 'at'], name='transition_user_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrationtransition',
+            index=models.Index(fields=['to_state', 'at'], name='transition_to_state_at_idx'),
+        ),
+        migrations.RunPython(log_current_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:37
+
+from django.db import migrations, models, transaction
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill_timestamps(apps, schema_editor):
+    # The registrations were created at their first logged transition,
+    # and last modified at their last state change.
+    UserData = apps.get_model("main_site", "UserData")
+    RegistrationTransition = apps.get_model("main_site", "RegistrationTransition")
+    db_alias = schema_editor.connection.alias
+    first_transition_at = (
+        RegistrationTransition.objects.using(db_alias)
+        .filter(user_id=models.OuterRef("user_id"))
+        .order_by("at")
+        .values("at")[:1]
+    )
+    last_id = 0
+    while True:
+        # every batch is committed, so the rows are not locked for long
+        with transaction.atomic(using=db_alias):
+            ids = list(
+                UserData.objects.using(db_alias)
+                .filter(user_id__gt=last_id)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+            UserData.objects.using(db_alias).filter(user_id__in=ids).update(
+                created_at=Coalesce(
+                    models.Subquery(first_transition_at), models.F("state_changed_at")
+                ),
+                updated_at=models.F("state_changed_at"),
+            )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main_site', '0009_registration_transitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_timestamps, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='userdata',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='userdata',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(fields=['created_at', 'user'], name='userdata_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(fields=['updated_at', 'user'], name='userdata_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(fields=['registration_state', 'created_at', 'user'], name='userdata_state_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(fields=['registration_state', 'updated_at', 'user'], name='userdata_state_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,427 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:45
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+# ISO 3166-1 alpha-2 codes and short English names
+COUNTRIES = [
+    ("AD", "Andorra"),
+    ("AE", "United Arab Emirates"),
+    ("AF", "Afghanistan"),
+    ("AG", "Antigua and Barbuda"),
+    ("AI", "Anguilla"),
+    ("AL", "Albania"),
+    ("AM", "Armenia"),
+    ("AO", "Angola"),
+    ("AQ", "Antarctica"),
+    ("AR", "Argentina"),
+    ("AS", "American Samoa"),
+    ("AT", "Austria"),
+    ("AU", "Australia"),
+    ("AW", "Aruba"),
+    ("AX", "Åland Islands"),
+    ("AZ", "Azerbaijan"),
+    ("BA", "Bosnia and Herzegovina"),
+    ("BB", "Barbados"),
+    ("BD", "Bangladesh"),
+    ("BE", "Belgium"),
+    ("BF", "Burkina Faso"),
+    ("BG", "Bulgaria"),
+    ("BH", "Bahrain"),
+    ("BI", "Burundi"),
+    ("BJ", "Benin"),
+    ("BL", "Saint Barthélemy"),
+    ("BM", "Bermuda"),
+    ("BN", "Brunei Darussalam"),
+    ("BO", "Bolivia"),
+    ("BQ", "Bonaire, Sint Eustatius and Saba"),
+    ("BR", "Brazil"),
+    ("BS", "Bahamas"),
+    ("BT", "Bhutan"),
+    ("BV", "Bouvet Island"),
+    ("BW", "Botswana"),
+    ("BY", "Belarus"),
+    ("BZ", "Belize"),
+    ("CA", "Canada"),
+    ("CC", "Cocos (Keeling) Islands"),
+    ("CD", "Congo, Democratic Republic of the"),
+    ("CF", "Central African Republic"),
+    ("CG", "Congo"),
+    ("CH", "Switzerland"),
+    ("CI", "Côte d'Ivoire"),
+    ("CK", "Cook Islands"),
+    ("CL", "Chile"),
+    ("CM", "Cameroon"),
+    ("CN", "China"),
+    ("CO", "Colombia"),
+    ("CR", "Costa Rica"),
+    ("CU", "Cuba"),
+    ("CV", "Cabo Verde"),
+    ("CW", "Curaçao"),
+    ("CX", "Christmas Island"),
+    ("CY", "Cyprus"),
+    ("CZ", "Czechia"),
+    ("DE", "Germany"),
+    ("DJ", "Djibouti"),
+    ("DK", "Denmark"),
+    ("DM", "Dominica"),
+    ("DO", "Dominican Republic"),
+    ("DZ", "Algeria"),
+    ("EC", "Ecuador"),
+    ("EE", "Estonia"),
+    ("EG", "Egypt"),
+    ("EH", "Western Sahara"),
+    ("ER", "Eritrea"),
+    ("ES", "Spain"),
+    ("ET", "Ethiopia"),
+    ("FI", "Finland"),
+    ("FJ", "Fiji"),
+    ("FK", "Falkland Islands (Malvinas)"),
+    ("FM", "Micronesia"),
+    ("FO", "Faroe Islands"),
+    ("FR", "France"),
+    ("GA", "Gabon"),
+    ("GB", "United Kingdom"),
+    ("GD", "Grenada"),
+    ("GE", "Georgia"),
+    ("GF", "French Guiana"),
+    ("GG", "Guernsey"),
+    ("GH", "Ghana"),
+    ("GI", "Gibraltar"),
+    ("GL", "Greenland"),
+    ("GM", "Gambia"),
+    ("GN", "Guinea"),
+    ("GP", "Guadeloupe"),
+    ("GQ", "Equatorial Guinea"),
+    ("GR", "Greece"),
+    ("GS", "South Georgia and the South Sandwich Islands"),
+    ("GT", "Guatemala"),
+    ("GU", "Guam"),
+    ("GW", "Guinea-Bissau"),
+    ("GY", "Guyana"),
+    ("HK", "Hong Kong"),
+    ("HM", "Heard Island and McDonald Islands"),
+    ("HN", "Honduras"),
+    ("HR", "Croatia"),
+    ("HT", "Haiti"),
+    ("HU", "Hungary"),
+    ("ID", "Indonesia"),
+    ("IE", "Ireland"),
+    ("IL", "Israel"),
+    ("IM", "Isle of Man"),
+    ("IN", "India"),
+    ("IO", "British Indian Ocean Territory"),
+    ("IQ", "Iraq"),
+    ("IR", "Iran"),
+    ("IS", "Iceland"),
+    ("IT", "Italy"),
+    ("JE", "Jersey"),
+    ("JM", "Jamaica"),
+    ("JO", "Jordan"),
+    ("JP", "Japan"),
+    ("KE", "Kenya"),
+    ("KG", "Kyrgyzstan"),
+    ("KH", "Cambodia"),
+    ("KI", "Kiribati"),
+    ("KM", "Comoros"),
+    ("KN", "Saint Kitts and Nevis"),
+    ("KP", "North Korea"),
+    ("KR", "South Korea"),
+    ("KW", "Kuwait"),
+    ("KY", "Cayman Islands"),
+    ("KZ", "Kazakhstan"),
+    ("LA", "Laos"),
+    ("LB", "Lebanon"),
+    ("LC", "Saint Lucia"),
+    ("LI", "Liechtenstein"),
+    ("LK", "Sri Lanka"),
+    ("LR", "Liberia"),
+    ("LS", "Lesotho"),
+    ("LT", "Lithuania"),
+    ("LU", "Luxembourg"),
+    ("LV", "Latvia"),
+    ("LY", "Libya"),
+    ("MA", "Morocco"),
+    ("MC", "Monaco"),
+    ("MD", "Moldova"),
+    ("ME", "Montenegro"),
+    ("MF", "Saint Martin (French part)"),
+    ("MG", "Madagascar"),
+    ("MH", "Marshall Islands"),
+    ("MK", "North Macedonia"),
+    ("ML", "Mali"),
+    ("MM", "Myanmar"),
+    ("MN", "Mongolia"),
+    ("MO", "Macao"),
+    ("MP", "Northern Mariana Islands"),
+    ("MQ", "Martinique"),
+    ("MR", "Mauritania"),
+    ("MS", "Montserrat"),
+    ("MT", "Malta"),
+    ("MU", "Mauritius"),
+    ("MV", "Maldives"),
+    ("MW", "Malawi"),
+    ("MX", "Mexico"),
+    ("MY", "Malaysia"),
+    ("MZ", "Mozambique"),
+    ("NA", "Namibia"),
+    ("NC", "New Caledonia"),
+    ("NE", "Niger"),
+    ("NF", "Norfolk Island"),
+    ("NG", "Nigeria"),
+    ("NI", "Nicaragua"),
+    ("NL", "Netherlands"),
+    ("NO", "Norway"),
+    ("NP", "Nepal"),
+    ("NR", "Nauru"),
+    ("NU", "Niue"),
+    ("NZ", "New Zealand"),
+    ("OM", "Oman"),
+    ("PA", "Panama"),
+    ("PE", "Peru"),
+    ("PF", "French Polynesia"),
+    ("PG", "Papua New Guinea"),
+    ("PH", "Philippines"),
+    ("PK", "Pakistan"),
+    ("PL", "Poland"),
+    ("PM", "Saint Pierre and Miquelon"),
+    ("PN", "Pitcairn"),
+    ("PR", "Puerto Rico"),
+    ("PS", "Palestine, State of"),
+    ("PT", "Portugal"),
+    ("PW", "Palau"),
+    ("PY", "Paraguay"),
+    ("QA", "Qatar"),
+    ("RE", "Réunion"),
+    ("RO", "Romania"),
+    ("RS", "Serbia"),
+    ("RU", "Russia"),
+    ("RW", "Rwanda"),
+    ("SA", "Saudi Arabia"),
+    ("SB", "Solomon Islands"),
+    ("SC", "Seychelles"),
+    ("SD", "Sudan"),
+    ("SE", "Sweden"),
+    ("SG", "Singapore"),
+    ("SH", "Saint Helena, Ascension and Tristan da Cunha"),
+    ("SI", "Slovenia"),
+    ("SJ", "Svalbard and Jan Mayen"),
+    ("SK", "Slovakia"),
+    ("SL", "Sierra Leone"),
+    ("SM", "San Marino"),
+    ("SN", "Senegal"),
+    ("SO", "Somalia"),
+    ("SR", "Suriname"),
+    ("SS", "South Sudan"),
+    ("ST", "Sao Tome and Principe"),
+    ("SV", "El Salvador"),
+    ("SX", "Sint Maarten (Dutch part)"),
+    ("SY", "Syria"),
+    ("SZ", "Eswatini"),
+    ("TC", "Turks and Caicos Islands"),
+    ("TD", "Chad"),
+    ("TF", "French Southern Territories"),
+    ("TG", "Togo"),
+    ("TH", "Thailand"),
+    ("TJ", "Tajikistan"),
+    ("TK", "Tokelau"),
+    ("TL", "Timor-Leste"),
+    ("TM", "Turkmenistan"),
+    ("TN", "Tunisia"),
+    ("TO", "Tonga"),
+    ("TR", "Türkiye"),
+    ("TT", "Trinidad and Tobago"),
+    ("TV", "Tuvalu"),
+    ("TW", "Taiwan"),
+    ("TZ", "Tanzania"),
+    ("UA", "Ukraine"),
+    ("UG", "Uganda"),
+    ("UM", "United States Minor Outlying Islands"),
+    ("US", "United States"),
+    ("UY", "Uruguay"),
+    ("UZ", "Uzbekistan"),
+    ("VA", "Holy See"),
+    ("VC", "Saint Vincent and the Grenadines"),
+    ("VE", "Venezuela"),
+    ("VG", "Virgin Islands (British)"),
+    ("VI", "Virgin Islands (U.S.)"),
+    ("VN", "Viet Nam"),
+    ("VU", "Vanuatu"),
+    ("WF", "Wallis and Futuna"),
+    ("WS", "Samoa"),
+    ("YE", "Yemen"),
+    ("YT", "Mayotte"),
+    ("ZA", "South Africa"),
+    ("ZM", "Zambia"),
+    ("ZW", "Zimbabwe"),
+    # user-assigned code for the unrecognized free-text values
+    ("ZZ", "Unknown"),
+]
+
+# other spellings of the country names found in free text
+ALIASES = {
+    "America": "US",
+    "Czech Republic": "CZ",
+    "England": "GB",
+    "Great Britain": "GB",
+    "Holland": "NL",
+    "Ivory Coast": "CI",
+    "Korea": "KR",
+    "Macedonia": "MK",
+    "Republic of Korea": "KR",
+    "Russian Federation": "RU",
+    "Scotland": "GB",
+    "The Netherlands": "NL",
+    "Turkey": "TR",
+    "U.K.": "GB",
+    "U.S.": "US",
+    "U.S.A.": "US",
+    "UK": "GB",
+    "United Kingdom of Great Britain and Northern Ireland": "GB",
+    "United States of America": "US",
+    "USA": "US",
+    "Vietnam": "VN",
+    "Wales": "GB",
+}
+
+
+def normalize(value):
+    return " ".join(value.split()).casefold()
+
+
+def load_countries(apps, schema_editor):
+    Country = apps.get_model("main_site", "Country")
+    db_alias = schema_editor.connection.alias
+    Country.objects.using(db_alias).bulk_create(
+        [Country(code=code, name=name) for code, name in COUNTRIES]
+    )
+
+
+def map_countries(apps, schema_editor):
+    # Unrecognized countries are mapped to "Unknown", and the original text
+    # is kept as a comment, so admins can ask for the correct country.
+    lookup = {}
+    for code, name in COUNTRIES:
+        lookup[normalize(code)] = code
+        lookup[normalize(name)] = code
+    for alias, code in ALIASES.items():
+        lookup[normalize(alias)] = code
+    ReviewNotes = apps.get_model("main_site", "ReviewNotes")
+    db_alias = schema_editor.connection.alias
+    for model_name in ["UserData", "ArchivedUserData"]:
+        model = apps.get_model("main_site", model_name)
+        last_id = 0
+        while True:
+            # every batch is committed, so the rows are not locked for long
+            with transaction.atomic(using=db_alias):
+                rows = list(
+                    model.objects.using(db_alias)
+                    .filter(user_id__gt=last_id)
+                    .exclude(country_of_origin="")
+                    .order_by("user_id")
+                    .only("user_id", "registration_type", "country_of_origin")[
+                        :BATCH_SIZE
+                    ]
+                )
+                if not rows:
+                    break
+                for row in rows:
+                    row.country_id = lookup.get(normalize(row.country_of_origin), "ZZ")
+                    if row.country_id != "ZZ":
+                        continue
+                    notes, _ = ReviewNotes.objects.using(db_alias).get_or_create(
+                        user_id=row.user_id,
+                        defaults={"registration_type": row.registration_type},
+                    )
+                    comment = f"Unrecognized country: {row.country_of_origin}"
+                    notes.country_of_origin_comment = "\n".join(
+                        filter(None, [notes.country_of_origin_comment, comment])
+                    )
+                    notes.save()
+                model.objects.using(db_alias).bulk_update(rows, ["country"])
+            last_id = rows[-1].user_id
+
+
+def unmap_countries(apps, schema_editor):
+    Country = apps.get_model("main_site", "Country")
+    db_alias = schema_editor.connection.alias
+    for model_name in ["UserData", "ArchivedUserData"]:
+        model = apps.get_model("main_site", model_name)
+        model.objects.using(db_alias).filter(country__isnull=False).update(
+            country_of_origin=models.Subquery(
+                Country.objects.using(db_alias)
+                .filter(code=models.OuterRef("country_id"))
+                .values("name")
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main_site', '0010_userdata_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Country',
+            fields=[
+                ('code', models.CharField(max_length=2, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['name'], name='country_name_idx')],
+            },
+        ),
+        migrations.RunPython(load_countries, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='userdata',
+            name='visitor_allowed_fields_check',
+        ),
+        migrations.RemoveConstraint(
+            model_name='userdata',
+            name='client_allowed_fields_check',
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='country',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='main_site.country'),
+        ),
+        migrations.AddField(
+            model_name='archiveduserdata',
+            name='country',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='main_site.country'),
+        ),
+        migrations.RunPython(map_countries, unmap_countries),
+        migrations.RemoveField(
+            model_name='userdata',
+            name='country_of_origin',
+        ),
+        migrations.RemoveField(
+            model_name='archiveduserdata',
+            name='country_of_origin',
+        ),
+        migrations.RenameField(
+            model_name='userdata',
+            old_name='country',
+            new_name='country_of_origin',
+        ),
+        migrations.RenameField(
+            model_name='archiveduserdata',
+            old_name='country',
+            new_name='country_of_origin',
+        ),
+        migrations.AddConstraint(
+            model_name='userdata',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('registration_type', 'visitor'), _negated=True), models.Q(('company', ''), ('country_of_origin__isnull', True)), _connector='OR'), name='visitor_allowed_fields_check'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdata',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('registration_type', 'client'), _negated=True), models.Q(models.Q(('company', ''), _negated=True), ('country_of_origin__isnull', False), ('orcid_id', '')), _connector='OR'), name='client_allowed_fields_check'),
+        ),
+    ]
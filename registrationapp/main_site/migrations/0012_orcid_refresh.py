@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0011_countries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='orcid_etag',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='orcid_refreshed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:51
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+# The trigger runs when the writing transaction commits (it is deferred), and
+# the advisory lock is held until the commit finishes. So the transactions
+# take the sequence values in their commit order, and a change feed reader
+# never sees a value before a smaller one is visible.
+CREATE_TRIGGERS = """
+CREATE SEQUENCE main_site_userdata_change_seq;
+
+CREATE FUNCTION main_site_assign_change_seq() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock('main_site_userdata_change_seq'::regclass::oid::bigint);
+    UPDATE main_site_userdata
+    SET change_seq = nextval('main_site_userdata_change_seq')
+    WHERE user_id = (to_jsonb(NEW) ->> TG_ARGV[0])::bigint;
+    RETURN NULL;
+END
+$$;
+
+-- the depth condition skips the update of the trigger itself
+CREATE CONSTRAINT TRIGGER main_site_userdata_change_seq
+AFTER INSERT OR UPDATE ON main_site_userdata
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW WHEN (pg_trigger_depth() = 0)
+EXECUTE FUNCTION main_site_assign_change_seq('user_id');
+
+-- the email is stored in the user table
+CREATE CONSTRAINT TRIGGER main_site_user_change_seq
+AFTER UPDATE OF email ON main_site_user
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW WHEN (pg_trigger_depth() = 0 AND OLD.email IS DISTINCT FROM NEW.email)
+EXECUTE FUNCTION main_site_assign_change_seq('id');
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER main_site_user_change_seq ON main_site_user;
+DROP TRIGGER main_site_userdata_change_seq ON main_site_userdata;
+DROP FUNCTION main_site_assign_change_seq();
+DROP SEQUENCE main_site_userdata_change_seq;
+"""
+
+
+def assign_change_seqs(apps, schema_editor):
+    # the trigger assigns the final values when the batches are committed
+    db_alias = schema_editor.connection.alias
+    while True:
+        with transaction.atomic(using=db_alias):
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE main_site_userdata
+                    SET change_seq = nextval('main_site_userdata_change_seq')
+                    WHERE user_id IN (
+                        SELECT user_id FROM main_site_userdata
+                        WHERE change_seq IS NULL
+                        ORDER BY user_id
+                        LIMIT %s
+                    )
+                    """,
+                    [BATCH_SIZE],
+                )
+                if cursor.rowcount == 0:
+                    break
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main_site', '0012_orcid_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='change_seq',
+            field=models.BigIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunPython(assign_change_seqs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:55
+
+import re
+import unicodedata
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+# Frozen copies of the key functions of main_site/matching.py at the time of
+# this migration, so later changes there do not change what it does.
+MIN_PHONE_DIGITS = 6
+
+
+def phone_match_key(phone_number):
+    number = phone_number.strip()
+    digits = re.sub(r"\D", "", number)
+    if number.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif settings.PHONE_DEFAULT_CALLING_CODE:
+        digits = settings.PHONE_DEFAULT_CALLING_CODE + digits.removeprefix("0")
+    else:
+        return digits if len(digits) >= MIN_PHONE_DIGITS else ""
+    return f"+{digits}" if len(digits) >= MIN_PHONE_DIGITS else ""
+
+
+def name_match_key(name):
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    letters = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(letters.split())
+
+
+def email_match_key(email):
+    local_part = email.rpartition("@")[0] or email
+    return local_part.split("+", 1)[0].casefold()
+
+
+def fill_match_keys(apps, schema_editor):
+    # the keys are computed like UserData.save() computed them; the updated
+    # registrations get new change feed positions
+    UserData = apps.get_model("main_site", "UserData")
+    db_alias = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        with transaction.atomic(using=db_alias):
+            # the email is stored in the user table
+            rows = list(
+                UserData.objects.using(db_alias)
+                .filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", "phone_number", "name", "user__email")[
+                    :BATCH_SIZE
+                ]
+            )
+            if not rows:
+                break
+            batch = [
+                UserData(
+                    pk=pk,
+                    phone_match_key=phone_match_key(phone_number),
+                    name_match_key=name_match_key(name),
+                    email_match_key=email_match_key(email),
+                )
+                for pk, phone_number, name, email in rows
+            ]
+            UserData.objects.using(db_alias).bulk_update(
+                batch, ["phone_match_key", "name_match_key", "email_match_key"]
+            )
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main_site', '0013_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdata',
+            name='email_match_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='name_match_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userdata',
+            name='phone_match_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        # the indexes are built after the backfill
+        migrations.RunPython(fill_match_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('phone_match_key', ''), _negated=True), fields=['phone_match_key'], name='userdata_phone_match_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('name_match_key', ''), _negated=True), fields=['name_match_key'], name='userdata_name_match_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('email_match_key', ''), _negated=True), fields=['email_match_key'], name='userdata_email_match_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0014_match_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('registration_state_changed', 'Registration state changed')], max_length=255)),
+                ('due_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pendingnotification',
+            constraint=models.UniqueConstraint(fields=('user', 'notification_type'), name='pending_notification_unique'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.30 on 2026-10-19 20:19
+
+from django.db import migrations
+
+# ReviewNotes.registration_type is a copy of the registration type, which the
+# allowed comments check constraints use. The first trigger rejects review
+# notes whose type differs from their registration (or archived registration),
+# and the second one copies a changed type of a registration to its notes,
+# where the check constraints apply again.
+CREATE_TRIGGERS = """
+UPDATE main_site_reviewnotes AS notes
+SET registration_type = registration.registration_type
+FROM (
+    SELECT user_id, registration_type FROM main_site_userdata
+    UNION ALL
+    SELECT user_id, registration_type FROM main_site_archiveduserdata
+) AS registration
+WHERE registration.user_id = notes.user_id
+AND registration.registration_type <> notes.registration_type;
+
+CREATE FUNCTION main_site_check_review_notes_registration_type() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    expected varchar;
+BEGIN
+    SELECT registration_type INTO expected FROM main_site_userdata
+    WHERE user_id = NEW.user_id;
+    IF NOT FOUND THEN
+        SELECT registration_type INTO expected FROM main_site_archiveduserdata
+        WHERE user_id = NEW.user_id;
+    END IF;
+    IF expected IS DISTINCT FROM NEW.registration_type THEN
+        RAISE EXCEPTION 'The registration type of the review notes of user % '
+            'is %, but the registration type is %.',
+            NEW.user_id, NEW.registration_type, expected
+        USING ERRCODE = 'check_violation',
+            CONSTRAINT = 'review_notes_registration_type_sync';
+    END IF;
+    RETURN NEW;
+END
+$$;
+
+CREATE TRIGGER main_site_review_notes_registration_type
+BEFORE INSERT OR UPDATE OF registration_type, user_id ON main_site_reviewnotes
+FOR EACH ROW
+EXECUTE FUNCTION main_site_check_review_notes_registration_type();
+
+CREATE FUNCTION main_site_copy_registration_type() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE main_site_reviewnotes
+    SET registration_type = NEW.registration_type
+    WHERE user_id = NEW.user_id;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER main_site_userdata_registration_type
+AFTER UPDATE OF registration_type ON main_site_userdata
+FOR EACH ROW
+WHEN (OLD.registration_type IS DISTINCT FROM NEW.registration_type)
+EXECUTE FUNCTION main_site_copy_registration_type();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER main_site_userdata_registration_type ON main_site_userdata;
+DROP FUNCTION main_site_copy_registration_type();
+DROP TRIGGER main_site_review_notes_registration_type ON main_site_reviewnotes;
+DROP FUNCTION main_site_check_review_notes_registration_type();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0015_pending_notifications'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0016_review_notes_registration_type_sync'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('country_of_origin__isnull', False)), fields=['country_of_origin', 'created_at', 'user'], name='userdata_country_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdata',
+            index=models.Index(condition=models.Q(('country_of_origin__isnull', False)), fields=['country_of_origin', 'updated_at', 'user'], name='userdata_country_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-19 20:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# The change sequence triggers of 0013 also notify the waiting change feed
+# requests now, and a deleted UserData row gets a tombstone numbered in the
+# same sequence, under the same lock. The tombstone is inserted when the
+# transaction commits, so an archived registration is already in
+# ArchivedUserData. The notification payloads are equal, so PostgreSQL sends
+# one notification per transaction.
+CREATE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION main_site_assign_change_seq() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock('main_site_userdata_change_seq'::regclass::oid::bigint);
+    UPDATE main_site_userdata
+    SET change_seq = nextval('main_site_userdata_change_seq')
+    WHERE user_id = (to_jsonb(NEW) ->> TG_ARGV[0])::bigint;
+    PERFORM pg_notify('main_site_registration_changes', '{}');
+    RETURN NULL;
+END
+$$;
+
+CREATE FUNCTION main_site_record_registration_removal() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock('main_site_userdata_change_seq'::regclass::oid::bigint);
+    INSERT INTO main_site_removedregistration (user_id, reason, change_seq, removed_at)
+    SELECT
+        OLD.user_id,
+        CASE WHEN EXISTS (
+            SELECT FROM main_site_archiveduserdata WHERE user_id = OLD.user_id
+        ) THEN 'archived' ELSE 'deleted' END,
+        nextval('main_site_userdata_change_seq'),
+        now();
+    PERFORM pg_notify('main_site_registration_changes', '{}');
+    RETURN NULL;
+END
+$$;
+
+CREATE CONSTRAINT TRIGGER main_site_userdata_removal
+AFTER DELETE ON main_site_userdata
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW
+EXECUTE FUNCTION main_site_record_registration_removal();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER main_site_userdata_removal ON main_site_userdata;
+DROP FUNCTION main_site_record_registration_removal();
+
+CREATE OR REPLACE FUNCTION main_site_assign_change_seq() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock('main_site_userdata_change_seq'::regclass::oid::bigint);
+    UPDATE main_site_userdata
+    SET change_seq = nextval('main_site_userdata_change_seq')
+    WHERE user_id = (to_jsonb(NEW) ->> TG_ARGV[0])::bigint;
+    RETURN NULL;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0017_userdata_country_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemovedRegistration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField()),
+                ('reason', models.CharField(choices=[('archived', 'Archived'), ('deleted', 'Deleted')], max_length=255)),
+                ('change_seq', models.BigIntegerField(unique=True)),
+                ('removed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
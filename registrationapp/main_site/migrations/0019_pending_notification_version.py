@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_site', '0018_removed_registrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingnotification',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
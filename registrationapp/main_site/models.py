@@ -1,7 +1,10 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.contrib.auth.base_user import BaseUserManager
-from django.db import models
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, router, transaction
 from django.core.mail import send_mail
+from django.utils import timezone
+from .matching import email_match_key, name_match_key, phone_match_key
 
 
 class UserType(models.TextChoices):
@@ -80,6 +83,18 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    # set on the users loaded from the cache by UserBackend, which are cached
+    # without the password hash
+    cached_session_auth_hash = None
+
+    def get_session_auth_hash(self):
+        if (
+            self.cached_session_auth_hash is not None
+            and "password" in self.get_deferred_fields()
+        ):
+            return self.cached_session_auth_hash
+        return super().get_session_auth_hash()
+
     def clean(self):
         super().clean()
         self.email = self.__class__.objects.normalize_email(self.email)
@@ -105,13 +120,33 @@ class RegistrationState(models.TextChoices):
     REJECTED = "rejected", "Rejected"
 
 
-class UserData(User):
-    user = models.OneToOneField(
-        User,
-        on_delete=models.CASCADE,
-        primary_key=True,
-        parent_link=True,
-    )
+# user-assigned ISO 3166 code for registrations with an unrecognized country
+UNKNOWN_COUNTRY_CODE = "ZZ"
+
+
+class Country(models.Model):
+    """ISO 3166-1 countries, identified by their alpha-2 code."""
+
+    code = models.CharField(max_length=2, primary_key=True)
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ["name"]
+        indexes = [
+            models.Index(fields=["name"], name="country_name_idx"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RegistrationData(models.Model):
+    """
+    The registration data of visitors and clients. It is stored in UserData
+    while the registration is in progress, and moved to ArchivedUserData
+    by the archive_registrations command long after it has finished.
+    """
+
     registration_type = models.CharField(
         max_length=255,
         choices=RegistrationType.choices,
@@ -134,16 +169,68 @@ class UserData(User):
         return RegistrationState(self.registration_state)
 
     orcid_id = models.CharField(max_length=255, blank=True, default="")
-    orcid_id_comment = models.TextField(blank=True, default="")
     name = models.CharField(max_length=255)
-    name_comment = models.TextField(blank=True, default="")
-    email_comment = models.TextField(blank=True, default="")
     phone_number = models.CharField(max_length=255)
-    phone_number_comment = models.TextField(blank=True, default="")
     company = models.CharField(max_length=255, blank=True, default="")
-    company_comment = models.TextField(blank=True, default="")
-    country_of_origin = models.CharField(max_length=255, blank=True, default="")
-    country_of_origin_comment = models.TextField(blank=True, default="")
+    country_of_origin = models.ForeignKey(
+        Country,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    # when the registration state was last changed
+    state_changed_at = models.DateTimeField(default=timezone.now)
+    # when the registration was approved or rejected
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def get_review_notes(self):
+        """
+        Returns the comments of the admins on the registration. If there are
+        none yet, a new unsaved ReviewNotes instance is returned.
+        """
+        try:
+            return self.user.review_notes
+        except ObjectDoesNotExist:
+            return ReviewNotes(
+                user=self.user, registration_type=self.registration_type
+            )
+
+
+class UserData(User, RegistrationData):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        parent_link=True,
+    )
+    # the admin reviewing the registration, until claimed_until
+    claimed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="claimed_registrations",
+    )
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    # the ETag of the ORCID record when the refresh_orcid_data command
+    # last requested it, for conditional requests
+    orcid_etag = models.CharField(max_length=255, blank=True, default="")
+    orcid_refreshed_at = models.DateTimeField(null=True, blank=True)
+    # Position in the change feed. A database trigger assigns the next value
+    # of a sequence when a transaction writing the registration commits, so
+    # the values become visible in increasing order. See migration 0013.
+    change_seq = models.BigIntegerField(null=True, unique=True, editable=False)
+    # normalized keys for finding the registrations of the same person,
+    # updated when the registration is saved
+    phone_match_key = models.CharField(max_length=255, blank=True, default="")
+    name_match_key = models.CharField(max_length=255, blank=True, default="")
+    email_match_key = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
@@ -160,9 +247,7 @@ class UserData(User):
                 | (
                     models.Q(
                         company="",
-                        company_comment="",
-                        country_of_origin="",
-                        country_of_origin_comment="",
+                        country_of_origin__isnull=True,
                     )
                 ),
                 name="visitor_allowed_fields_check",
@@ -172,15 +257,168 @@ class UserData(User):
                 | (
                     models.Q(
                         ~models.Q(company=""),
-                        ~models.Q(country_of_origin=""),
+                        country_of_origin__isnull=False,
                         orcid_id="",
-                        orcid_id_comment="",
                     )
                 ),
                 name="client_allowed_fields_check",
             ),
+            # partial unique index: only given ORCID iDs must be unique
+            models.UniqueConstraint(
+                fields=["orcid_id"],
+                condition=~models.Q(orcid_id=""),
+                name="orcid_id_unique",
+                violation_error_message="This ORCID iD is already registered.",
+            ),
+        ]
+        indexes = [
+            # finished registrations to archive
+            models.Index(
+                fields=["finished_at"],
+                condition=models.Q(finished_at__isnull=False),
+                name="userdata_finished_at_idx",
+            ),
+            # registrations waiting for the admins, for the admin digest
+            models.Index(
+                fields=["state_changed_at"],
+                condition=models.Q(
+                    registration_state__in=[
+                        RegistrationState.INITIAL,
+                        RegistrationState.WAITING_FOR_APPROVAL,
+                    ]
+                ),
+                name="userdata_pending_idx",
+            ),
+            # the sort orders of the admin list, with and without state filter
+            models.Index(
+                fields=["created_at", "user"],
+                name="userdata_created_at_idx",
+            ),
+            models.Index(
+                fields=["updated_at", "user"],
+                name="userdata_updated_at_idx",
+            ),
+            models.Index(
+                fields=["registration_state", "created_at", "user"],
+                name="userdata_state_created_at_idx",
+            ),
+            models.Index(
+                fields=["registration_state", "updated_at", "user"],
+                name="userdata_state_updated_at_idx",
+            ),
+            # the sort orders with the country filter, only clients have one
+            models.Index(
+                fields=["country_of_origin", "created_at", "user"],
+                condition=models.Q(country_of_origin__isnull=False),
+                name="userdata_country_created_idx",
+            ),
+            models.Index(
+                fields=["country_of_origin", "updated_at", "user"],
+                condition=models.Q(country_of_origin__isnull=False),
+                name="userdata_country_updated_idx",
+            ),
+            # duplicate candidates
+            models.Index(
+                fields=["phone_match_key"],
+                condition=~models.Q(phone_match_key=""),
+                name="userdata_phone_match_idx",
+            ),
+            models.Index(
+                fields=["name_match_key"],
+                condition=~models.Q(name_match_key=""),
+                name="userdata_name_match_idx",
+            ),
+            models.Index(
+                fields=["email_match_key"],
+                condition=~models.Q(email_match_key=""),
+                name="userdata_email_match_idx",
+            ),
+        ]
+
+    # the match keys and their labels; the ORCID iDs are unique already
+    MATCH_KEYS = {
+        "phone_match_key": "Phone number",
+        "name_match_key": "Name",
+        "email_match_key": "Email local part",
+    }
+
+    # the state and its start before the unsaved state change
+    _transition_from = None
+
+    def set_registration_state(self, state: RegistrationState):
+        """
+        Sets the registration state, and whether the registration has finished.
+        The transition is logged when the registration is saved.
+        """
+        if state != self.registration_state and self._transition_from is None:
+            self._transition_from = (self.registration_state, self.state_changed_at)
+        self.registration_state = state
+        self.state_changed_at = timezone.now()
+        if state in [RegistrationState.APPROVED, RegistrationState.REJECTED]:
+            self.finished_at = timezone.now()
+        else:
+            self.finished_at = None
+
+    def update_match_keys(self):
+        self.phone_match_key = phone_match_key(self.phone_number)
+        self.name_match_key = name_match_key(self.name)
+        self.email_match_key = email_match_key(self.email)
+
+    def get_duplicate_candidates(self, limit=20):
+        """
+        Returns the other registrations sharing a match key, with the labels
+        of the shared keys. Each key is looked up on its own index.
+        """
+        matches = models.Q()
+        for key in self.MATCH_KEYS:
+            if getattr(self, key):
+                matches |= models.Q(**{key: getattr(self, key)})
+        if not matches:
+            return []
+        candidates = (
+            UserData.objects.filter(matches)
+            .exclude(pk=self.pk)
+            .order_by("-created_at")[:limit]
+        )
+        return [
+            (
+                candidate,
+                [
+                    label
+                    for key, label in self.MATCH_KEYS.items()
+                    if getattr(self, key) and getattr(candidate, key) == getattr(self, key)
+                ],
+            )
+            for candidate in candidates
         ]
 
+    def save(self, *args, **kwargs):
+        self.update_match_keys()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"phone_number", "name", "email"} & set(
+            update_fields
+        ):
+            kwargs["update_fields"] = {*update_fields, *self.MATCH_KEYS}
+        if self._state.adding:
+            transition_from = ("", None)
+        else:
+            transition_from = self._transition_from
+        if transition_from is None:
+            return super().save(*args, **kwargs)
+        # the transition is logged in the same transaction as the state change
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            RegistrationTransition.objects.using(self._state.db).create(
+                user_id=self.pk,
+                registration_type=self.registration_type,
+                from_state=transition_from[0],
+                from_state_since=transition_from[1],
+                to_state=self.registration_state,
+                at=self.state_changed_at,
+            )
+        self._transition_from = None
+
     def is_editable_by_admin(self):
         return self.registration_state in [
             RegistrationState.INITIAL,
@@ -192,3 +430,217 @@ class UserData(User):
             RegistrationState.ADMIN_REQUESTED_MODIFY,
             RegistrationState.APPROVED,
         ]
+
+    def is_claimed_by_other(self, admin: User):
+        """Returns whether another admin is reviewing the registration."""
+        return (
+            self.claimed_by_id is not None
+            and self.claimed_by_id != admin.pk
+            and self.claimed_until > timezone.now()
+        )
+
+    def release_claim(self):
+        self.claimed_by = None
+        self.claimed_until = None
+
+
+class ArchivedUserData(RegistrationData):
+    """
+    Registration data of finished registrations, moved out of UserData by
+    the archive_registrations command. Archived registrations are read-only.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    @property
+    def email(self):
+        return self.user.email
+
+    def is_editable_by_admin(self):
+        return False
+
+    def is_editable_by_user(self):
+        return False
+
+
+class ReviewNotes(models.Model):
+    """
+    The comments of the admins on the fields of a registration. They are
+    stored apart from the registration data, because they are mostly empty
+    and only needed on the detail pages of a registration. The row belongs to
+    the user, so it is kept when the registration is archived.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="review_notes",
+    )
+    # copied from the registration, for the allowed comments checks; database
+    # triggers keep it equal to the type of the registration (migration 0016)
+    registration_type = models.CharField(
+        max_length=255,
+        choices=RegistrationType.choices,
+    )
+    orcid_id_comment = models.TextField(blank=True, default="")
+    name_comment = models.TextField(blank=True, default="")
+    email_comment = models.TextField(blank=True, default="")
+    phone_number_comment = models.TextField(blank=True, default="")
+    company_comment = models.TextField(blank=True, default="")
+    country_of_origin_comment = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(registration_type__in=RegistrationType.values),
+                name="review_notes_registration_type_check",
+            ),
+            models.CheckConstraint(
+                check=(~models.Q(registration_type=RegistrationType.VISITOR))
+                | models.Q(company_comment="", country_of_origin_comment=""),
+                name="visitor_allowed_comments_check",
+            ),
+            models.CheckConstraint(
+                check=(~models.Q(registration_type=RegistrationType.CLIENT))
+                | models.Q(orcid_id_comment=""),
+                name="client_allowed_comments_check",
+            ),
+        ]
+
+
+class RegistrationTransition(models.Model):
+    """
+    Append-only log of the registration state changes. The log belongs to
+    the user, so it is kept when the registration is archived.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="registration_transitions",
+    )
+    registration_type = models.CharField(
+        max_length=255,
+        choices=RegistrationType.choices,
+    )
+    # empty when the registration is created
+    from_state = models.CharField(
+        max_length=255,
+        choices=RegistrationState.choices,
+        blank=True,
+    )
+    # when the registration entered from_state
+    from_state_since = models.DateTimeField(null=True, blank=True)
+    to_state = models.CharField(
+        max_length=255,
+        choices=RegistrationState.choices,
+    )
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "at"], name="transition_user_at_idx"),
+            models.Index(fields=["to_state", "at"], name="transition_to_state_at_idx"),
+        ]
+
+
+class RegistrationStateDailyStats(models.Model):
+    """
+    Daily rollup of the registration transitions, maintained by the
+    rollup_registration_transitions command. The time spent in a state is
+    counted on the day the registration left the state.
+    """
+
+    day = models.DateField()
+    registration_type = models.CharField(
+        max_length=255,
+        choices=RegistrationType.choices,
+    )
+    registration_state = models.CharField(
+        max_length=255,
+        choices=RegistrationState.choices,
+    )
+    # number of registrations that entered and left the state on the day
+    entered = models.IntegerField(default=0)
+    left = models.IntegerField(default=0)
+    time_in_state_p50 = models.DurationField(null=True, blank=True)
+    time_in_state_p90 = models.DurationField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "registration_type", "registration_state"],
+                name="registration_state_daily_stats_unique",
+            ),
+        ]
+
+
+class JobCheckpoint(models.Model):
+    """
+    Stores the progress of a periodic job (e.g. a high-water mark),
+    so its runs are incremental.
+    """
+
+    name = models.CharField(max_length=255, primary_key=True)
+    value = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class NotificationType(models.TextChoices):
+    REGISTRATION_STATE_CHANGED = (
+        "registration_state_changed",
+        "Registration state changed",
+    )
+
+
+class PendingNotification(models.Model):
+    """
+    A notification email waiting for the end of its coalescing window.
+    The notifications of the same type to the user within the window are
+    sent as one email, with the data of the user at sending. Every queued
+    notification increases the version, so a notification queued while the
+    email is being sent is not deleted with the sent one.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    notification_type = models.CharField(
+        max_length=255, choices=NotificationType.choices
+    )
+    due_at = models.DateTimeField(db_index=True)
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "notification_type"],
+                name="pending_notification_unique",
+            ),
+        ]
+
+
+class RemovalReason(models.TextChoices):
+    ARCHIVED = "archived", "Archived"
+    DELETED = "deleted", "Deleted"
+
+
+class RemovedRegistration(models.Model):
+    """
+    A tombstone of a registration removed from UserData, so the change feed
+    can tell the downstream systems about it. The rows are inserted by a
+    database trigger, numbered in the same sequence as the changes.
+    """
+
+    # not a foreign key, the user may be deleted
+    user_id = models.BigIntegerField()
+    reason = models.CharField(max_length=255, choices=RemovalReason.choices)
+    change_seq = models.BigIntegerField(unique=True)
+    removed_at = models.DateTimeField(default=timezone.now)
@@ -2,10 +2,41 @@ from django.conf import settings
 from django.contrib.sessions.backends.base import SessionBase
 import requests
 import logging
+from .metrics import ORCID_REQUEST_ERRORS, ORCID_REQUEST_SECONDS
 
 logger = logging.getLogger()
 
 
+def orcid_api_request(endpoint: str, method: str, url: str, **kwargs):
+    """
+    Sends a request to the ORCID API and returns the decoded JSON response.
+    The duration and the failures are recorded in the metrics by endpoint.
+    """
+    with ORCID_REQUEST_SECONDS.time(endpoint=endpoint):
+        try:
+            return requests.request(method, url, **kwargs).json()
+        except (requests.RequestException, ValueError):
+            ORCID_REQUEST_ERRORS.inc(endpoint=endpoint)
+            raise
+
+
+def orcid_api_response(
+    endpoint: str, session: requests.Session, method: str, url: str, **kwargs
+):
+    """
+    Like orcid_api_request, but sends the request in the given session and
+    returns the response. HTTP error statuses raise HTTPError.
+    """
+    with ORCID_REQUEST_SECONDS.time(endpoint=endpoint):
+        try:
+            response = session.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response
+        except requests.RequestException:
+            ORCID_REQUEST_ERRORS.inc(endpoint=endpoint)
+            raise
+
+
 def find_orcid_email(orcid_email_data):
     """
     Returns the primary email address from the ORCID record's "email" field,
@@ -50,19 +81,54 @@ class PublicOrcidData:
         session["orcid_email"] = self.email
 
 
+def parse_person(orcid_id: str, res: dict):
+    """Returns the public data of an ORCID person record."""
+    name = (
+        f'{res["name"]["given-names"]["value"]} {res["name"]["family-name"]["value"]}'
+    )
+    email = find_orcid_email(res["emails"]["email"])
+    return PublicOrcidData(orcid_id, name, email)
+
+
+def get_person_url(orcid_id: str):
+    return f"{settings.ORCID_PUBLIC_API_URL}/v3.0/{orcid_id}/person"
+
+
 def request_public_orcid_data(orcid_id: str):
     """
     Calls the public ORCID endpoint to request user data.
     """
-    res = requests.get(
-        f"{settings.ORCID_PUBLIC_API_URL}/v3.0/{orcid_id}/person",
+    res = orcid_api_request(
+        "person",
+        "GET",
+        get_person_url(orcid_id),
         headers={"Accept": "application/json"},
-    ).json()
-    name = (
-        f'{res["name"]["given-names"]["value"]} {res["name"]["family-name"]["value"]}'
     )
-    email = find_orcid_email(res["emails"]["email"])
-    return PublicOrcidData(orcid_id, name, email)
+    return parse_person(orcid_id, res)
+
+
+def request_changed_public_orcid_data(
+    session: requests.Session, orcid_id: str, etag: str
+):
+    """
+    Requests the user data if the record changed since it had the given
+    ETag. Returns the data, or None if the record is unchanged, and the new
+    ETag of the record.
+    """
+    headers = {"Accept": "application/json"}
+    if etag:
+        headers["If-None-Match"] = etag
+    response = orcid_api_response(
+        "person",
+        session,
+        "GET",
+        get_person_url(orcid_id),
+        headers=headers,
+        timeout=settings.ORCID_REQUEST_TIMEOUT_SECONDS,
+    )
+    if response.status_code == 304:
+        return None, etag
+    return parse_person(orcid_id, response.json()), response.headers.get("ETag", "")
 
 
 class OrcidToken:
@@ -81,7 +147,9 @@ def exchange_token(code: str):
     the ORCID server responds with a one-time code. This function
     exchanges that code for a permanent token.
     """
-    result: dict = requests.post(
+    result: dict = orcid_api_request(
+        "token",
+        "POST",
         f"{settings.ORCID_URL}/oauth/token",
         headers={"Accept": "application/json"},
         data={
@@ -91,10 +159,11 @@ def exchange_token(code: str):
             "code": code,
             "redirect_uri": settings.ORCID_REDIRECT_URI,
         },
-    ).json()
+    )
     error = result.get("error")
     error_description = result.get("error_description")
     if error is not None:
+        ORCID_REQUEST_ERRORS.inc(endpoint="token")
         logger.error(
             "Error during ORCID exchange_token: %s, %s", error, error_description
         )
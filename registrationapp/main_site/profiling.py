@@ -0,0 +1,88 @@
+"""
+An on-demand sampling profiler for single requests.
+
+While a request is profiled, a background thread samples the stack of the
+thread serving the request. The samples are written in the collapsed stack
+format ("frame;frame;frame count" lines), which flame graph tools
+(flamegraph.pl, speedscope, inferno) read directly. The profiles are
+spooled to settings.PROFILING_DIR, and the oldest files are deleted when
+there are more than settings.PROFILING_MAX_FILES.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.core import signing
+
+TOKEN_SALT = "main_site.profiling"
+
+
+def create_token():
+    """Returns a signed token for the profiling header."""
+    return signing.dumps("profile", salt=TOKEN_SALT)
+
+
+def is_valid_token(token: str):
+    try:
+        signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def format_frame(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    # the collapsed format separates the frames with semicolons
+    return f"{module}:{code.co_name}:{frame.f_lineno}".replace(";", ":")
+
+
+class StackSampler:
+    """Samples the stack of a thread every interval seconds."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(format_frame(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def write_profile(sampler: StackSampler, url_name: str):
+    """Writes the profile to the spool. Returns the path of the file."""
+    spool = Path(settings.PROFILING_DIR)
+    spool.mkdir(parents=True, exist_ok=True)
+    tag = re.sub(r"[^A-Za-z0-9_-]", "_", url_name or "unresolved")
+    path = spool / f"{time.time_ns()}-{os.getpid()}-{tag}.folded"
+    path.write_text(sampler.collapsed())
+    profiles = sorted(spool.glob("*.folded"))
+    for old_profile in profiles[: -settings.PROFILING_MAX_FILES]:
+        old_profile.unlink(missing_ok=True)
+    return path
@@ -0,0 +1,111 @@
+"""
+Sliding window rate limits stored in Django's cache.
+
+A limit of "bucket size" requests and "refill per minute" allows bucket size
+requests in any window of bucket size / refill per minute minutes, i.e. the
+time it takes to refill a full bucket. A request counts against the window of
+the client's IP address and the window of the submitted email address, and it
+is rejected if either of them has more than bucket size requests.
+
+The requests are counted in fixed windows, and the sliding window is
+estimated from the count of the current window and the count of the previous
+window, weighted by the part of the previous window still in the sliding
+window. So a client using its whole limit at the end of a fixed window can
+not use it again right at the start of the next one.
+
+The counters are created with cache.add() and increased with cache.incr(),
+which are atomic in Redis and in the local memory cache, so concurrent
+requests can not exceed the limit. A rejected request is decreased from its
+counter again, so it does not count against the other limits.
+"""
+
+import hashlib
+import math
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest
+
+
+def _window_key(scope: str, kind: str, value: str, window: int):
+    digest = hashlib.sha256(value.encode()).hexdigest()
+    return f"ratelimit:{scope}:{kind}:{digest}:{window}"
+
+
+def get_window_seconds(bucket_size: int, refill_per_minute: float):
+    if refill_per_minute <= 0:
+        raise ImproperlyConfigured("The refilled tokens per minute must be positive.")
+    return max(1, math.ceil(bucket_size * 60 / refill_per_minute))
+
+
+def get_client_ip(request: HttpRequest):
+    return request.META.get(settings.RATE_LIMIT_IP_META_KEY, "")
+
+
+def _increment(key: str, timeout: int):
+    # incr() raises ValueError if the key expired since add()
+    for _ in range(3):
+        cache.add(key, 0, timeout)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            pass
+    return 1
+
+
+def _get_retry_after(
+    bucket_size: int, window_seconds: int, elapsed: float, previous: int, current: int
+):
+    """
+    Returns the seconds after which the estimate of the sliding window allows
+    a request, from the counts of the previous and current fixed windows.
+    """
+    if current < bucket_size:
+        # the weight of the previous window has to decrease
+        allowed_at = window_seconds * (1 - (bucket_size - current - 1) / previous)
+        return allowed_at - elapsed
+    # the current window becomes the previous one
+    allowed_at = window_seconds * max(0, 1 - (bucket_size - 1) / current)
+    return window_seconds - elapsed + allowed_at
+
+
+def consume(scope: str, request: HttpRequest, email: str | None = None):
+    """
+    Counts the request in the IP and email windows of the given scope.
+    Returns 0 if the request is allowed, or the number of seconds after which
+    the client should retry.
+    """
+    limits = settings.RATE_LIMITS.get(scope, {})
+    values = {"ip": get_client_ip(request)}
+    if email:
+        values["email"] = email.strip().casefold()
+    now = time.time()
+    retry_after = 0.0
+    keys = []
+    for kind, value in values.items():
+        if kind not in limits:
+            continue
+        bucket_size, refill_per_minute = limits[kind]
+        window_seconds = get_window_seconds(bucket_size, refill_per_minute)
+        window = int(now // window_seconds)
+        elapsed = now - window * window_seconds
+        key = _window_key(scope, kind, value, window)
+        # the counter is used until the end of the next window
+        count = _increment(key, math.ceil((window + 2) * window_seconds - now))
+        keys.append(key)
+        previous = cache.get(_window_key(scope, kind, value, window - 1), 0)
+        if previous * (1 - elapsed / window_seconds) + count > bucket_size:
+            retry_after = max(
+                retry_after,
+                _get_retry_after(
+                    bucket_size, window_seconds, elapsed, previous, count - 1
+                ),
+            )
+    if retry_after > 0:
+        for key in keys:
+            try:
+                cache.decr(key)
+            except ValueError:
+                pass
+    return retry_after
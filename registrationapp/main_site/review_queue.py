@@ -0,0 +1,42 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import RegistrationState, User, UserData
+
+
+def claim_next_registration(admin: User) -> UserData | None:
+    """
+    Claims the registration waiting the longest for review for the admin,
+    for REVIEW_CLAIM_LEASE_SECONDS. If the admin already has a claimed
+    registration, its lease is renewed instead. Returns None if no
+    registration is waiting.
+
+    Rows locked by other admins claiming at the same time are skipped,
+    so the admins never wait for each other or review the same registration.
+    """
+    now = timezone.now()
+    pending = UserData.objects.filter(
+        registration_state__in=[
+            RegistrationState.INITIAL,
+            RegistrationState.WAITING_FOR_APPROVAL,
+        ]
+    ).select_for_update(skip_locked=True, of=("self",))
+    with transaction.atomic():
+        user_data = (
+            pending.filter(claimed_by=admin, claimed_until__gt=now)
+            .order_by("state_changed_at")
+            .first()
+        )
+        if user_data is None:
+            unclaimed = Q(claimed_until__isnull=True) | Q(claimed_until__lte=now)
+            user_data = pending.filter(unclaimed).order_by("state_changed_at").first()
+        if user_data is None:
+            return None
+        user_data.claimed_by = admin
+        user_data.claimed_until = now + timedelta(
+            seconds=settings.REVIEW_CLAIM_LEASE_SECONDS
+        )
+        user_data.save(update_fields=["claimed_by", "claimed_until"])
+    return user_data
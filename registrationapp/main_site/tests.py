@@ -1,5 +1,79 @@
+import asyncio
+import json
+import os
+import runpy
+import smtplib
+import threading
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connection,
+    connections,
+    transaction,
+)
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+from registrationapp.pooled_postgresql.base import get_pool_stats
+from .backends import UserBackend, get_user_cache_key, user_to_cache
+from .db_routers import (
+    PrimaryReplicaRouter,
+    reset_request_state,
+    use_replica_for_reads,
+)
+from . import events, orcid, profiling, ratelimit, views
+from .mail import (
+    NOTIFICATION_EMAILS,
+    queue_registration_state_change_email,
+    registration_state_change_email,
+)
+from .metrics import Counter, Histogram, Registry, _process_start_time
+from .middleware import PRIMARY_PINNED_UNTIL_SESSION_KEY
+from .review_queue import claim_next_registration
+from .warmup import warm_up
+from .management.commands import refresh_orcid_data
+from .matching import email_match_key, name_match_key, phone_match_key
+from .forms import ClientRegistrationForm
+from .models import (
+    UNKNOWN_COUNTRY_CODE,
+    ArchivedUserData,
+    JobCheckpoint,
+    NotificationType,
+    PendingNotification,
+    RegistrationState,
+    RegistrationStateDailyStats,
+    RegistrationTransition,
+    RegistrationType,
+    ReviewNotes,
+    User,
+    UserData,
+    UserType,
+)
 
 
 class UsersManagersTests(TestCase):
@@ -42,3 +116,1451 @@ class UsersManagersTests(TestCase):
             User.objects.create_superuser(
                 email="super@user.com", password="foo", is_superuser=False
             )
+
+
+class ConnectionPoolTests(TransactionTestCase):
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.close()
+        stats = get_pool_stats()["default"]
+        self.assertLessEqual(stats["connections_num"], stats["pool_max"])
+        self.assertEqual(stats["connections_in_use"], 0)
+
+    def test_stats_view_requires_admin(self):
+        response = self.client.get(reverse("admin-db-pool-stats"))
+        self.assertEqual(response.status_code, 302)
+        admin = get_user_model().objects.create_superuser(
+            email="super@user.com", password="foo"
+        )
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin-db-pool-stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("saturation", response.json()["default"])
+
+
+@skipUnless(
+    settings.REPLICA_DATABASE_ALIAS in settings.DATABASES,
+    "No replica database is configured.",
+)
+class ReplicaRoutingTests(TestCase):
+    """
+    The test databases of the primary and the replica are independent,
+    so the replica only has the rows that are explicitly created in it.
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.replica = settings.REPLICA_DATABASE_ALIAS
+        # explicit keys, so the same user is logged in on both databases
+        for db in ("default", self.replica):
+            admin = User(
+                pk=1000,
+                email="admin@user.com",
+                is_admin=True,
+                user_type=UserType.ADMIN,
+            )
+            admin.save(using=db)
+            user_data = UserData(
+                pk=1001,
+                email="visitor@user.com",
+                user_type=UserType.VISITOR,
+                registration_type=RegistrationType.VISITOR,
+                registration_state=RegistrationState.ADMIN_REQUESTED_MODIFY,
+                name=f"Name on {db}",
+                phone_number="123",
+            )
+            user_data.save(using=db)
+        self.admin = admin
+        self.user_data = user_data
+
+    def tearDown(self):
+        reset_request_state()
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        reset_request_state()
+        self.assertEqual(router.db_for_read(UserData), "default")
+        use_replica_for_reads()
+        self.assertEqual(router.db_for_read(UserData), self.replica)
+        self.assertEqual(router.db_for_write(UserData), "default")
+        self.assertEqual(router.db_for_read(UserData), "default")
+
+    def test_admin_list_reads_replica_unless_pinned(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin-user-list"))
+        self.assertContains(response, "Name on replica")
+        session = self.client.session
+        session[PRIMARY_PINNED_UNTIL_SESSION_KEY] = time.time() + 60
+        session.save()
+        response = self.client.get(reverse("admin-user-list"))
+        self.assertContains(response, "Name on default")
+
+    def test_write_pins_session_to_primary(self):
+        self.client.force_login(self.user_data)
+        response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Name on replica")
+        self.client.post(
+            reverse("user-profile-edit"),
+            {"email": "visitor@user.com", "name": "Edited", "phone_number": "123"},
+        )
+        response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Edited")
+
+
+class MetricsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.enterContext(override_settings(METRICS_DIR=self.metrics_dir.name))
+        self.addCleanup(self.metrics_dir.cleanup)
+
+    def test_samples_of_processes_are_summed(self):
+        registry = Registry()
+        counter = Counter("test_total", "Test counter.", registry=registry)
+        histogram = Histogram(
+            "test_seconds", "Test histogram.", buckets=(0.1, 1), registry=registry
+        )
+        counter.inc(kind="a")
+        histogram.observe(0.5)
+        # the metrics file of another running worker process
+        parent_pid = os.getppid()
+        parent_file = f"{parent_pid}-{_process_start_time(parent_pid)}.json"
+        with open(Path(self.metrics_dir.name) / parent_file, "w") as file:
+            json.dump([["test_total", [["kind", "a"]], 2]], file)
+        output = registry.render()
+        self.assertIn('test_total{kind="a"} 3\n', output)
+        self.assertIn('test_seconds_bucket{le="0.1"} 0\n', output)
+        self.assertIn('test_seconds_bucket{le="1"} 1\n', output)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 1\n', output)
+        self.assertIn("test_seconds_count 1\n", output)
+
+    @skipUnless(Path("/proc/self/stat").exists(), "requires /proc")
+    def test_files_of_exited_processes_are_archived(self):
+        registry = Registry()
+        Counter("test_total", "Test counter.", registry=registry).inc()
+        # an exited process that had the same pid as this one
+        exited_path = Path(self.metrics_dir.name) / f"{os.getpid()}-0.json"
+        with open(exited_path, "w") as file:
+            json.dump([["test_total", [], 2]], file)
+        self.assertIn("test_total 3\n", registry.render())
+        self.assertFalse(exited_path.exists())
+        self.assertTrue((Path(self.metrics_dir.name) / "archive.json").exists())
+        # the archived samples are counted once
+        self.assertIn("test_total 3\n", registry.render())
+
+    def test_metrics_view(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_TOKEN="secret"):
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, 'main_site_registrations{registration_state="initial"} 0'
+        )
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.profiling_dir = tempfile.TemporaryDirectory()
+        self.enterContext(
+            override_settings(
+                PROFILING_DIR=self.profiling_dir.name, PROFILING_MAX_FILES=2
+            )
+        )
+        self.addCleanup(self.profiling_dir.cleanup)
+        self.admin = User.objects.create_superuser(email="admin@user.com")
+
+    def get_profile_names(self):
+        return sorted(path.name for path in Path(self.profiling_dir.name).iterdir())
+
+    def test_admins_can_profile_requests(self):
+        self.client.get(reverse("login"), {"profile": ""})
+        self.assertEqual(self.get_profile_names(), [])
+        self.client.force_login(self.admin)
+        self.client.get(reverse("admin-user-list"), {"profile": ""})
+        [name] = self.get_profile_names()
+        self.assertTrue(name.endswith("-admin-user-list.folded"))
+        for line in (Path(self.profiling_dir.name) / name).read_text().splitlines():
+            self.assertRegex(line, r"^\S+ \d+$")
+
+    def test_signed_header_and_spool_size(self):
+        self.client.get(reverse("home"), HTTP_X_PROFILE_TOKEN="invalid")
+        self.assertEqual(self.get_profile_names(), [])
+        for _ in range(3):
+            self.client.get(
+                reverse("home"), HTTP_X_PROFILE_TOKEN=profiling.create_token()
+            )
+        self.assertEqual(len(self.get_profile_names()), 2)
+
+
+class WarmUpTests(TransactionTestCase):
+    # the warm-up returns the connection to the pool, which would roll back
+    # the transaction of a TestCase
+
+    def test_warm_up_stages_succeed(self):
+        with self.assertLogs(level="INFO") as logs:
+            warm_up()
+        messages = [record.getMessage() for record in logs.records]
+        self.assertEqual(
+            [message.split(" took ")[0] for message in messages],
+            [
+                "Worker warm-up stage warm_up_urls",
+                "Worker warm-up stage warm_up_templates",
+                "Worker warm-up stage warm_up_forms",
+                "Worker warm-up stage warm_up_database",
+            ],
+        )
+
+    def test_gunicorn_workers_are_warmed_up(self):
+        config = runpy.run_path(str(settings.BASE_DIR / "gunicorn.conf.py"))
+        with mock.patch("main_site.warmup.warm_up") as warm_up:
+            config["post_worker_init"](mock.Mock())
+        warm_up.assert_called_once_with()
+
+
+@override_settings(
+    RATE_LIMITS={
+        "login": {"ip": (3, 1), "email": (2, 1)},
+        "register": {"ip": (1, 1)},
+    }
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_login_is_limited_by_email(self):
+        for _ in range(2):
+            response = self.client.post(
+                reverse("login"), {"username": "a@user.com", "password": "x"}
+            )
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(
+            reverse("login"), {"username": " A@user.com", "password": "x"}
+        )
+        self.assertEqual(response.status_code, 429)
+        # the email window is 2 / 1 minutes, and the 2 requests are counted
+        # in the previous fixed window for half of the next one
+        self.assertIn(int(response["Retry-After"]), range(1, 181))
+        # another email from the same IP still has tokens
+        response = self.client.post(
+            reverse("login"), {"username": "b@user.com", "password": "x"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_registration_is_limited_by_ip(self):
+        self.client.post(reverse("register-client"), {"email": "a@user.com"})
+        response = self.client.post(
+            reverse("register-client"), {"email": "b@user.com"}
+        )
+        self.assertEqual(response.status_code, 429)
+        # GET requests are not limited
+        response = self.client.get(reverse("register-client"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_concurrent_requests_do_not_exceed_the_limit(self):
+        request = RequestFactory().post("/")
+        barrier = threading.Barrier(8)
+
+        def consume():
+            barrier.wait()
+            return ratelimit.consume("login", request, "a@user.com")
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: consume(), range(8)))
+        # the email limit is 2 requests per window
+        self.assertEqual(results.count(0), 2)
+
+    @override_settings(RATE_LIMITS={"login": {"ip": (3, 1)}})
+    def test_limit_is_not_doubled_at_window_boundary(self):
+        request = RequestFactory().post("/")
+        # the window is 3 minutes
+        start = 180 * 1000
+        with mock.patch("main_site.ratelimit.time.time", return_value=start + 179):
+            for _ in range(3):
+                self.assertEqual(ratelimit.consume("login", request), 0)
+        with mock.patch("main_site.ratelimit.time.time", return_value=start + 181):
+            retry_after = ratelimit.consume("login", request)
+        # a third of the previous window is outside the sliding window
+        self.assertAlmostEqual(retry_after, 59)
+        with mock.patch("main_site.ratelimit.time.time", return_value=start + 240):
+            self.assertEqual(ratelimit.consume("login", request), 0)
+            self.assertGreater(ratelimit.consume("login", request), 0)
+
+    def test_refill_must_be_positive(self):
+        with override_settings(RATE_LIMITS={"login": {"ip": (3, 0)}}):
+            with self.assertRaises(ImproperlyConfigured):
+                ratelimit.consume("login", RequestFactory().post("/"))
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_csrf_token(self, response):
+        content = response.content.decode()
+        start = content.index('name="csrfmiddlewaretoken" value="') + 34
+        return content[start : content.index('"', start)]
+
+    def test_cache_hit_inserts_csrf_token(self):
+        self.client.get(reverse("login"))
+        client = self.client_class(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            response = client.get(reverse("login"))
+        self.assertTemplateNotUsed(response, "main_site/login.html")
+        token = self.get_csrf_token(response)
+        self.assertNotIn("placeholder", token)
+        # the inserted token is accepted
+        response = client.post(
+            reverse("login"),
+            {"username": "a@user.com", "password": "x", "csrfmiddlewaretoken": token},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_requests_with_messages_are_not_cached(self):
+        self.client.get(reverse("register-visitor"))
+        self.client.cookies[CookieStorage.cookie_name] = "message"
+        response = self.client.get(reverse("register-visitor"))
+        self.assertTemplateUsed(response, "main_site/register_visitor.html")
+
+    def test_unknown_query_parameters_bypass_the_cache(self):
+        self.client.get(reverse("login"), {"next": "/profile/"})
+        response = self.client.get(reverse("login"), {"next": "/profile/"})
+        self.assertTemplateNotUsed(response, "main_site/login.html")
+        for _ in range(2):
+            response = self.client.get(reverse("login"), {"x": "1"})
+            self.assertTemplateUsed(response, "main_site/login.html")
+
+
+class OrcidRegistrationTests(TestCase):
+    orcid_id = "0000-0002-1825-0097"
+
+    def create_visitor(self, email, orcid_id):
+        return UserData.objects.create(
+            email=email,
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+            orcid_id=orcid_id,
+        )
+
+    def test_orcid_id_is_unique_when_given(self):
+        self.create_visitor("a@user.com", "")
+        self.create_visitor("b@user.com", "")
+        self.create_visitor("c@user.com", self.orcid_id)
+        with self.assertRaises(IntegrityError):
+            self.create_visitor("d@user.com", self.orcid_id)
+
+    def test_registered_orcid_id_skips_person_request(self):
+        self.create_visitor("a@user.com", self.orcid_id)
+        token = orcid.OrcidToken(self.orcid_id, "token")
+        with mock.patch.object(
+            orcid, "exchange_token", return_value=token
+        ), mock.patch.object(orcid, "request_public_orcid_data") as request_data:
+            response = self.client.get(reverse("register-orcid"), {"code": "x"})
+        self.assertRedirects(response, reverse("login"))
+        request_data.assert_not_called()
+        self.assertIsNone(orcid.PublicOrcidData.from_session(self.client.session))
+
+    def test_concurrently_registered_orcid_id_is_a_form_error(self):
+        session = self.client.session
+        orcid.PublicOrcidData(self.orcid_id, "Visitor", None).save_to_session(session)
+        session.save()
+        self.create_visitor("a@user.com", self.orcid_id)
+        # registered after the check of the view
+        with mock.patch.object(QuerySet, "exists", return_value=False):
+            response = self.client.post(
+                reverse("register-visitor"),
+                {
+                    "action": "register",
+                    "email": "b@user.com",
+                    "name": "Visitor",
+                    "phone_number": "123",
+                    "password1": "Secret-password-1",
+                    "password2": "Secret-password-1",
+                },
+            )
+        self.assertContains(response, "This ORCID iD is already registered.")
+        self.assertFalse(User.objects.filter(email="b@user.com").exists())
+
+
+class FakeOrcidServer(ThreadingHTTPServer):
+    """A local fake of the public ORCID API, with ETags."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOrcidRequestHandler)
+        # the name, email and ETag of the records by ORCID iD
+        self.records = {}
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeOrcidRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        orcid_id = self.path.split("/")[2]
+        etag = self.headers.get("If-None-Match")
+        self.server.requests.append((orcid_id, etag))
+        record = self.server.records.get(orcid_id)
+        if record is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        given_name, family_name, email, record_etag = record
+        if etag == record_etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(
+            {
+                "name": {
+                    "given-names": {"value": given_name},
+                    "family-name": {"value": family_name},
+                },
+                "emails": {"email": [{"email": email, "primary": True}]},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", record_etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OrcidRefreshTests(TestCase):
+    def setUp(self):
+        self.server = FakeOrcidServer()
+        self.addCleanup(self.server.stop)
+        self.enterContext(override_settings(ORCID_PUBLIC_API_URL=self.server.url))
+        self.visitors = [
+            UserData.objects.create(
+                email=f"visitor{i}@user.com",
+                user_type=UserType.VISITOR,
+                registration_type=RegistrationType.VISITOR,
+                name=f"Visitor {i}",
+                phone_number="123",
+                orcid_id=f"0000-0000-0000-000{i}",
+            )
+            for i in range(3)
+        ]
+        self.server.records = {
+            "0000-0000-0000-0000": ("Visitor", "0", "visitor0@user.com", '"a"'),
+            "0000-0000-0000-0001": ("Renamed", "Visitor", "new@user.com", '"b"'),
+        }
+
+    def refresh(self):
+        call_command("refresh_orcid_data", "--rate", "1000", stdout=StringIO())
+
+    def test_refresh(self):
+        with self.assertLogs(level="WARNING"):
+            self.refresh()
+        visitors = UserData.objects.in_bulk()
+        self.assertEqual(visitors[self.visitors[0].pk].name, "Visitor 0")
+        self.assertEqual(visitors[self.visitors[0].pk].orcid_etag, '"a"')
+        self.assertEqual(visitors[self.visitors[1].pk].name, "Renamed Visitor")
+        self.assertEqual(visitors[self.visitors[1].pk].email, "new@user.com")
+        # the record missing from ORCID is tried again in the next run
+        self.assertIsNone(visitors[self.visitors[2].pk].orcid_refreshed_at)
+        self.server.requests.clear()
+        with self.assertLogs(level="WARNING"):
+            self.refresh()
+        self.assertEqual(
+            sorted(self.server.requests),
+            [
+                ("0000-0000-0000-0000", '"a"'),
+                ("0000-0000-0000-0001", '"b"'),
+                ("0000-0000-0000-0002", None),
+            ],
+        )
+
+    def test_interrupted_refresh_is_continued(self):
+        JobCheckpoint.objects.create(
+            name="orcid_refresh", value={"last_id": self.visitors[1].pk}
+        )
+        with self.assertLogs(level="WARNING"):
+            self.refresh()
+        self.assertEqual(self.server.requests, [("0000-0000-0000-0002", None)])
+        self.assertFalse(JobCheckpoint.objects.filter(name="orcid_refresh").exists())
+
+    def test_concurrently_edited_registration_is_skipped(self):
+        write_back = refresh_orcid_data.Command.write_back
+
+        def edit_and_write_back(command, *args):
+            # edited by the user while the records were requested
+            UserData.objects.filter(pk=self.visitors[1].pk).update(
+                name="Edited", updated_at=timezone.now()
+            )
+            return write_back(command, *args)
+
+        out = StringIO()
+        with mock.patch.object(
+            refresh_orcid_data.Command,
+            "write_back",
+            autospec=True,
+            side_effect=edit_and_write_back,
+        ), self.assertLogs(level="WARNING"):
+            call_command("refresh_orcid_data", "--rate", "1000", stdout=out)
+        self.assertIn("1 skipped", out.getvalue())
+        visitor = UserData.objects.get(pk=self.visitors[1].pk)
+        self.assertEqual(visitor.name, "Edited")
+        # requested again by the next run
+        self.assertEqual(visitor.orcid_etag, "")
+
+    def test_taken_email_is_not_changed(self):
+        User.objects.create_user(
+            email="new@user.com", password="foo", user_type=UserType.VISITOR
+        )
+        with self.assertLogs(level="WARNING") as logs:
+            self.refresh()
+        self.assertIn("is used by another user", "\n".join(logs.output))
+        visitor = UserData.objects.get(pk=self.visitors[1].pk)
+        self.assertEqual(visitor.name, "Renamed Visitor")
+        self.assertEqual(visitor.email, "visitor1@user.com")
+
+
+class RegistrationFieldValidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("register-client-validate-field")
+
+    def test_email_uniqueness(self):
+        response = self.client.post(self.url, {"field": "email", "email": "a@b.com"})
+        self.assertEqual(
+            response.json(), {"field": "email", "valid": True, "errors": []}
+        )
+        User.objects.create_user(
+            email="a@b.com", password="foo", user_type=UserType.CLIENT
+        )
+        with self.assertNumQueries(1):
+            response = self.client.post(
+                self.url, {"field": "email", "email": "a@B.COM"}
+            )
+        self.assertEqual(
+            response.json()["errors"], ["A user with that email already exists."]
+        )
+
+    @override_settings(RATE_LIMITS={"validate_field": {"ip": (2, 1)}})
+    def test_email_checks_are_rate_limited(self):
+        for email in ["a@b.com", "b@b.com"]:
+            response = self.client.post(self.url, {"field": "email", "email": email})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(self.url, {"field": "email", "email": "c@b.com"})
+        self.assertEqual(response.status_code, 429)
+
+    def test_password_fields(self):
+        response = self.client.post(
+            self.url, {"field": "password1", "password1": "12345678"}
+        )
+        self.assertFalse(response.json()["valid"])
+        response = self.client.post(
+            self.url,
+            {"field": "password2", "password1": "abc", "password2": "abd"},
+        )
+        self.assertFalse(response.json()["valid"])
+
+    def test_unknown_field(self):
+        response = self.client.post(self.url, {"field": "is_admin"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveRegistrationsTests(TestCase):
+    def create_visitor(self, email, state, finished_days_ago):
+        user_data = UserData(
+            email=email,
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+        )
+        user_data.set_registration_state(state)
+        if finished_days_ago is not None:
+            user_data.finished_at = timezone.now() - timedelta(days=finished_days_ago)
+        user_data.save()
+        return user_data
+
+    def test_archive(self):
+        old = self.create_visitor("old@user.com", RegistrationState.REJECTED, 400)
+        self.create_visitor("new@user.com", RegistrationState.APPROVED, 10)
+        self.create_visitor("open@user.com", RegistrationState.INITIAL, None)
+        out = StringIO()
+        call_command(
+            "archive_registrations", "--batch-size=1", "--sleep=0", stdout=out
+        )
+        self.assertIn("Archived 1 registrations.", out.getvalue())
+        self.assertEqual(
+            set(UserData.objects.values_list("email", flat=True)),
+            {"new@user.com", "open@user.com"},
+        )
+        archived = ArchivedUserData.objects.get()
+        self.assertEqual(archived.pk, old.pk)
+        self.assertEqual(archived.registration_state, RegistrationState.REJECTED)
+        # the user can still log in and view the registration
+        self.assertTrue(User.objects.filter(pk=old.pk).exists())
+        self.client.force_login(User.objects.get(pk=old.pk))
+        response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "This registration was archived")
+        self.assertNotContains(response, "Modify profile")
+
+    def test_admin_details_of_archived_registration(self):
+        old = self.create_visitor("old@user.com", RegistrationState.APPROVED, 400)
+        call_command("archive_registrations", "--sleep=0", stdout=StringIO())
+        admin = User.objects.create_superuser(email="super@user.com", password="foo")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin-user-details", args=[old.pk]))
+        self.assertContains(response, "This registration was archived")
+
+
+class ClearExpiredSessionsTests(TestCase):
+    def test_expired_sessions_are_deleted_in_batches(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(
+                session_key=f"expired{i}",
+                session_data="",
+                expire_date=now - timedelta(days=i + 1),
+            )
+        Session.objects.create(
+            session_key="active", session_data="", expire_date=now + timedelta(days=1)
+        )
+        out = StringIO()
+        call_command("clear_expired_sessions", "--batch-size=2", "--sleep=0", stdout=out)
+        self.assertIn("Deleted 4 expired sessions...", out.getvalue())
+        self.assertIn("Deleted 5 expired sessions.", out.getvalue())
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)), ["active"]
+        )
+
+
+class ReviewNotesTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@user.com")
+        self.user_data = UserData.objects.create(
+            email="visitor@user.com",
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+        )
+
+    def test_admin_comments_are_stored_in_review_notes(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin-user-edit", kwargs={"id": self.user_data.pk})
+        self.client.post(url, {"action": "request_modify"})
+        # no comments, no review notes
+        self.assertFalse(ReviewNotes.objects.exists())
+        self.user_data.set_registration_state(RegistrationState.INITIAL)
+        self.user_data.save()
+        self.client.post(
+            url, {"action": "request_modify", "name_comment": "Full name, please"}
+        )
+        notes = ReviewNotes.objects.get()
+        self.assertEqual(notes.user_id, self.user_data.pk)
+        self.assertEqual(notes.name_comment, "Full name, please")
+        self.assertEqual(
+            UserData.objects.get().registration_state,
+            RegistrationState.ADMIN_REQUESTED_MODIFY,
+        )
+        self.client.force_login(self.user_data)
+        response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Full name, please")
+
+    def test_visitor_comments_are_checked(self):
+        with self.assertRaises(IntegrityError):
+            ReviewNotes.objects.create(
+                user=self.user_data.user,
+                registration_type=RegistrationType.VISITOR,
+                company_comment="Visitors have no company",
+            )
+
+    def test_registration_type_is_kept_in_sync(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ReviewNotes.objects.create(
+                user=self.user_data.user, registration_type=RegistrationType.CLIENT
+            )
+        ReviewNotes.objects.create(
+            user=self.user_data.user,
+            registration_type=RegistrationType.VISITOR,
+            orcid_id_comment="Wrong ORCID iD",
+        )
+        self.user_data.registration_type = RegistrationType.CLIENT
+        self.user_data.company = "Company"
+        self.user_data.country_of_origin_id = "HU"
+        # the ORCID iD comment is not allowed for clients
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.user_data.save()
+        ReviewNotes.objects.update(orcid_id_comment="")
+        self.user_data.save()
+        self.assertEqual(
+            ReviewNotes.objects.get().registration_type, RegistrationType.CLIENT
+        )
+
+
+class RegistrationEventsTests(TransactionTestCase):
+    def create_visitor(self, email):
+        return UserData.objects.create(
+            email=email,
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+        )
+
+    @mock.patch.object(views.RegistrationEventsView, "MAX_SECONDS", 1)
+    async def test_user_receives_own_events(self):
+        user_data = await sync_to_async(self.create_visitor)("own@user.com")
+        other = await sync_to_async(self.create_visitor)("other@user.com")
+        await sync_to_async(self.async_client.force_login)(user_data)
+        response = await self.async_client.get(reverse("user-registration-events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+        for registration in (other, user_data):
+            registration.set_registration_state(RegistrationState.APPROVED)
+            await sync_to_async(events.publish_registration_change)(registration)
+        message = (await asyncio.wait_for(anext(stream), 5)).decode()
+        self.assertTrue(message.startswith("event: registration\n"))
+        data = json.loads(message.split("data: ")[1])
+        self.assertEqual(data["user_id"], user_data.pk)
+        self.assertEqual(data["registration_state"], RegistrationState.APPROVED)
+        # the stream ends after MAX_SECONDS
+        async for part in stream:
+            self.assertEqual(part, b": keep-alive\n\n")
+
+    def test_events_need_asgi(self):
+        self.client.force_login(self.create_visitor("visitor@user.com"))
+        response = self.client.get(reverse("user-registration-events"))
+        self.assertEqual(response.status_code, 204)
+
+
+class ReviewQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.admins = [
+            User.objects.create_superuser(email=f"admin{i}@user.com")
+            for i in range(2)
+        ]
+        self.registrations = [
+            UserData.objects.create(
+                email=f"visitor{i}@user.com",
+                user_type=UserType.VISITOR,
+                registration_type=RegistrationType.VISITOR,
+                name="Visitor",
+                phone_number="123",
+                state_changed_at=timezone.now() - timedelta(hours=3 - i),
+            )
+            for i in range(3)
+        ]
+
+    def review_next(self, admin):
+        self.client.force_login(admin)
+        response = self.client.post(reverse("admin-review-next"))
+        return response.url
+
+    def edit_url(self, user_data):
+        return reverse("admin-user-edit", kwargs={"id": user_data.pk})
+
+    def test_admins_are_given_different_registrations(self):
+        first, second, third = self.registrations
+        self.assertEqual(self.review_next(self.admins[0]), self.edit_url(first))
+        self.assertEqual(self.review_next(self.admins[1]), self.edit_url(second))
+        # the own claim is given again until it is finished
+        self.assertEqual(self.review_next(self.admins[0]), self.edit_url(first))
+        response = self.client.get(self.edit_url(second))
+        self.assertContains(response, "admin1@user.com is reviewing")
+        # finishing the review releases the claim
+        self.client.post(self.edit_url(first), {"action": "approve"})
+        self.assertIsNone(UserData.objects.get(pk=first.pk).claimed_by)
+        # expired claims are given to other admins
+        UserData.objects.filter(pk=second.pk).update(claimed_until=timezone.now())
+        self.assertEqual(self.review_next(self.admins[0]), self.edit_url(second))
+
+    def test_locked_registrations_are_skipped(self):
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            other.set_autocommit(False)
+            with other.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM main_site_userdata WHERE user_id = %s FOR UPDATE",
+                    [self.registrations[0].pk],
+                )
+            user_data = claim_next_registration(self.admins[0])
+            self.assertEqual(user_data.pk, self.registrations[1].pk)
+        finally:
+            other.rollback()
+            other.close()
+
+
+class RegistrationTransitionTests(TestCase):
+    def test_transitions_are_logged_and_rolled_up(self):
+        user_data = UserData.objects.create(
+            email="visitor@user.com",
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+        )
+        user_data.set_registration_state(RegistrationState.APPROVED)
+        user_data.save()
+        created, approved = RegistrationTransition.objects.order_by("id")
+        self.assertEqual(created.from_state, "")
+        self.assertEqual(created.to_state, RegistrationState.INITIAL)
+        self.assertEqual(approved.from_state, RegistrationState.INITIAL)
+        self.assertEqual(approved.from_state_since, created.at)
+        # the transitions happened two hours apart, yesterday
+        yesterday = timezone.now() - timedelta(days=1)
+        yesterday = yesterday.replace(hour=10, minute=0, second=0, microsecond=0)
+        RegistrationTransition.objects.filter(pk=created.pk).update(at=yesterday)
+        RegistrationTransition.objects.filter(pk=approved.pk).update(
+            from_state_since=yesterday, at=yesterday + timedelta(hours=2)
+        )
+        call_command("rollup_registration_transitions", stdout=StringIO())
+        stats = {
+            stats.registration_state: stats
+            for stats in RegistrationStateDailyStats.objects.filter(
+                day=yesterday.date(), registration_type=RegistrationType.VISITOR
+            )
+        }
+        self.assertEqual(stats[RegistrationState.INITIAL].entered, 1)
+        self.assertEqual(stats[RegistrationState.INITIAL].left, 1)
+        self.assertEqual(
+            stats[RegistrationState.INITIAL].time_in_state_p50, timedelta(hours=2)
+        )
+        self.assertEqual(stats[RegistrationState.APPROVED].entered, 1)
+        # only the new transitions are processed
+        out = StringIO()
+        call_command("rollup_registration_transitions", stdout=out)
+        self.assertIn("No new transitions.", out.getvalue())
+
+    def test_transition_committed_after_the_rollup_is_rolled_up(self):
+        user_data = UserData.objects.create(
+            email="visitor@user.com",
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+        )
+        created = RegistrationTransition.objects.get()
+        user_data.set_registration_state(RegistrationState.APPROVED)
+        user_data.save()
+        # the creation was still uncommitted, with a lower id and an earlier
+        # time, when the approval was rolled up
+        created.delete()
+        call_command("rollup_registration_transitions", stdout=StringIO())
+        created.save(force_insert=True)
+        call_command("rollup_registration_transitions", stdout=StringIO())
+        stats = RegistrationStateDailyStats.objects.get(
+            day=timezone.localdate(created.at),
+            registration_type=RegistrationType.VISITOR,
+            registration_state=RegistrationState.INITIAL,
+        )
+        self.assertEqual(stats.entered, 1)
+
+
+class AdminUserListSortTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@user.com")
+        now = timezone.now()
+        for i in range(3):
+            user_data = UserData.objects.create(
+                email=f"visitor{i}@user.com",
+                user_type=UserType.VISITOR,
+                registration_type=RegistrationType.VISITOR,
+                name=f"Visitor {i}",
+                phone_number="123",
+            )
+            # created in order, modified in reverse order
+            UserData.objects.filter(pk=user_data.pk).update(
+                created_at=now - timedelta(days=3 - i),
+                updated_at=now - timedelta(days=i),
+            )
+        for i, country in enumerate(["HU", "DE", "HU"]):
+            user_data = UserData.objects.create(
+                email=f"client{i}@user.com",
+                user_type=UserType.CLIENT,
+                registration_type=RegistrationType.CLIENT,
+                name=f"Client {i}",
+                phone_number="123",
+                company="Company",
+                country_of_origin_id=country,
+            )
+            UserData.objects.filter(pk=user_data.pk).update(
+                created_at=now - timedelta(days=10 - i),
+                updated_at=now - timedelta(days=10 + i),
+            )
+
+    def get_names(self, sort, **filters):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse("admin-user-list"), {"sort": sort, **filters}
+        )
+        return [user_data.name for user_data in response.context["object_list"]]
+
+    def test_sorts(self):
+        self.assertEqual(
+            self.get_names("newest"), ["Visitor 2", "Visitor 1", "Visitor 0"]
+        )
+        self.assertEqual(
+            self.get_names("recently_modified"),
+            ["Visitor 0", "Visitor 1", "Visitor 2"],
+        )
+        response = self.client.get(reverse("admin-user-list"), {"sort": "name"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sorts_with_country_filter(self):
+        self.assertEqual(
+            self.get_names("newest", country="HU"), ["Client 2", "Client 0"]
+        )
+        self.assertEqual(
+            self.get_names("recently_modified", country="HU"),
+            ["Client 0", "Client 2"],
+        )
+        response = self.client.get(reverse("admin-user-list"), {"country": "XX"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sorts_are_index_scans(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for _, ordering in views.AdminUserListView.SORTS.values():
+            queryset = UserData.objects.order_by(*ordering)
+            for filtered in [
+                queryset,
+                queryset.filter(registration_state=RegistrationState.INITIAL),
+                queryset.filter(country_of_origin="HU"),
+            ]:
+                plan = filtered[:3].explain()
+                self.assertNotIn("Sort", plan)
+                self.assertIn("userdata_", plan)
+
+
+class GenerateRegistrationsTests(TestCase):
+    def test_every_type_and_state_is_generated(self):
+        out = StringIO()
+        call_command(
+            "generate_registrations",
+            "--count=25",
+            "--batch-size=10",
+            "--password=foo",
+            stdout=out,
+        )
+        self.assertIn("Generated 25 registrations.", out.getvalue())
+        self.assertEqual(
+            set(
+                UserData.objects.values_list("registration_type", "registration_state")
+            ),
+            {
+                (registration_type, state)
+                for registration_type in RegistrationType.values
+                for state in RegistrationState.values
+            },
+        )
+        user_data = UserData.objects.filter(
+            registration_state=RegistrationState.APPROVED
+        ).first()
+        self.assertEqual(user_data.finished_at, user_data.state_changed_at)
+        self.assertTrue(self.client.login(email=user_data.email, password="foo"))
+
+
+class CountryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@user.com")
+        for i, country in enumerate(["HU", "HU", "DE"]):
+            UserData.objects.create(
+                email=f"client{i}@user.com",
+                user_type=UserType.CLIENT,
+                registration_type=RegistrationType.CLIENT,
+                name=f"Client {i}",
+                phone_number="123",
+                company="Company",
+                country_of_origin_id=country,
+            )
+
+    def test_registration_form_choices(self):
+        choices = ClientRegistrationForm().fields["country_of_origin"].queryset
+        self.assertTrue(choices.filter(code="HU").exists())
+        self.assertFalse(choices.filter(code=UNKNOWN_COUNTRY_CODE).exists())
+
+    def test_country_filter_and_stats(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin-user-list"), {"country": "HU"})
+        self.assertEqual(
+            sorted(user_data.name for user_data in response.context["object_list"]),
+            ["Client 0", "Client 1"],
+        )
+        response = self.client.get(reverse("admin-user-list"), {"country": "XX"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("admin-country-stats"))
+        self.assertEqual(
+            [
+                (row["country"].code, row["count"])
+                for row in response.context["country_counts"]
+            ],
+            [("HU", 2), ("DE", 1)],
+        )
+
+
+class DuplicateDetectionTests(TestCase):
+    def create_visitor(self, email, name, phone_number):
+        return UserData.objects.create(
+            email=email,
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name=name,
+            phone_number=phone_number,
+        )
+
+    def test_match_keys(self):
+        self.assertEqual(phone_match_key("+36 (20) 123-4567"), "+36201234567")
+        self.assertEqual(phone_match_key("0036 20 123 4567"), "+36201234567")
+        self.assertEqual(phone_match_key("123"), "")
+        with override_settings(PHONE_DEFAULT_CALLING_CODE="44"):
+            self.assertEqual(phone_match_key("020 7946 0000"), "+442079460000")
+        self.assertEqual(name_match_key("  Ádám   KOVÁCS "), "adam kovacs")
+        self.assertEqual(email_match_key("Adam.Kovacs+work@Example.com"), "adam.kovacs")
+
+    def test_candidates_and_report(self):
+        user_data = self.create_visitor("adam@a.com", "Ádám Kovács", "+36 20 123 4567")
+        same_phone = self.create_visitor("other@b.com", "Other", "0036201234567")
+        same_name_and_email = self.create_visitor("adam+x@b.com", "adam kovacs", "")
+        self.create_visitor("unrelated@c.com", "Unrelated", "")
+        user_data.phone_number = "+36 30 000 0000"
+        user_data.save(update_fields=["phone_number"])
+        user_data.phone_number = "+36 20 123 4567"
+        user_data.save(update_fields=["phone_number"])
+        self.assertEqual(
+            UserData.objects.get(pk=user_data.pk).phone_match_key, "+36201234567"
+        )
+        self.assertEqual(
+            sorted(
+                (candidate.pk, matched_keys)
+                for candidate, matched_keys in user_data.get_duplicate_candidates()
+            ),
+            sorted(
+                [
+                    (same_phone.pk, ["Phone number"]),
+                    (same_name_and_email.pk, ["Name", "Email local part"]),
+                ]
+            ),
+        )
+        admin = User.objects.create_superuser(email="super@user.com", password="foo")
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin-user-details", args=[user_data.pk]))
+        self.assertContains(response, "Possible duplicates")
+        self.assertContains(response, "Name, Email local part")
+
+        out = StringIO()
+        call_command("report_duplicates", stdout=out, stderr=StringIO())
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                "user_id,other_user_id,matching",
+                f"{user_data.pk},{same_phone.pk},Phone number",
+                f'{user_data.pk},{same_name_and_email.pk},"Name, Email local part"',
+            ],
+        )
+        err = StringIO()
+        call_command(
+            "report_duplicates", "--max-block-size=1", stdout=StringIO(), stderr=err
+        )
+        self.assertIn("Found 0 possible duplicates.", err.getvalue())
+
+
+class AdminDigestTests(TestCase):
+    def test_digest_is_incremental(self):
+        User.objects.create_superuser(email="super@user.com", password="foo")
+        UserData.objects.create(
+            email="visitor@user.com",
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Pending Visitor",
+            phone_number="123",
+            state_changed_at=timezone.now() - timedelta(hours=1),
+        )
+        call_command("send_admin_digest", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["super@user.com"])
+        self.assertIn("Pending Visitor", mail.outbox[0].body)
+        call_command("send_admin_digest", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class UserBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user_data = UserData.objects.create(
+            email="client@user.com",
+            user_type=UserType.CLIENT,
+            registration_type=RegistrationType.CLIENT,
+            name="Client",
+            phone_number="123",
+            company="Company",
+            country_of_origin_id="HU",
+        )
+        ReviewNotes.objects.create(
+            user=self.user_data.user,
+            registration_type=RegistrationType.CLIENT,
+            company_comment="Full company name, please",
+        )
+        self.client.force_login(self.user_data)
+
+    def test_user_is_loaded_with_registration_data(self):
+        # the session and the user with its registration data
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Hungary")
+        self.assertContains(response, "Full company name, please")
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=60)
+    def test_user_cache(self):
+        self.client.get(reverse("user-profile"))
+        with self.assertNumQueries(1):
+            self.client.get(reverse("user-profile"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_data.name = "Renamed"
+            self.user_data.save()
+        response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Renamed")
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=60)
+    def test_user_loaded_before_a_change_is_not_cached(self):
+        stale_key = get_user_cache_key(self.user_data.pk)
+        stale_user = User.objects.get(pk=self.user_data.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_data.name = "Renamed"
+            self.user_data.save()
+        # cached by a request which loaded the user before the commit
+        cache.set(stale_key, user_to_cache(stale_user))
+        user = UserBackend().get_user(self.user_data.pk)
+        self.assertEqual(user.userdata.name, "Renamed")
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=60)
+    def test_password_hash_is_not_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_data.set_password("secret")
+            self.user_data.save()
+        self.client.force_login(self.user_data)
+        self.client.get(reverse("user-profile"))
+        cached = cache.get(get_user_cache_key(self.user_data.pk))
+        self.assertNotIn(self.user_data.password, str(cached))
+        # the session is verified without loading the password
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Full company name, please")
+        user = UserBackend().get_user(self.user_data.pk)
+        user.userdata.name = "Renamed"
+        user.userdata.save()
+        self.assertTrue(User.objects.get(pk=self.user_data.pk).check_password("secret"))
+
+    @override_settings(AUTH_USER_CACHE_SECONDS=60)
+    def test_deleted_user_is_forgotten(self):
+        self.assertIsNotNone(UserBackend().get_user(self.user_data.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user_data.pk).delete()
+        self.assertIsNone(UserBackend().get_user(self.user_data.pk))
+
+    def test_sessions_of_model_backend_are_kept(self):
+        self.client.force_login(
+            self.user_data, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        response = self.client.get(reverse("user-profile"))
+        self.assertContains(response, "Full company name, please")
+
+
+class NotificationCoalescingTests(TestCase):
+    def setUp(self):
+        self.user_data = UserData.objects.create(
+            email="visitor@user.com",
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Visitor",
+            phone_number="123",
+        )
+
+    def send_pending_notifications(self):
+        out = StringIO()
+        call_command("send_pending_notifications", stdout=out)
+        return out.getvalue()
+
+    def test_successive_changes_are_sent_as_one_email(self):
+        admin = User.objects.create_superuser(email="admin@user.com")
+        user_data = self.user_data
+        self.client.force_login(admin)
+        url = reverse("admin-user-edit", kwargs={"id": user_data.pk})
+        self.client.post(url, {"action": "request_modify"})
+        user_data.set_registration_state(RegistrationState.WAITING_FOR_APPROVAL)
+        user_data.save()
+        self.client.post(url, {"action": "approve"})
+        self.assertEqual(len(mail.outbox), 0)
+        notification = PendingNotification.objects.get()
+        # not sent before the end of the window
+        call_command("send_pending_notifications", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+        notification.due_at = timezone.now()
+        notification.save()
+        out = StringIO()
+        call_command("send_pending_notifications", stdout=out)
+        self.assertIn("Sent 1 notifications.", out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["visitor@user.com"])
+        self.assertIn("Approved", mail.outbox[0].body)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_change_while_sending_is_sent_again(self):
+        queue_registration_state_change_email(self.user_data)
+        PendingNotification.objects.update(due_at=timezone.now())
+        def render_and_change(user_data):
+            message = registration_state_change_email(user_data)
+            # approved after the email was rendered
+            self.user_data.set_registration_state(RegistrationState.APPROVED)
+            self.user_data.save()
+            queue_registration_state_change_email(self.user_data)
+            return message
+
+        with mock.patch.dict(
+            NOTIFICATION_EMAILS,
+            {NotificationType.REGISTRATION_STATE_CHANGED: render_and_change},
+        ):
+            self.assertIn("Sent 1 notifications.", self.send_pending_notifications())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertNotIn("Approved", mail.outbox[0].body)
+        # the change is sent by the next run
+        self.assertIn("Sent 1 notifications.", self.send_pending_notifications())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn("Approved", mail.outbox[1].body)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_failed_email_is_sent_again(self):
+        other = UserData.objects.create(
+            email="other@user.com",
+            user_type=UserType.VISITOR,
+            registration_type=RegistrationType.VISITOR,
+            name="Other",
+            phone_number="123",
+        )
+        queue_registration_state_change_email(self.user_data)
+        queue_registration_state_change_email(other)
+        PendingNotification.objects.update(due_at=timezone.now())
+        send_messages = EmailBackend.send_messages
+
+        def refuse_visitor(backend, messages):
+            if messages[0].to == ["visitor@user.com"]:
+                raise smtplib.SMTPRecipientsRefused({"visitor@user.com": (450, b"")})
+            return send_messages(backend, messages)
+
+        with mock.patch.object(
+            EmailBackend, "send_messages", autospec=True, side_effect=refuse_visitor
+        ):
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                self.send_pending_notifications()
+        self.assertEqual([message.to for message in mail.outbox], [[other.email]])
+        notification = PendingNotification.objects.get()
+        self.assertEqual(notification.user_id, self.user_data.pk)
+        self.assertLessEqual(notification.due_at, timezone.now())
+        self.assertIn("Sent 1 notifications.", self.send_pending_notifications())
+        self.assertEqual(mail.outbox[1].to, ["visitor@user.com"])
+        self.assertFalse(PendingNotification.objects.exists())
+
+
+class RegistrationsApiTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        for i in range(3):
+            UserData.objects.create(
+                email=f"visitor{i}@user.com",
+                user_type=UserType.VISITOR,
+                registration_type=RegistrationType.VISITOR,
+                name=f"Visitor {i}",
+                phone_number="123",
+            )
+        admin = User.objects.create_superuser(email="super@user.com", password="foo")
+        self.client.force_login(admin)
+
+    def get(self, **params):
+        response = self.client.get(reverse("api-registrations"), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_projection_and_pagination(self):
+        page = self.get(fields="name", limit=2)
+        self.assertEqual(
+            [row["name"] for row in page["results"]], ["Visitor 2", "Visitor 1"]
+        )
+        self.assertEqual(set(page["results"][0]), {"user_id", "name"})
+        page = self.get(fields="name,email", limit=2, after=page["next"])
+        self.assertEqual(
+            page["results"],
+            [
+                {
+                    "user_id": page["results"][0]["user_id"],
+                    "name": "Visitor 0",
+                    "email": "visitor0@user.com",
+                }
+            ],
+        )
+        self.assertIsNone(page["next"])
+
+    def test_invalid_parameters(self):
+        response = self.client.get(reverse("api-registrations"), {"fields": "password"})
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        response = self.client.get(reverse("api-registrations"))
+        self.assertEqual(response.status_code, 403)
+
+
+class RegistrationChangesApiTests(TransactionTestCase):
+    # the change sequence is assigned when the transactions commit
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(email="admin@user.com"))
+        self.visitors = [
+            UserData.objects.create(
+                email=f"visitor{i}@user.com",
+                user_type=UserType.VISITOR,
+                registration_type=RegistrationType.VISITOR,
+                name=f"Visitor {i}",
+                phone_number="123",
+            )
+            for i in range(2)
+        ]
+
+    def get(self, **params):
+        response = self.client.get(reverse("api-registration-changes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_after_cursor(self):
+        page = self.get(limit=1)
+        self.assertEqual([row["name"] for row in page["results"]], ["Visitor 0"])
+        self.assertTrue(page["has_more"])
+        page = self.get(cursor=page["cursor"])
+        self.assertEqual([row["name"] for row in page["results"]], ["Visitor 1"])
+        self.assertFalse(page["has_more"])
+        cursor = page["cursor"]
+        self.assertEqual(self.get(cursor=cursor)["results"], [])
+        # the email is stored in the user table
+        User.objects.filter(pk=self.visitors[0].pk).update(email="new@user.com")
+        self.visitors[1].set_registration_state(RegistrationState.WAITING_FOR_APPROVAL)
+        self.visitors[1].save()
+        page = self.get(cursor=cursor)
+        self.assertEqual(
+            [(row["email"], row["registration_state"]) for row in page["results"]],
+            [
+                ("new@user.com", RegistrationState.INITIAL),
+                ("visitor1@user.com", RegistrationState.WAITING_FOR_APPROVAL),
+            ],
+        )
+        self.assertEqual(self.get(cursor=page["cursor"])["results"], [])
+
+    def test_invalid_parameters(self):
+        response = self.client.get(
+            reverse("api-registration-changes"), {"cursor": "invalid"}
+        )
+        self.assertEqual(response.status_code, 400)
+        # waiting needs an ASGI server
+        response = self.client.get(reverse("api-registration-changes"), {"wait": 1})
+        self.assertEqual(response.status_code, 501)
+        self.client.logout()
+        response = self.client.get(reverse("api-registration-changes"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_removed_registrations(self):
+        cursor = self.get()["cursor"]
+        archived, deleted = self.visitors
+        UserData.objects.filter(pk=archived.pk).update(
+            registration_state=RegistrationState.APPROVED,
+            finished_at=timezone.now() - timedelta(days=400),
+        )
+        call_command("archive_registrations", "--sleep=0", stdout=StringIO())
+        User.objects.filter(pk=deleted.pk).delete()
+        page = self.get(cursor=cursor)
+        self.assertEqual(page["results"], [])
+        self.assertEqual(
+            page["removed"],
+            [
+                {"user_id": archived.pk, "reason": "archived"},
+                {"user_id": deleted.pk, "reason": "deleted"},
+            ],
+        )
+        self.assertEqual(self.get(cursor=page["cursor"])["removed"], [])
+
+    async def test_waiting_request_is_notified(self):
+        admin = await User.objects.aget(email="admin@user.com")
+        await sync_to_async(self.async_client.force_login)(admin)
+        url = reverse("api-registration-changes")
+        cursor = (await self.async_client.get(url)).json()["cursor"]
+        request = asyncio.create_task(
+            self.async_client.get(url, {"cursor": cursor, "wait": 30})
+        )
+        await asyncio.sleep(0.5)
+        await UserData.objects.filter(pk=self.visitors[0].pk).aupdate(name="Renamed")
+        # notified, not found by the periodic check
+        response = await asyncio.wait_for(
+            request, views.RegistrationChangesApiView.RECHECK_SECONDS / 2
+        )
+        self.assertEqual(
+            [row["name"] for row in response.json()["results"]], ["Renamed"]
+        )
+
+
+class ReviewNotesMigrationTests(TransactionTestCase):
+    # the review comments were moved out of the registrations by 0007
+    migrate_from = [("main_site", "0006_admin_digest")]
+    migrate_to = [("main_site", "0007_review_notes")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_comments_are_copied(self):
+        apps = self.migrate(self.migrate_from)
+        user = apps.get_model("main_site", "User").objects.create(
+            email="visitor@user.com", user_type="visitor"
+        )
+        apps.get_model("main_site", "UserData").objects.create(
+            user=user,
+            registration_type="visitor",
+            name="Visitor",
+            name_comment="Full name, please",
+            phone_number="123",
+        )
+        client = apps.get_model("main_site", "User").objects.create(
+            email="client@user.com", user_type="client"
+        )
+        apps.get_model("main_site", "ArchivedUserData").objects.create(
+            user=client,
+            registration_type="client",
+            registration_state="approved",
+            name="Client",
+            phone_number="123",
+            company="Company",
+            company_comment="Full company name, please",
+            country_of_origin="Hungary",
+        )
+        apps = self.migrate(self.migrate_to)
+        notes = apps.get_model("main_site", "ReviewNotes").objects.in_bulk()
+        self.assertEqual(notes[user.pk].name_comment, "Full name, please")
+        self.assertEqual(
+            notes[client.pk].company_comment, "Full company name, please"
+        )
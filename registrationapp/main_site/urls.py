@@ -2,6 +2,7 @@ from django.urls import path
 from django.contrib.auth.views import LogoutView
 
 from . import views
+from .models import RegistrationType
 
 urlpatterns = [
     path("", views.HomeView.as_view(), name="home"),
@@ -16,6 +17,20 @@ urlpatterns = [
         views.RegisterClientView.as_view(),
         name="register-client",
     ),
+    path(
+        "register-visitor/validate-field/",
+        views.RegistrationFieldValidationView.as_view(
+            registration_type=RegistrationType.VISITOR
+        ),
+        name="register-visitor-validate-field",
+    ),
+    path(
+        "register-client/validate-field/",
+        views.RegistrationFieldValidationView.as_view(
+            registration_type=RegistrationType.CLIENT
+        ),
+        name="register-client-validate-field",
+    ),
     path("logout/", LogoutView.as_view(), name="logout"),
     path(
         "password-change/", views.PasswordChangeView.as_view(), name="password-change"
@@ -36,11 +51,47 @@ urlpatterns = [
         views.AdminUserDetailsView.as_view(),
         name="admin-user-details",
     ),
+    path(
+        "administration/users/review-next/",
+        views.AdminReviewNextView.as_view(),
+        name="admin-review-next",
+    ),
+    path(
+        "administration/users/events/",
+        views.AdminRegistrationEventsView.as_view(),
+        name="admin-registration-events",
+    ),
+    path(
+        "administration/countries/",
+        views.AdminCountryStatsView.as_view(),
+        name="admin-country-stats",
+    ),
+    path(
+        "administration/db-pool-stats/",
+        views.AdminDatabasePoolStatsView.as_view(),
+        name="admin-db-pool-stats",
+    ),
+    path(
+        "api/registrations/",
+        views.RegistrationsApiView.as_view(),
+        name="api-registrations",
+    ),
+    path(
+        "api/registrations/changes/",
+        views.RegistrationChangesApiView.as_view(),
+        name="api-registration-changes",
+    ),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
     path(
         "profile/",
         views.UserProfileView.as_view(),
         name="user-profile",
     ),
+    path(
+        "profile/events/",
+        views.UserRegistrationEventsView.as_view(),
+        name="user-registration-events",
+    ),
     path(
         "profile/edit/",
         views.UserProfileEditView.as_view(),
@@ -1,17 +1,36 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import math
+import time
 from typing import Any, Dict
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import AccessMixin
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from django.core.exceptions import BadRequest, ObjectDoesNotExist, PermissionDenied
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 from django.forms.forms import BaseForm
 from django.http import HttpRequest
-from django.http import HttpResponse
-from django.shortcuts import resolve_url, redirect
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404, resolve_url, redirect
 from django.urls import reverse_lazy
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.views.generic import UpdateView, DetailView, TemplateView, FormView, View
 from django.views.generic.list import ListView
 from urllib.parse import urlencode
 from .forms import (
+    validate_registration_field,
     VisitorRegistrationForm,
     ClientRegistrationForm,
     VisitorProfileEditForm,
@@ -20,11 +39,28 @@ from .forms import (
     ClientEditForm,
 )
 from .mail import (
+    queue_registration_state_change_email,
     send_registration_initiated_email,
-    send_registration_state_change_email,
 )
-from .models import UserData, RegistrationState, RegistrationType
-from . import orcid
+from .metrics import (
+    RATE_LIMITED_REQUESTS,
+    REGISTRATION_FORM_ERRORS,
+    REGISTRATIONS,
+    STATE_TRANSITIONS,
+    format_metric,
+    registry,
+)
+from .models import (
+    ArchivedUserData,
+    Country,
+    UserData,
+    RegistrationState,
+    RegistrationType,
+    RemovedRegistration,
+)
+from . import events, orcid, ratelimit
+from .review_queue import claim_next_registration
+from registrationapp.pooled_postgresql.base import get_pool_stats
 
 
 def get_home_url(user):
@@ -63,27 +99,134 @@ class AdminRequiredMixin(AccessMixin):
         return super().dispatch(request, *args, **kwargs)
 
 
+def get_user_data(user, allow_archived=False):
+    """
+    Returns the registration data of a visitor or client, or None for other
+    users. If allow_archived is true, archived registrations are returned too.
+    """
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.userdata
+    except ObjectDoesNotExist:
+        pass
+    if allow_archived:
+        try:
+            return user.archiveduserdata
+        except ObjectDoesNotExist:
+            pass
+    return None
+
+
 class UserDataRequiredMixin(AccessMixin):
     """
     This mixin allows only visitors and clients to access the view.
+    Users with archived registrations are allowed if allow_archived is true.
     """
 
     permission_denied_message = (
         "Only registering users are permitted to use this function!"
     )
+    allow_archived = False
 
     def dispatch(self, request: HttpRequest, *args, **kwargs):
-        has_userdata = False
-        try:
-            if request.user.is_authenticated and request.user.userdata:
-                has_userdata = True
-        except ObjectDoesNotExist:
-            pass
+        has_userdata = (
+            get_user_data(request.user, allow_archived=self.allow_archived)
+            is not None
+        )
         if not has_userdata:
             return self.handle_no_permission()
         return super().dispatch(request, *args, **kwargs)
 
 
+class RateLimitMixin:
+    """
+    This mixin rate limits the POST requests of the view by client IP and by
+    the submitted email address. It runs before any password hashing or
+    database work, and answers with 429 Too Many Requests when a limit is hit.
+    """
+
+    rate_limit_scope: str
+    rate_limit_email_field = "email"
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs):
+        if request.method == "POST":
+            retry_after = ratelimit.consume(
+                self.rate_limit_scope,
+                request,
+                request.POST.get(self.rate_limit_email_field),
+            )
+            if retry_after > 0:
+                RATE_LIMITED_REQUESTS.inc(scope=self.rate_limit_scope)
+                response = HttpResponse(
+                    "Too many requests. Please try again later.",
+                    content_type="text/plain",
+                    status=429,
+                )
+                response["Retry-After"] = str(math.ceil(retry_after))
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+class AnonymousPageCacheMixin:
+    """
+    This mixin caches the GET responses of the view for anonymous visitors.
+    The page is cached with a placeholder in place of the CSRF token, and the
+    token of the request is inserted for every response, so cache hits render
+    no templates and make no database queries.
+
+    Requests with a session or a messages cookie are not cached, because the
+    page may show their contents (e.g. the ORCID data, or an error message).
+    Without a session cookie, the visitor can not be logged in.
+    """
+
+    CSRF_TOKEN_PLACEHOLDER = "__csrf_token_placeholder__"
+    caching_page = False
+    # The query parameters which the page depends on. Requests with other
+    # parameters are not cached, so random parameters can not fill the cache.
+    cached_query_parameters: tuple[str, ...] = ()
+
+    def is_page_cacheable(self, request: HttpRequest):
+        return (
+            settings.ANONYMOUS_PAGE_CACHE_SECONDS > 0
+            and request.method in ("GET", "HEAD")
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+            and CookieStorage.cookie_name not in request.COOKIES
+            and set(request.GET).issubset(self.cached_query_parameters)
+        )
+
+    def get_page_cache_key(self, request: HttpRequest):
+        query = urlencode(sorted(request.GET.items()))
+        path = hashlib.sha256(f"{request.path}?{query}".encode()).hexdigest()
+        return f"anonymous-page:{path}"
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs):
+        if not self.is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key(request)
+        page = cache.get(key)
+        if page is None:
+            self.caching_page = True
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(response, "render"):
+                return response
+            response.render()
+            page = {"content": response.content, "headers": dict(response.headers)}
+            cache.set(key, page, settings.ANONYMOUS_PAGE_CACHE_SECONDS)
+        return HttpResponse(
+            page["content"].replace(
+                self.CSRF_TOKEN_PLACEHOLDER.encode(), get_token(request).encode()
+            ),
+            headers=page["headers"],
+        )
+
+    def get_context_data(self, **kwargs):
+        if self.caching_page:
+            # overrides the token of the csrf context processor
+            kwargs["csrf_token"] = self.CSRF_TOKEN_PLACEHOLDER
+        return super().get_context_data(**kwargs)
+
+
 class PermissionDeniedWithRedirect(PermissionDenied):
     """
     A special PermissionDenied exception that specifies where the user
@@ -114,12 +257,16 @@ class PermissionDeniedWithRedirectMixin:
 # ------------------------- VIEWS -------------------------
 
 
-class HomeView(AnonymousUserRequiredMixin, TemplateView):
+class HomeView(AnonymousPageCacheMixin, AnonymousUserRequiredMixin, TemplateView):
     template_name = "main_site/home.html"
 
 
-class LoginView(auth_views.LoginView):
+class LoginView(AnonymousPageCacheMixin, RateLimitMixin, auth_views.LoginView):
     template_name = "main_site/login.html"
+    rate_limit_scope = "login"
+    # the email is the username of the authentication form
+    rate_limit_email_field = "username"
+    cached_query_parameters = ("next",)
 
     def get_default_redirect_url(self):
         if self.next_page:
@@ -144,16 +291,17 @@ class PasswordChangeView(auth_views.PasswordChangeView):
         )
 
 
-class RegisterVisitorView(FormView):
+class RegisterVisitorView(AnonymousPageCacheMixin, RateLimitMixin, FormView):
     template_name = "main_site/register_visitor.html"
     form_class = VisitorRegistrationForm
     success_url = reverse_lazy("login")
+    rate_limit_scope = "register"
     action: str | None
-    orcid_data: orcid.PublicOrcidData | None
 
-    def setup(self, request: HttpRequest, *args, **kwargs):
-        self.orcid_data = orcid.PublicOrcidData.from_session(request.session)
-        return super().setup(request, *args, **kwargs)
+    @cached_property
+    def orcid_data(self) -> orcid.PublicOrcidData | None:
+        # loaded lazily, so rate limited requests do not load the session
+        return orcid.PublicOrcidData.from_session(self.request.session)
 
     def post(self, request: HttpRequest, *args, **kwargs):
         self.action = request.POST.get("action")
@@ -166,14 +314,35 @@ class RegisterVisitorView(FormView):
         if self.action != "register":
             return self.render_to_response(self.get_context_data(form=form))
         if self.orcid_data is not None:
+            if UserData.objects.filter(orcid_id=self.orcid_data.orcid).exists():
+                form.add_error(None, "This ORCID iD is already registered.")
+                return self.form_invalid(form)
             form.instance.orcid_id = self.orcid_data.orcid
-        user_data = form.save()
+        try:
+            with transaction.atomic():
+                user_data = form.save()
+        except IntegrityError as e:
+            # registered concurrently since the check above
+            if "orcid_id_unique" not in str(e):
+                raise
+            form.add_error(None, "This ORCID iD is already registered.")
+            return self.form_invalid(form)
         orcid.PublicOrcidData.delete_from_session(self.request.session)
         self.orcid_data = None
+        REGISTRATIONS.inc(registration_type=RegistrationType.VISITOR.value)
+        STATE_TRANSITIONS.inc(registration_state=user_data.registration_state)
+        events.publish_registration_change(user_data)
         messages.success(self.request, "The account has been created successfully!")
         send_registration_initiated_email(user_data)
         return super().form_valid(form)
 
+    def form_invalid(self, form: VisitorRegistrationForm) -> HttpResponse:
+        if self.action == "register":
+            REGISTRATION_FORM_ERRORS.inc(
+                registration_type=RegistrationType.VISITOR.value
+            )
+        return super().form_invalid(form)
+
     def get_form(self, form_class=None) -> BaseForm:
         form = super().get_form(form_class)
         if self.orcid_data is not None:
@@ -189,17 +358,51 @@ class RegisterVisitorView(FormView):
         )
 
 
-class RegisterClientView(FormView):
+class RegisterClientView(AnonymousPageCacheMixin, RateLimitMixin, FormView):
     template_name = "main_site/register_client.html"
     form_class = ClientRegistrationForm
     success_url = reverse_lazy("login")
+    rate_limit_scope = "register"
 
     def form_valid(self, form: ClientRegistrationForm) -> HttpResponse:
         user_data = form.save()
+        REGISTRATIONS.inc(registration_type=RegistrationType.CLIENT.value)
+        STATE_TRANSITIONS.inc(registration_state=user_data.registration_state)
+        events.publish_registration_change(user_data)
         messages.success(self.request, "The account has been created successfully!")
         send_registration_initiated_email(user_data)
         return super().form_valid(form)
 
+    def form_invalid(self, form: ClientRegistrationForm) -> HttpResponse:
+        REGISTRATION_FORM_ERRORS.inc(registration_type=RegistrationType.CLIENT.value)
+        return super().form_invalid(form)
+
+
+class RegistrationFieldValidationView(RateLimitMixin, View):
+    """
+    Validates a single field of a registration form, so the registration
+    forms can show errors while the user is typing. The field name is in the
+    "field" POST parameter, and the form data in the other parameters.
+    """
+
+    rate_limit_scope = "validate_field"
+    registration_type: RegistrationType | None = None
+
+    def post(self, request: HttpRequest, *args, **kwargs):
+        match self.registration_type:
+            case RegistrationType.VISITOR:
+                form_class = VisitorRegistrationForm
+            case RegistrationType.CLIENT:
+                form_class = ClientRegistrationForm
+            case _:
+                raise Exception("Unknown registration type!")
+        field = request.POST.get("field", "")
+        try:
+            errors = validate_registration_field(form_class, field, request.POST)
+        except KeyError:
+            raise BadRequest(f"Invalid field: {field}")
+        return JsonResponse({"field": field, "valid": not errors, "errors": errors})
+
 
 class RegisterOrcidView(View):
     """
@@ -213,6 +416,14 @@ class RegisterOrcidView(View):
             token = orcid.exchange_token(code)
         if token is None:
             messages.error(request, "Could not authorize the ORCID login!")
+        elif UserData.objects.filter(orcid_id=token.orcid).exists():
+            # checked locally with the unique index, without calling ORCID again;
+            # the registration itself is protected by the unique constraint
+            messages.error(
+                request,
+                f"The ORCID iD {token.orcid} is already registered. Please log in!",
+            )
+            return redirect("login")
         else:
             data = orcid.request_public_orcid_data(token.orcid)
             data.save_to_session(request.session)
@@ -221,12 +432,30 @@ class RegisterOrcidView(View):
 
 class AdminUserListView(AdminRequiredMixin, ListView):
     template_name = "main_site/admin_list.html"
+    read_from_replica = True
     paginate_by = 3
     query_filters: dict
+    # every sort order is served by an index, also with the state or the
+    # country filter
+    SORTS = {
+        "newest": ("Newest", ["-created_at", "-user_id"]),
+        "oldest": ("Oldest", ["created_at", "user_id"]),
+        "recently_modified": ("Recently modified", ["-updated_at", "-user_id"]),
+        "least_recently_modified": (
+            "Least recently modified",
+            ["updated_at", "user_id"],
+        ),
+    }
+    DEFAULT_SORT = "newest"
 
     def get_queryset(self):
         self.query_filters = {}
-        filter = UserData.objects.all().order_by("-user_id")
+        sort = self.request.GET.get("sort", self.DEFAULT_SORT)
+        if sort not in self.SORTS:
+            raise BadRequest(f"Invalid sort: {sort}")
+        if sort != self.DEFAULT_SORT:
+            self.query_filters["sort"] = sort
+        filter = UserData.objects.all().order_by(*self.SORTS[sort][1])
         state_filter = self.request.GET.get("registration_state")
         if state_filter is not None:
             if state_filter not in RegistrationState:
@@ -234,6 +463,12 @@ class AdminUserListView(AdminRequiredMixin, ListView):
             state = RegistrationState(state_filter)
             self.query_filters["registration_state"] = state
             filter = filter.filter(registration_state=state)
+        country_filter = self.request.GET.get("country")
+        if country_filter is not None:
+            if not Country.objects.filter(code=country_filter).exists():
+                raise BadRequest(f"Invalid country: {country_filter}")
+            self.query_filters["country"] = country_filter
+            filter = filter.filter(country_of_origin=country_filter)
         page = self.request.GET.get("page")
         if page is not None:
             self.query_filters["page"] = int(page)
@@ -268,19 +503,90 @@ class AdminUserListView(AdminRequiredMixin, ListView):
             )
         return registration_state_urls
 
+    def get_sort_links(self):
+        """
+        Returns the URLs and labels for the sort function.
+        """
+        current_sort = self.query_filters.get("sort", self.DEFAULT_SORT)
+        filters_copy = dict(self.query_filters)
+        # reset pagination
+        filters_copy.pop("page", None)
+        sort_urls = []
+        for sort, (label, _) in self.SORTS.items():
+            filters_copy["sort"] = sort
+            sort_urls.append(
+                {
+                    "label": label,
+                    "url": f"?{urlencode(filters_copy)}",
+                    "active": current_sort == sort,
+                }
+            )
+        return sort_urls
+
+    def get_country_filter(self):
+        """
+        Returns the selected country and the URL which removes the filter.
+        """
+        code = self.query_filters.get("country")
+        if code is None:
+            return None
+        filters_copy = dict(self.query_filters)
+        filters_copy.pop("country")
+        filters_copy.pop("page", None)
+        return {
+            "country": Country.objects.get(code=code),
+            "remove_url": f"?{urlencode(filters_copy)}",
+        }
+
     def get_context_data(self, **kwargs):
         return super().get_context_data(
             query_filters_url=f"?{urlencode(self.query_filters)}",
             registration_state_filters=self.get_registration_state_filters(),
+            sort_links=self.get_sort_links(),
+            country_filter=self.get_country_filter(),
             **kwargs,
         )
 
 
+class AdminCountryStatsView(AdminRequiredMixin, TemplateView):
+    """
+    Shows the number of registrations by country of origin. The counts are
+    grouped on the country foreign key index.
+    """
+
+    template_name = "main_site/admin_country_stats.html"
+    read_from_replica = True
+
+    def get_context_data(self, **kwargs):
+        counts = list(
+            UserData.objects.filter(country_of_origin__isnull=False)
+            .order_by()
+            .values_list("country_of_origin")
+            .annotate(count=Count("pk"))
+        )
+        countries = Country.objects.in_bulk([code for code, _ in counts])
+        country_counts = sorted(
+            [
+                {"country": countries[code], "count": count}
+                for code, count in counts
+            ],
+            key=lambda row: (-row["count"], row["country"].name),
+        )
+        return super().get_context_data(country_counts=country_counts, **kwargs)
+
+
 class AdminUserEditView(
     AdminRequiredMixin, PermissionDeniedWithRedirectMixin, UpdateView
 ):
+    """
+    The admins comment on the registration and change its state here.
+    The form edits the review notes, not the registration data.
+    """
+
     success_url = reverse_lazy("admin-user-list")
-    queryset = UserData.objects.select_related("user")
+    queryset = UserData.objects.select_related(
+        "user__review_notes", "claimed_by", "country_of_origin"
+    )
     template_name = "main_site/admin_user_edit.html"
     pk_url_kwarg = "id"
     context_object_name = "user_data"
@@ -302,37 +608,103 @@ class AdminUserEditView(
                 return ClientEditForm
         raise Exception("Unknown registration type!")
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["instance"] = self.object.get_review_notes()
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(
+            claimed_by_other=self.object.is_claimed_by_other(self.request.user),
+            duplicate_candidates=self.object.get_duplicate_candidates(),
+            **kwargs,
+        )
+
     def form_valid(self, form):
         match self.request.POST.get("action"):
             case "approve":
-                self.object.registration_state = RegistrationState.APPROVED
+                self.object.set_registration_state(RegistrationState.APPROVED)
             case "request_modify":
-                self.object.registration_state = (
+                self.object.set_registration_state(
                     RegistrationState.ADMIN_REQUESTED_MODIFY
                 )
             case "reject":
-                self.object.registration_state = RegistrationState.REJECTED
+                self.object.set_registration_state(RegistrationState.REJECTED)
             case _:
                 raise BadRequest()
-        result = super().form_valid(form)
-        send_registration_state_change_email(self.object)
+        self.object.release_claim()
+        with transaction.atomic():
+            self.object.save(
+                update_fields=[
+                    "registration_state",
+                    "state_changed_at",
+                    "finished_at",
+                    "claimed_by",
+                    "claimed_until",
+                    "updated_at",
+                ]
+            )
+            # no row is created for registrations without comments
+            if form.has_changed():
+                form.save()
+        STATE_TRANSITIONS.inc(registration_state=self.object.registration_state)
+        events.publish_registration_change(self.object)
+        queue_registration_state_change_email(self.object)
         messages.success(self.request, "The account has been saved successfully!")
-        return result
+        return redirect(self.get_success_url())
+
+
+class AdminReviewNextView(AdminRequiredMixin, View):
+    """
+    Claims the next registration waiting for review for the admin,
+    and redirects to its edit page.
+    """
+
+    def post(self, request: HttpRequest, *args, **kwargs):
+        user_data = claim_next_registration(request.user)
+        if user_data is None:
+            messages.info(request, "There are no registrations waiting for review.")
+            return redirect("admin-user-list")
+        return redirect("admin-user-edit", id=user_data.pk)
 
 
 class AdminUserDetailsView(AdminRequiredMixin, DetailView):
-    queryset = UserData.objects.select_related("user")
+    queryset = UserData.objects.select_related(
+        "user__review_notes", "country_of_origin"
+    )
+    read_from_replica = True
     template_name = "main_site/admin_user_details.html"
     pk_url_kwarg = "id"
     context_object_name = "user_data"
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # archived registrations are shown read-only
+            return super().get_object(
+                ArchivedUserData.objects.select_related(
+                    "user__review_notes", "country_of_origin"
+                )
+            )
+
+    def get_context_data(self, **kwargs):
+        if isinstance(self.object, UserData):
+            kwargs["duplicate_candidates"] = self.object.get_duplicate_candidates()
+        return super().get_context_data(
+            review_notes=self.object.get_review_notes(), **kwargs
+        )
+
 
 class UserProfileView(UserDataRequiredMixin, TemplateView):
     template_name = "main_site/user_profile.html"
+    read_from_replica = True
+    allow_archived = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["user"] = self.request.user.userdata
+        context["user"] = get_user_data(self.request.user, allow_archived=True)
+        context["review_notes"] = context["user"].get_review_notes()
         return context
 
 
@@ -345,6 +717,9 @@ class UserProfileEditView(
 
     def get_object(self):
         user_data: UserData = self.request.user.userdata
+        if self.request.method == "POST":
+            # the edit is saved over the current data, not the cached user's
+            user_data = get_object_or_404(UserData, pk=user_data.pk)
         if not user_data.is_editable_by_user():
             raise PermissionDeniedWithRedirect(
                 "user-profile",
@@ -360,9 +735,343 @@ class UserProfileEditView(
                 return ClientProfileEditForm
         raise Exception("Unknown registration type!")
 
+    def get_context_data(self, **kwargs):
+        # the comments of the admins are shown next to the fields
+        return super().get_context_data(
+            review_notes=self.object.get_review_notes(), **kwargs
+        )
+
     def form_valid(self, form):
-        self.object.registration_state = RegistrationState.WAITING_FOR_APPROVAL
+        self.object.set_registration_state(RegistrationState.WAITING_FOR_APPROVAL)
         result = super().form_valid(form)
-        send_registration_state_change_email(self.object)
+        STATE_TRANSITIONS.inc(registration_state=self.object.registration_state)
+        events.publish_registration_change(self.object)
+        queue_registration_state_change_email(self.object)
         messages.success(self.request, "The account has been saved successfully!")
         return result
+
+
+class RegistrationEventsView(View):
+    """
+    Streams the registration events that the user may see as server-sent
+    events. Streaming needs an ASGI server: under WSGI, the view answers
+    204 No Content, which tells the browser not to reconnect.
+
+    The stream is closed after MAX_SECONDS and the browser reconnects,
+    so the streams of disconnected clients do not live long.
+    """
+
+    KEEPALIVE_SECONDS = 15
+    MAX_SECONDS = 300
+    RETRY_MILLISECONDS = 5000
+
+    def get_event_filter(self, user):
+        """
+        Returns a function telling whether an event is sent to the user,
+        or None if the user may not subscribe. Nobody may subscribe by
+        default.
+        """
+        return None
+
+    async def get(self, request: HttpRequest, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+        event_filter = await sync_to_async(self.get_event_filter)(request.user)
+        if event_filter is None:
+            raise PermissionDenied()
+        response = StreamingHttpResponse(
+            self.stream(event_filter), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # disables the response buffering of nginx
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, event_filter):
+        async with events.broadcaster.subscribe() as queue:
+            deadline = time.monotonic() + self.MAX_SECONDS
+            yield f"retry: {self.RETRY_MILLISECONDS}\n\n"
+            while (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), min(timeout, self.KEEPALIVE_SECONDS)
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event_filter(event):
+                    yield f"event: registration\ndata: {json.dumps(event)}\n\n"
+
+
+class AdminRegistrationEventsView(RegistrationEventsView):
+    """Sends every new or changed registration to the admin list."""
+
+    def get_event_filter(self, user):
+        if not user.is_authenticated or not user.is_admin:
+            return None
+        return lambda event: True
+
+
+class UserRegistrationEventsView(RegistrationEventsView):
+    """Sends the changes of the own registration to the profile page."""
+
+    def get_event_filter(self, user):
+        user_data = get_user_data(user)
+        if user_data is None:
+            return None
+        return lambda event: event["user_id"] == user_data.pk
+
+
+class AdminDatabasePoolStatsView(AdminRequiredMixin, View):
+    """
+    Returns the connection pool statistics (wait time, saturation)
+    of the worker process that serves the request.
+    """
+
+    def get(self, request: HttpRequest, *args, **kwargs):
+        return JsonResponse(get_pool_stats())
+
+
+class MetricsView(View):
+    """
+    Serves the metrics of the registration pipeline in the Prometheus text
+    format. Admins and clients sending the METRICS_TOKEN as a Bearer token
+    are permitted.
+    """
+
+    read_from_replica = True
+
+    def has_permission(self, request: HttpRequest):
+        if request.user.is_authenticated and request.user.is_admin:
+            return True
+        token = settings.METRICS_TOKEN
+        return bool(token) and constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+
+    def get(self, request: HttpRequest, *args, **kwargs):
+        if not self.has_permission(request):
+            raise PermissionDenied()
+        counts = dict(
+            UserData.objects.order_by()
+            .values_list("registration_state")
+            .annotate(count=Count("pk"))
+        )
+        registrations = format_metric(
+            "main_site_registrations",
+            "gauge",
+            "Number of registrations by registration state.",
+            [
+                (
+                    "main_site_registrations",
+                    (("registration_state", state.value),),
+                    counts.get(state.value, 0),
+                )
+                for state in RegistrationState
+            ],
+        )
+        return HttpResponse(
+            registry.render() + registrations,
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+class RegistrationsApiView(AdminRequiredMixin, View):
+    """
+    Lists registrations as JSON for internal tools.
+
+    Query parameters:
+    - registration_state, registration_type: filters
+    - fields: comma separated list of the returned fields (default: all)
+    - after: the "next" value of the previous page
+    - limit: page size (at most MAX_LIMIT)
+
+    Only the requested columns are fetched, and the rows are streamed from a
+    database cursor without creating model instances.
+    """
+
+    raise_exception = True
+    read_from_replica = True
+    FIELDS = [
+        "user_id",
+        "email",
+        "registration_type",
+        "registration_state",
+        "orcid_id",
+        "name",
+        "phone_number",
+        "company",
+        "country_of_origin",
+        "state_changed_at",
+        "finished_at",
+        "created_at",
+        "updated_at",
+    ]
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+
+    def get_fields(self):
+        fields = self.request.GET.get("fields")
+        if not fields:
+            return self.FIELDS
+        fields = fields.split(",")
+        for field in fields:
+            if field not in self.FIELDS:
+                raise BadRequest(f"Invalid field: {field}")
+        # the pagination needs the key
+        if "user_id" not in fields:
+            fields.insert(0, "user_id")
+        return fields
+
+    def get_queryset(self, limit: int):
+        queryset = UserData.objects.order_by("-user_id")
+        state = self.request.GET.get("registration_state")
+        if state is not None:
+            if state not in RegistrationState:
+                raise BadRequest(f"Invalid registration_state: {state}")
+            queryset = queryset.filter(registration_state=state)
+        registration_type = self.request.GET.get("registration_type")
+        if registration_type is not None:
+            if registration_type not in RegistrationType:
+                raise BadRequest(f"Invalid registration_type: {registration_type}")
+            queryset = queryset.filter(registration_type=registration_type)
+        after = self.request.GET.get("after")
+        if after is not None:
+            try:
+                queryset = queryset.filter(user_id__lt=int(after))
+            except ValueError:
+                raise BadRequest(f"Invalid after: {after}")
+        queryset = queryset.values(*self.get_fields())[:limit]
+        # the rows are read after the view has returned,
+        # so the database is chosen now
+        return queryset.using(queryset.db)
+
+    def get(self, request: HttpRequest, *args, **kwargs):
+        try:
+            limit = int(request.GET.get("limit", self.DEFAULT_LIMIT))
+        except ValueError:
+            raise BadRequest("Invalid limit")
+        limit = max(1, min(limit, self.MAX_LIMIT))
+        queryset = self.get_queryset(limit)
+        return StreamingHttpResponse(
+            self.stream(queryset, limit), content_type="application/json"
+        )
+
+    def stream(self, queryset, limit: int):
+        encoder = DjangoJSONEncoder()
+        yield '{"results": ['
+        count = 0
+        last_id = None
+        for row in queryset.iterator(chunk_size=500):
+            yield ("," if count else "") + encoder.encode(row)
+            count += 1
+            last_id = row["user_id"]
+        next = str(last_id) if count == limit else None
+        yield f'], "next": {json.dumps(next)}}}'
+
+
+class RegistrationChangesApiView(View):
+    """
+    The change feed of the registrations for downstream systems. Returns the
+    registrations changed after the cursor in "results", in the order of
+    their last change, the user ids of the registrations archived or deleted
+    after the cursor in "removed", and the cursor for the next request.
+
+    Query parameters:
+    - cursor: the "cursor" of the previous response (default: from the start)
+    - limit: page size (at most MAX_LIMIT)
+    - wait: when there are no changes, seconds to wait for a change
+      (at most MAX_WAIT_SECONDS). The request waits for the notification of
+      the change sequence triggers, without holding a thread, so waiting
+      needs an ASGI server: under WSGI, requests with wait are answered
+      501 Not Implemented, so clients do not poll in a loop unknowingly.
+    """
+
+    DEFAULT_LIMIT = 100
+    MAX_LIMIT = 1000
+    MAX_WAIT_SECONDS = 30
+    # the changes are queried again after this without a notification, in
+    # case it was missed while the listener reconnected
+    RECHECK_SECONDS = 10
+
+    @staticmethod
+    def encode_cursor(change_seq: int):
+        return urlsafe_base64_encode(str(change_seq).encode())
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            return int(urlsafe_base64_decode(cursor))
+        except ValueError:
+            raise BadRequest(f"Invalid cursor: {cursor}")
+
+    def get_changes(self, after: int, limit: int):
+        """
+        Returns the first changed registrations and tombstones after the
+        cursor, at most limit together, ordered by their change sequence.
+        """
+        changes = list(
+            UserData.objects.filter(change_seq__gt=after)
+            .order_by("change_seq")
+            .values(*RegistrationsApiView.FIELDS, "change_seq")[:limit]
+        )
+        removals = list(
+            RemovedRegistration.objects.filter(change_seq__gt=after)
+            .order_by("change_seq")
+            .values("user_id", "reason", "change_seq")[:limit]
+        )
+        return sorted(changes + removals, key=lambda row: row["change_seq"])[:limit]
+
+    async def wait_for_changes(self, after: int, limit: int, wait: int):
+        deadline = time.monotonic() + wait
+        async with events.broadcaster.subscribe(events.CHANGES_CHANNEL) as queue:
+            # the changes committed before subscribing are found by the query
+            while not (changes := await sync_to_async(self.get_changes)(after, limit)):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        queue.get(), min(timeout, self.RECHECK_SECONDS)
+                    )
+        return changes
+
+    def get_int_parameter(self, name: str, default: int, maximum: int):
+        try:
+            value = int(self.request.GET.get(name, default))
+        except ValueError:
+            raise BadRequest(f"Invalid {name}")
+        return max(0, min(value, maximum))
+
+    async def get(self, request: HttpRequest, *args, **kwargs):
+        is_admin = await sync_to_async(
+            lambda: request.user.is_authenticated and request.user.is_admin
+        )()
+        if not is_admin:
+            raise PermissionDenied()
+        cursor = request.GET.get("cursor")
+        after = 0 if cursor is None else self.decode_cursor(cursor)
+        limit = max(
+            1, self.get_int_parameter("limit", self.DEFAULT_LIMIT, self.MAX_LIMIT)
+        )
+        wait = self.get_int_parameter("wait", 0, self.MAX_WAIT_SECONDS)
+        if wait > 0 and not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {"error": "Waiting for changes needs an ASGI server."}, status=501
+            )
+        changes = await sync_to_async(self.get_changes)(after, limit)
+        if not changes and wait > 0:
+            changes = await self.wait_for_changes(after, limit, wait)
+        results = []
+        removed = []
+        for change in changes:
+            after = change.pop("change_seq")
+            (removed if "reason" in change else results).append(change)
+        return JsonResponse(
+            {
+                "results": results,
+                "removed": removed,
+                "cursor": self.encode_cursor(after),
+                "has_more": len(changes) == limit,
+            }
+        )
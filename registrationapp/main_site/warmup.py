@@ -0,0 +1,82 @@
+"""
+Warm-up of a new worker process. Without it, the first requests of every
+worker pay for populating the URL resolver, compiling the templates,
+constructing the forms and connecting to the database.
+"""
+
+import logging
+import time
+from pathlib import Path
+from django.apps import apps
+from django.contrib.auth import forms as auth_forms
+from django.db import connections
+from django.template import engines
+from django.template.loader import get_template
+from django.urls import URLPattern, resolve, reverse
+from . import forms, urls
+
+logger = logging.getLogger()
+
+FORM_CLASSES = [
+    auth_forms.AuthenticationForm,
+    forms.VisitorRegistrationForm,
+    forms.ClientRegistrationForm,
+    forms.VisitorProfileEditForm,
+    forms.ClientProfileEditForm,
+    forms.VisitorEditForm,
+    forms.ClientEditForm,
+]
+
+
+def warm_up_urls():
+    """Reverses and resolves every named route of main_site."""
+    for pattern in urls.urlpatterns:
+        if isinstance(pattern, URLPattern) and pattern.name:
+            kwargs = {name: 1 for name in pattern.pattern.converters}
+            resolve(reverse(pattern.name, kwargs=kwargs))
+
+
+def warm_up_templates():
+    """Compiles the page and email templates into the cached template loader."""
+    template_dir = Path(apps.get_app_config("main_site").path) / "templates"
+    for path in sorted(template_dir.rglob("*")):
+        if path.is_file():
+            get_template(path.relative_to(template_dir).as_posix())
+
+
+def warm_up_database():
+    """Connects to the databases. Pooled connections are returned to the pool."""
+    for connection in connections.all():
+        connection.ensure_connection()
+        connection.close()
+
+
+def warm_up_forms():
+    """
+    Constructs and renders the forms like the pages do, which loads the
+    bootstrap renderers and the widget templates.
+    """
+    template = engines["django"].from_string(
+        "{% load bootstrap5 %}{% bootstrap_form form %}"
+    )
+    for form_class in FORM_CLASSES:
+        template.render({"form": form_class()})
+
+
+def warm_up():
+    """
+    Runs the warm-up stages. A failing stage is logged, but does not prevent
+    the worker from starting.
+    """
+    # the forms query the database, so their connection is closed afterwards
+    for stage in [warm_up_urls, warm_up_templates, warm_up_forms, warm_up_database]:
+        start = time.perf_counter()
+        try:
+            stage()
+        except Exception:
+            logger.exception(f"Worker warm-up stage {stage.__name__} failed")
+        else:
+            logger.info(
+                f"Worker warm-up stage {stage.__name__} took "
+                f"{(time.perf_counter() - start) * 1000:.1f} ms"
+            )
@@ -0,0 +1,152 @@
+"""
+PostgreSQL database backend that serves connections from a psycopg_pool
+connection pool instead of opening a new connection for every request.
+
+The pool is configured with the "pool" key of the database OPTIONS, which is
+passed to psycopg_pool.ConnectionPool (e.g. min_size, max_size, timeout).
+When CONN_HEALTH_CHECKS is enabled, connections are checked on checkout.
+"""
+
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as BaseCreation
+from django.db.backends.base.base import NO_DB_ALIAS
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError as e:
+    raise ImproperlyConfigured(
+        f"Error loading psycopg_pool module. Did you install psycopg[pool]? {e}"
+    )
+
+
+# The pools are shared by all threads of a worker process, one for each alias.
+_connection_pools: dict[str, ConnectionPool] = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_pool_stats():
+    """
+    Returns the statistics of the connection pools of this process by alias.
+    Besides the psycopg_pool statistics, "saturation" is the ratio of
+    connections in use to the maximum pool size, and "requests_wait_ms_avg"
+    is the average time a checkout spent waiting for a free connection.
+    """
+    result = {}
+    for alias, pool in list(_connection_pools.items()):
+        stats = pool.get_stats()
+        in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+        queued = stats.get("requests_queued", 0)
+        stats["connections_in_use"] = in_use
+        stats["saturation"] = in_use / pool.max_size if pool.max_size else 0.0
+        stats["requests_wait_ms_avg"] = (
+            stats.get("requests_wait_ms", 0) / queued if queued else 0.0
+        )
+        result[alias] = stats
+    return result
+
+
+def close_pools():
+    """Closes all connection pools of this process."""
+    with _connection_pools_lock:
+        for pool in _connection_pools.values():
+            pool.close()
+        _connection_pools.clear()
+
+
+class DatabaseCreation(BaseCreation):
+    def create_test_db(self, *args, **kwargs):
+        # The pool would still hand out connections to the non-test database.
+        self.connection.close_pool()
+        return super().create_test_db(*args, **kwargs)
+
+    def destroy_test_db(self, *args, **kwargs):
+        self.connection.close_pool()
+        return super().destroy_test_db(*args, **kwargs)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        """
+        Returns the connection pool of this database alias,
+        or None if pooling is disabled.
+        """
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+        pool = _connection_pools.get(self.alias)
+        if pool is not None:
+            return pool
+        if self.settings_dict["CONN_MAX_AGE"] != 0:
+            raise ImproperlyConfigured(
+                "Connection pooling can not be used with persistent connections."
+            )
+        if pool_options is True:
+            pool_options = {}
+        connect_kwargs = self.get_connection_params()
+        # Django sets the autocommit mode on checkout.
+        connect_kwargs["autocommit"] = True
+        with _connection_pools_lock:
+            if self.alias not in _connection_pools:
+                _connection_pools[self.alias] = ConnectionPool(
+                    kwargs=connect_kwargs,
+                    # The pool is opened lazily, so forked workers
+                    # do not share the connections of their parent.
+                    open=False,
+                    check=(
+                        ConnectionPool.check_connection
+                        if self.settings_dict["CONN_HEALTH_CHECKS"]
+                        else None
+                    ),
+                    name=self.alias,
+                    **pool_options,
+                )
+            return _connection_pools[self.alias]
+
+    def close_pool(self):
+        with _connection_pools_lock:
+            pool = _connection_pools.pop(self.alias, None)
+        if pool is not None:
+            pool.close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        # Read the isolation level the same way as the default backend.
+        isolation_level_value = self.settings_dict["OPTIONS"].get("isolation_level")
+        self.isolation_level = base.IsolationLevel.READ_COMMITTED
+        if isolation_level_value is not None:
+            try:
+                self.isolation_level = base.IsolationLevel(isolation_level_value)
+            except ValueError:
+                raise ImproperlyConfigured(
+                    f"Invalid transaction isolation level {isolation_level_value} "
+                    f"specified. Use one of the psycopg.IsolationLevel values."
+                )
+        pool.open()
+        connection = pool.getconn()
+        if isolation_level_value is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Return the connection to the pool instead of closing it.
+            # A connection left in a transaction is rolled back by the pool.
+            pool.putconn(self.connection)
+            # The connection can no longer be used by this wrapper.
+            self.connection = None
@@ -10,16 +10,34 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 
 
 def get_secret(filename):
     """
-    Returns a Docker secret value from the /run/secrets folder.
+    Returns a Docker secret value from the /run/secrets folder, or from the
+    environment variable of the same name if it is set (e.g. by
+    settings_test.py, which runs without Docker).
     """
+    if filename in os.environ:
+        return os.environ[filename]
     with open(f"/run/secrets/{filename}") as file:
         return file.read()
 
 
+def get_rate_limit(name, default):
+    """
+    Returns a rate limit from an environment variable in the
+    "<bucket size>/<refilled tokens per minute>" format.
+    """
+    bucket_size, refill_per_minute = os.environ.get(name, default).split("/")
+    if float(refill_per_minute) <= 0:
+        raise ImproperlyConfigured(
+            f"The refilled tokens per minute of {name} must be positive."
+        )
+    return (int(bucket_size), float(refill_per_minute))
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +72,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "main_site.middleware.ProfilingMiddleware",
+    "main_site.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -82,23 +102,92 @@ WSGI_APPLICATION = "registrationapp.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connections are served from a per-process psycopg_pool connection pool.
+# Setting POSTGRES_POOL_MAX_SIZE to 0 disables pooling.
+
+POSTGRES_POOL_MIN_SIZE = int(os.environ.get("POSTGRES_POOL_MIN_SIZE", 2))
+POSTGRES_POOL_MAX_SIZE = int(os.environ.get("POSTGRES_POOL_MAX_SIZE", 10))
+POSTGRES_POOL_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", 30))
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "registrationapp.pooled_postgresql",
         "NAME": os.environ.get("POSTGRES_NAME"),
         "USER": os.environ.get("POSTGRES_USER"),
         "PASSWORD": get_secret("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST"),
         "PORT": int(os.environ.get("POSTGRES_PORT")),
+        # checks pooled connections on checkout
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "pool": POSTGRES_POOL_MAX_SIZE > 0
+            and {
+                "min_size": min(POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE),
+                "max_size": POSTGRES_POOL_MAX_SIZE,
+                "timeout": POSTGRES_POOL_TIMEOUT,
+            },
+        },
     }
 }
 
+# An optional read replica. The admin list and details and the profile views
+# read from it, except for sessions that have written to the primary in the
+# last PRIMARY_PIN_SECONDS.
+
+REPLICA_DATABASE_ALIAS = "replica"
+PRIMARY_PIN_SECONDS = int(os.environ.get("PRIMARY_PIN_SECONDS", 10))
+
+if os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("POSTGRES_REPLICA_NAME", DATABASES["default"]["NAME"]),
+        "HOST": os.environ.get("POSTGRES_REPLICA_HOST"),
+        "PORT": int(
+            os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"])
+        ),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+    }
+
+DATABASE_ROUTERS = ["main_site.db_routers.PrimaryReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# The cache is shared by all workers when REDIS_URL is set.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
 AUTH_USER_MODEL = "main_site.User"
 
+# UserBackend loads the user with its registration data in one query. The
+# sessions store the backend of their login, so ModelBackend stays listed for
+# the sessions logged in before UserBackend was added.
+AUTHENTICATION_BACKENDS = [
+    "main_site.backends.UserBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
+# The logged in users are cached for this many seconds (0: not cached).
+# Changes made by queryset updates (e.g. in the database directly) are seen
+# by the user after this time.
+AUTH_USER_CACHE_SECONDS = int(os.environ.get("AUTH_USER_CACHE_SECONDS", 0))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -143,6 +232,31 @@ EMAIL_HOST = os.environ.get("EMAIL_HOST")
 EMAIL_PORT = int(os.environ.get("EMAIL_PORT"))
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL")
 
+# The base URL of the site for links in emails
+SITE_URL = os.environ.get("SITE_URL", "http://localhost:8000")
+
+# The registration state change emails are sent this many seconds after the
+# first change, with the final state, by the send_pending_notifications
+# command. 0 sends them immediately.
+NOTIFICATION_COALESCE_SECONDS = int(
+    os.environ.get("NOTIFICATION_COALESCE_SECONDS", 60)
+)
+
+# The admin digest contains the registrations that became pending at least
+# this many seconds ago, so registrations saved in still running
+# transactions are not skipped.
+ADMIN_DIGEST_DELAY_SECONDS = 60
+
+# The rollup of the registration transitions also recomputes the days of the
+# transitions logged this many seconds before its previous run, so the
+# transitions committed after the run by transactions running at that time
+# are not skipped. Longer transactions are not expected.
+TRANSITION_ROLLUP_RECHECK_SECONDS = 3600
+
+# The "review next" function of the admins claims a registration for this
+# many seconds. Other admins are not given the registration in this time.
+REVIEW_CLAIM_LEASE_SECONDS = 15 * 60
+
 # Paths
 
 LOGIN_URL = "/login/"
@@ -155,3 +269,60 @@ ORCID_PUBLIC_API_URL = os.environ.get("ORCID_PUBLIC_API_URL")
 ORCID_CLIENT_ID = os.environ.get("ORCID_CLIENT_ID")
 ORCID_REDIRECT_URI = os.environ.get("ORCID_REDIRECT_URI")
 ORCID_CLIENT_SECRET = get_secret("REGISTRATIONAPP_ORCID_CLIENT_SECRET")
+ORCID_REQUEST_TIMEOUT_SECONDS = 10
+# requests per second of the refresh_orcid_data command, below the quota of
+# the public ORCID API (24 requests per second)
+ORCID_REFRESH_RATE = float(os.environ.get("ORCID_REFRESH_RATE", 8))
+
+# Rate limits of the login and registration POST requests by client IP and
+# by submitted email address. See main_site/ratelimit.py.
+
+RATE_LIMITS = {
+    "login": {
+        "ip": get_rate_limit("RATE_LIMIT_LOGIN_IP", "20/10"),
+        "email": get_rate_limit("RATE_LIMIT_LOGIN_EMAIL", "5/1"),
+    },
+    "register": {
+        "ip": get_rate_limit("RATE_LIMIT_REGISTER_IP", "10/2"),
+        "email": get_rate_limit("RATE_LIMIT_REGISTER_EMAIL", "3/1"),
+    },
+    "validate_field": {
+        "ip": get_rate_limit("RATE_LIMIT_VALIDATE_FIELD_IP", "60/60"),
+    },
+}
+# the request.META key of the client IP, e.g. HTTP_X_REAL_IP behind a proxy
+RATE_LIMIT_IP_META_KEY = os.environ.get("RATE_LIMIT_IP_META_KEY", "REMOTE_ADDR")
+
+# The archive_registrations command archives the registrations
+# approved or rejected at least this many days ago.
+ARCHIVE_REGISTRATIONS_AFTER_DAYS = int(
+    os.environ.get("ARCHIVE_REGISTRATIONS_AFTER_DAYS", 365)
+)
+
+# Seconds for which the pages of anonymous visitors (home, login and
+# registration pages) are cached. 0 disables the page cache.
+ANONYMOUS_PAGE_CACHE_SECONDS = int(os.environ.get("ANONYMOUS_PAGE_CACHE_SECONDS", 60))
+
+# The calling code of the phone numbers given without an international prefix,
+# e.g. "44", for the duplicate registration detection
+PHONE_DEFAULT_CALLING_CODE = os.environ.get("PHONE_DEFAULT_CALLING_CODE", "")
+
+# Metrics
+
+# every worker process writes its metrics into this folder
+METRICS_DIR = os.environ.get("METRICS_DIR", "/tmp/registrationapp-metrics")
+# optional Bearer token for scraping /metrics/ without an admin login
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Profiling
+
+# the profiles of the profiled requests are written into this folder,
+# an empty value disables profiling
+PROFILING_DIR = os.environ.get("PROFILING_DIR", "/tmp/registrationapp-profiles")
+# the oldest profiles are deleted when the folder has more files
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", 100))
+# probability of profiling a request without a profiling token, e.g. 0.001
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_INTERVAL_SECONDS = 0.005
+# seconds for which the tokens of the create_profiling_token command are valid
+PROFILING_TOKEN_MAX_AGE = 60 * 60
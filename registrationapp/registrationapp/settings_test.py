@@ -0,0 +1,36 @@
+"""
+Settings for running the tests and benchmarks without Docker and its
+secrets, on a local PostgreSQL server. The POSTGRES_* environment variables
+select the database as in settings.py; by default, the "registrationapp"
+database of the local server is used with the name of the OS user.
+
+Usage (in the folder of manage.py):
+    export DJANGO_SETTINGS_MODULE=registrationapp.settings_test
+    python manage.py test
+    python manage.py generate_registrations --count 1000000
+"""
+
+import os
+
+# the Docker secrets and the environment of docker-compose.yml
+for name, value in {
+    "REGISTRATIONAPP_DJANGO_SECRET_KEY": "insecure-test-secret-key",
+    "REGISTRATIONAPP_ORCID_CLIENT_SECRET": "",
+    "POSTGRES_PASSWORD": "",
+    "POSTGRES_NAME": "registrationapp",
+    "POSTGRES_HOST": "",
+    "POSTGRES_PORT": "5432",
+    "EMAIL_HOST": "localhost",
+    "EMAIL_PORT": "1025",
+    "DEFAULT_FROM_EMAIL": "noreply@localhost",
+    "ORCID_URL": "https://sandbox.orcid.org",
+    "ORCID_PUBLIC_API_URL": "https://pub.sandbox.orcid.org",
+    "ORCID_CLIENT_ID": "",
+    "ORCID_REDIRECT_URI": "http://localhost:8000/register-orcid",
+}.items():
+    os.environ.setdefault(name, value)
+
+from .settings import *  # noqa: E402,F401,F403
+
+# fast hashing of the test passwords
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]